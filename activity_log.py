@@ -0,0 +1,316 @@
+"""Append-only log of raw activity, for recomputing sessions after the fact.
+
+Sessions are cut with the idle threshold in effect when they closed; the log
+keeps the activity underneath at 100 ms resolution, so history can be
+re-sessionized for any other threshold. With ACTIVITY_LOG_ENABLED the tracker
+appends to ACTIVITY_LOG_DIR/YYYY-MM-DD.log (local day) as each session closes,
+one write per session, and deletes the files older than
+ACTIVITY_LOG_RETENTION_DAYS when it starts a new one.
+
+Every record is a little-endian uint32 describing a run of consecutive active
+100 ms slots of one input type:
+
+    bits  0-19   first slot, counted from local midnight (a 25-hour day fits)
+    bits 20-30   run length - 1 (runs longer than 2048 slots are split)
+    bit  31      0 mouse, 1 keyboard
+
+Each type's sessions close one after the other, so within a file the records
+of a type are in time order. A record cut short by a crash is ignored.
+
+    python activity_log.py --threshold 10                 # what-if, per day
+    python activity_log.py --threshold 10 --from 2026-10-01 --apply
+"""
+import os
+import sys
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+
+import db
+from config import (
+    ACTIVITY_LOG_DIR, ACTIVITY_LOG_RETENTION_DAYS, COLLECTOR_URL, MIN_SESSION_DURATION,
+    STORAGE_BACKEND,
+)
+
+SLOTS_PER_SECOND = 10
+TYPES = ("mouse", "keyboard")
+_SLOT_BITS = 20
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+_MAX_RUN = 1 << 11
+_LEN_MASK = _MAX_RUN - 1
+
+
+def _log_path(day, log_dir=ACTIVITY_LOG_DIR):
+    return os.path.join(log_dir, f"{day}.log")
+
+
+def _day_bounds(slot):
+    """(day, first slot, end slot) of the local day holding epoch slot ``slot``."""
+    day = date.fromtimestamp(slot / SLOTS_PER_SECOND)
+    midnight = datetime(day.year, day.month, day.day)
+    return (
+        day.isoformat(),
+        round(midnight.timestamp() * SLOTS_PER_SECOND),
+        round((midnight + timedelta(days=1)).timestamp() * SLOTS_PER_SECOND),
+    )
+
+
+def _runs(slots):
+    """(first, length) runs of an array of increasing slots."""
+    first = prev = None
+    for slot in slots:
+        if prev is not None and slot <= prev + 1:
+            # A repeat can slip in when two listener threads race
+            prev = max(prev, slot)
+            continue
+        if first is not None:
+            yield first, prev - first + 1
+        first = prev = slot
+    if first is not None:
+        yield first, prev - first + 1
+
+
+class ActivityLog:
+    """Appends the active slots of closed sessions to the day files."""
+
+    def __init__(self, log_dir=ACTIVITY_LOG_DIR, retention_days=ACTIVITY_LOG_RETENTION_DAYS):
+        self.log_dir = log_dir
+        self.retention_days = retention_days
+        self.records_written = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._bounds = (None, 0, 0)
+
+    def append(self, session_type, slots, wall_offset):
+        """Log one session: ``slots`` are the monotonic slots it was active in
+        (int(monotonic * SLOTS_PER_SECOND)), ``wall_offset`` time.time() - time.monotonic()."""
+        if not slots:
+            return
+        shift = round(wall_offset * SLOTS_PER_SECOND)
+        type_bit = TYPES.index(session_type) << 31
+        with self._lock:
+            out = array("I")
+            for first, length in _runs(slots):
+                first += shift
+                while length:
+                    day, start, end = self._bounds
+                    if not start <= first < end:
+                        self._write(out)
+                        out = array("I")
+                        self._open(_day_bounds(first))
+                        day, start, end = self._bounds
+                    n = min(length, _MAX_RUN, end - first)
+                    out.append(type_bit | ((n - 1) << _SLOT_BITS) | (first - start))
+                    first += n
+                    length -= n
+            self._write(out)
+
+    def _open(self, bounds):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._file = open(_log_path(bounds[0], self.log_dir), "ab")
+        self._bounds = bounds
+        if self.retention_days > 0:
+            last = date.fromisoformat(bounds[0]) - timedelta(days=self.retention_days + 1)
+            for day in logged_days(end_date=last.isoformat(), log_dir=self.log_dir):
+                try:
+                    os.remove(_log_path(day, self.log_dir))
+                except OSError:
+                    pass
+
+    def _write(self, records):
+        if not records:
+            return
+        if sys.byteorder == "big":
+            records.byteswap()
+        self._file.write(records.tobytes())
+        self._file.flush()
+        self.records_written += len(records)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._bounds = (None, 0, 0)
+
+
+# --- Reading and re-sessionizing ---
+
+def logged_days(start_date=None, end_date=None, log_dir=ACTIVITY_LOG_DIR) -> list[str]:
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return []
+    days = sorted(n[:-4] for n in names if len(n) == 14 and n.endswith(".log"))
+    return [d for d in days if (not start_date or d >= start_date) and (not end_date or d <= end_date)]
+
+
+def _read(day, log_dir=ACTIVITY_LOG_DIR):
+    records = array("I")
+    with open(_log_path(day, log_dir), "rb") as f:
+        data = f.read()
+    records.frombytes(data[:len(data) - len(data) % records.itemsize])
+    if sys.byteorder == "big":
+        records.byteswap()
+    return records
+
+
+def resessionize(threshold, start_date=None, end_date=None, log_dir=ACTIVITY_LOG_DIR):
+    """Yield (type, start_ts, end_ts) sessions cut at ``threshold`` idle seconds.
+
+    One pass over the day files in order: a session ends where the next
+    active slot of its type starts more than ``threshold`` after the last one.
+    Slots are floored, so a gap of exactly ``threshold`` in slots may have
+    been a little shorter or longer; it is kept in the session, as the
+    tracker does when its idle check runs late. Like the tracker, a session
+    spans from its first to its last active slot.
+    Sessions shorter than MIN_SESSION_DURATION are dropped.
+    """
+    gap = max(1, round(threshold * SLOTS_PER_SECOND))
+    min_slots = MIN_SESSION_DURATION * SLOTS_PER_SECOND
+    # Per type: [first slot, last active slot] of the session being built
+    current = [None, None]
+    for day in logged_days(start_date, end_date, log_dir):
+        base = _day_bounds(
+            round(datetime.fromisoformat(day).timestamp() * SLOTS_PER_SECOND)
+        )[1]
+        for record in _read(day, log_dir):
+            t = record >> 31
+            first = base + (record & _SLOT_MASK)
+            last = first + ((record >> _SLOT_BITS) & _LEN_MASK)
+            session = current[t]
+            if session is None:
+                current[t] = [first, last]
+            elif first - session[1] > gap:
+                if session[1] - session[0] >= min_slots:
+                    yield TYPES[t], session[0] / SLOTS_PER_SECOND, session[1] / SLOTS_PER_SECOND
+                current[t] = [first, last]
+            elif last > session[1]:
+                session[1] = last
+    for t, session in enumerate(current):
+        if session is not None and session[1] - session[0] >= min_slots:
+            yield TYPES[t], session[0] / SLOTS_PER_SECOND, session[1] / SLOTS_PER_SECOND
+
+
+def _covered_from(days, log_dir=ACTIVITY_LOG_DIR) -> dict:
+    """{day: epoch of its first logged slot}: the log may start mid-day."""
+    covered = {}
+    for day in days:
+        records = _read(day, log_dir)
+        if records:
+            base = _day_bounds(
+                round(datetime.fromisoformat(day).timestamp() * SLOTS_PER_SECOND)
+            )[1]
+            first = min(r & _SLOT_MASK for r in records)
+            covered[day] = (base + first) / SLOTS_PER_SECOND
+    return covered
+
+
+def what_if(threshold, start_date=None, end_date=None, log_dir=ACTIVITY_LOG_DIR) -> dict:
+    """{day: {type: {"sessions", "total_duration"}}} of the recomputed sessions."""
+    days = {}
+    for session_type, start_ts, end_ts in resessionize(threshold, start_date, end_date, log_dir):
+        day = datetime.fromtimestamp(start_ts).date().isoformat()
+        stats = days.setdefault(day, {}).setdefault(
+            session_type, {"sessions": 0, "total_duration": 0.0}
+        )
+        stats["sessions"] += 1
+        stats["total_duration"] += end_ts - start_ts
+    return days
+
+
+def apply(threshold, start_date=None, end_date=None, log_dir=ACTIVITY_LOG_DIR) -> dict:
+    """Replace the local sessions of the logged days with ones cut at ``threshold``.
+
+    Only sessions from the first logged slot of each day on are replaced, so
+    history from before the log existed stays as it is. Sessions received
+    from other machines (collector.py) are left alone.
+
+    Refused when sessions are pushed to a collector: the new rows get new
+    ids, so they would be pushed again on top of the ones they replace.
+    """
+    if STORAGE_BACKEND == "bitmap":
+        raise RuntimeError("the bitmap backend stores no sessions")
+    if COLLECTOR_URL:
+        raise RuntimeError("sessions are pushed to a collector (COLLECTOR_URL); "
+                           "rewriting them would count them twice there")
+    days = logged_days(start_date, end_date, log_dir)
+    covered = _covered_from(days, log_dir)
+    rows = [
+        row for row in (
+            db._session_row(datetime.fromtimestamp(start_ts), datetime.fromtimestamp(end_ts), t)
+            for t, start_ts, end_ts in resessionize(threshold, start_date, end_date, log_dir)
+        )
+        if row is not None and row[4] in covered
+    ]
+    conn = db._get_conn()
+    removed = 0
+    try:
+        with conn:
+            shards = {}
+            for day, since in covered.items():
+                shard = shards[day[:7]] = conn.shard(day)
+                removed += shard.execute(
+                    "DELETE FROM sessions WHERE day = ? AND host = '' AND start_ts >= ?",
+                    (day, since),
+                ).rowcount
+            for row in rows:
+                shards[row[4][:7]].execute(
+                    "INSERT INTO sessions (type, start_time, end_time, duration, day, "
+                    "start_ts, end_ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+            for shard in shards.values():
+                db._rebuild_shard(shard)
+            db._mark_changed(conn, history=True)
+    finally:
+        conn.close()
+    return {"days": len(covered), "removed": removed, "inserted": len(rows)}
+
+
+def _stored(days) -> dict:
+    stored = {}
+    for day in days:
+        for session_type in TYPES:
+            summary = db.get_summary_for_date(day, session_type)
+            stored.setdefault(day, {})[session_type] = summary
+    return stored
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import config
+
+    parser = argparse.ArgumentParser(description="Recompute sessions from the activity log.")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="idle threshold in seconds (default: the current setting)")
+    parser.add_argument("--from", dest="start_date")
+    parser.add_argument("--to", dest="end_date")
+    parser.add_argument("--apply", action="store_true",
+                        help="rewrite the sessions of the logged days")
+    args = parser.parse_args()
+    threshold = args.threshold
+    if threshold is None:
+        threshold = config.load_settings()["idle_threshold"]
+    db.init_db()
+    if args.apply:
+        try:
+            result = apply(threshold, args.start_date, args.end_date)
+        except RuntimeError as e:
+            sys.exit(f"--apply: {e}")
+        print(f"{result['days']} days: {result['removed']} sessions replaced "
+              f"by {result['inserted']} (threshold {threshold}s).")
+        sys.exit(0)
+    recomputed = what_if(threshold, args.start_date, args.end_date)
+    stored = _stored(logged_days(args.start_date, args.end_date))
+    print(f"{'day':<12}{'type':<10}{'sessions now':>14}{f'at {threshold}s':>14}"
+          f"{'total now':>12}{f'at {threshold}s':>14}")
+    for day in sorted(stored):
+        for session_type in TYPES:
+            now = stored[day][session_type]
+            new = recomputed.get(day, {}).get(session_type, {"sessions": 0, "total_duration": 0})
+            print(f"{day:<12}{session_type:<10}{now['session_count']:>14}{new['sessions']:>14}"
+                  f"{now['total_duration'] / 3600:>11.2f}h{new['total_duration'] / 3600:>13.2f}h")
@@ -0,0 +1,277 @@
+"""Long-range statistics over session start/end times held in numeric arrays.
+
+Sessions of a range are loaded once into two float arrays of epoch seconds
+(NumPy when installed, ``array('d')`` otherwise) and every statistic is
+computed from those: interval merging, mouse/keyboard overlap, hour-of-week
+heatmaps, session-length percentiles and rolling daily averages.
+"""
+from array import array
+from datetime import date, datetime, timedelta
+
+import db
+from config import STORAGE_BACKEND
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback below
+    np = None
+
+# 1970-01-01 was a Thursday; (local_day + 3) % 7 gives Monday = 0
+_EPOCH_WEEKDAY = 3
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Spans:
+    """Start/end epoch seconds of a set of sessions, sorted by start.
+
+    ``local_starts`` / ``local_ends`` are the same instants shifted by the local
+    UTC offset of the session's day, so day and hour boundaries fall on whole
+    multiples of 86400 and 3600.
+    """
+
+    def __init__(self, starts, ends, offsets):
+        if np is not None:
+            self.starts = np.frombuffer(starts, dtype=np.float64)
+            self.ends = np.frombuffer(ends, dtype=np.float64)
+            offsets = np.frombuffer(offsets, dtype=np.float64)
+            self.local_starts = self.starts + offsets
+            self.local_ends = self.ends + offsets
+        else:
+            self.starts, self.ends = starts, ends
+            self.local_starts = array("d", (s + o for s, o in zip(starts, offsets)))
+            self.local_ends = array("d", (e + o for e, o in zip(ends, offsets)))
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _utc_offset(day):
+    midnight = datetime.fromisoformat(day)
+    return (midnight - datetime(1970, 1, 1)).total_seconds() - midnight.timestamp()
+
+
+def load_spans(start_date: str, end_date: str, session_type: str = None) -> Spans:
+    """Load one range into Spans. ``session_type`` 'any' or None loads both types."""
+    starts, ends, offsets = array("d"), array("d"), array("d")
+    day_offsets = {}
+    if session_type == db.CUMULATIVE:
+        session_type = None
+    if STORAGE_BACKEND == "bitmap":
+        rows = (
+            (s["start_time"][:10],
+             datetime.fromisoformat(s["start_time"]).timestamp(),
+             datetime.fromisoformat(s["end_time"]).timestamp())
+            for s in db.get_sessions_for_range(start_date, end_date, session_type)
+        )
+        rows = sorted(rows, key=lambda r: r[1])
+    else:
+        conn = db._get_conn(readonly=True)
+        sql = "SELECT day, start_ts, end_ts, parts FROM sessions WHERE day >= ? AND day <= ? "
+        params = [start_date, end_date]
+        if session_type:
+            sql += "AND type = ? "
+            params.append(session_type)
+        # Shards are in month order, so start order holds across them
+        rows = []
+        expanded = False
+        for shard in conn.shards(start_date, end_date):
+            for day, start_ts, end_ts, parts in shard.execute(sql + "ORDER BY start_ts", params):
+                if parts is None:
+                    rows.append((day, start_ts, end_ts))
+                    continue
+                # A row merged by compaction: its members, not the gaps between them
+                expanded = True
+                rows.extend((day, s, e) for s, e in db._row_spans(start_ts, end_ts, parts))
+        conn.close()
+        if expanded:
+            rows.sort(key=lambda r: r[1])
+    for day, start_ts, end_ts in rows:
+        offset = day_offsets.get(day)
+        if offset is None:
+            offset = day_offsets[day] = _utc_offset(day)
+        starts.append(start_ts)
+        ends.append(end_ts)
+        offsets.append(offset)
+    return Spans(starts, ends, offsets)
+
+
+# --- Core operations ---
+
+def merge(starts, ends):
+    """Merge start-sorted intervals; returns (starts, ends) of the union."""
+    if len(starts) == 0:
+        return starts[:0], ends[:0]
+    if np is not None:
+        reach = np.maximum.accumulate(ends)
+        breaks = np.flatnonzero(starts[1:] > reach[:-1]) + 1
+        first = np.concatenate(([0], breaks))
+        last = np.concatenate((breaks - 1, [len(starts) - 1]))
+        return starts[first], reach[last]
+    m_starts, m_ends = array("d", [starts[0]]), array("d", [ends[0]])
+    for s, e in zip(starts, ends):
+        if s <= m_ends[-1]:
+            if e > m_ends[-1]:
+                m_ends[-1] = e
+        else:
+            m_starts.append(s)
+            m_ends.append(e)
+    return m_starts, m_ends
+
+
+def _total(starts, ends):
+    if np is not None:
+        return float(np.sum(ends - starts))
+    return sum(e - s for s, e in zip(starts, ends))
+
+
+def _sorted_union(a: Spans, b: Spans):
+    if np is not None:
+        starts = np.concatenate((a.starts, b.starts))
+        ends = np.concatenate((a.ends, b.ends))
+        order = np.argsort(starts, kind="stable")
+        return starts[order], ends[order]
+    pairs = sorted(zip(list(a.starts) + list(b.starts), list(a.ends) + list(b.ends)))
+    return array("d", (p[0] for p in pairs)), array("d", (p[1] for p in pairs))
+
+
+def overlap_summary(mouse: Spans, keyboard: Spans) -> dict:
+    """Active seconds of mouse, keyboard, either (cumulative) and both (overlap)."""
+    mouse_total = _total(*merge(mouse.starts, mouse.ends))
+    keyboard_total = _total(*merge(keyboard.starts, keyboard.ends))
+    either = _total(*merge(*_sorted_union(mouse, keyboard)))
+    return {
+        "mouse": round(mouse_total, 2),
+        "keyboard": round(keyboard_total, 2),
+        "cumulative": round(either, 2),
+        "overlap": round(mouse_total + keyboard_total - either, 2),
+    }
+
+
+def hour_of_week_histogram(spans: Spans) -> list[list[float]]:
+    """Active seconds per [weekday][hour] (Monday = 0), split across hour boundaries."""
+    starts, ends = spans.local_starts, spans.local_ends
+    if np is not None:
+        bins = np.zeros(7 * 24)
+        if len(starts):
+            first = np.floor(starts / 3600).astype(np.int64)
+            last = np.floor(np.maximum(ends - 1e-9, starts) / 3600).astype(np.int64)
+            # Seconds in each interval's first hour, last hour and any whole hours between
+            head = np.minimum(ends, (first + 1) * 3600.0) - starts
+            tail = np.where(last > first, ends - last * 3600.0, 0.0)
+            np.add.at(bins, _hour_of_week(first), head)
+            np.add.at(bins, _hour_of_week(last), tail)
+            middle = last - first - 1
+            if (middle > 0).any():
+                hours = np.repeat(first + 1, np.maximum(middle, 0))
+                hours += _ramp(np.maximum(middle, 0))
+                np.add.at(bins, _hour_of_week(hours), 3600.0)
+        return [[round(float(v), 2) for v in bins[d * 24:(d + 1) * 24]] for d in range(7)]
+
+    bins = [0.0] * (7 * 24)
+    for s, e in zip(starts, ends):
+        while s < e:
+            hour = int(s // 3600)
+            boundary = min(e, (hour + 1) * 3600.0)
+            bins[_hour_of_week(hour)] += boundary - s
+            s = boundary
+    return [[round(v, 2) for v in bins[d * 24:(d + 1) * 24]] for d in range(7)]
+
+
+def _hour_of_week(hours):
+    # hours since the local epoch -> weekday * 24 + hour
+    return ((hours // 24 + _EPOCH_WEEKDAY) % 7) * 24 + hours % 24
+
+
+def _ramp(counts):
+    """[0..c0-1, 0..c1-1, ...] for the np.repeat expansion above."""
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1]) - np.repeat(ends - counts, counts)
+
+
+def duration_percentiles(spans: Spans, percentiles=PERCENTILES) -> dict:
+    """Session-length percentiles (linear interpolation), plus count/mean/max."""
+    if len(spans) == 0:
+        return {"count": 0, "mean": 0, "max": 0, **{f"p{p}": 0 for p in percentiles}}
+    if np is not None:
+        durations = spans.ends - spans.starts
+        values = np.percentile(durations, percentiles)
+        result = {"count": int(durations.size), "mean": float(durations.mean()),
+                  "max": float(durations.max())}
+    else:
+        durations = sorted(e - s for s, e in zip(spans.starts, spans.ends))
+        values = [_percentile(durations, p) for p in percentiles]
+        result = {"count": len(durations), "mean": sum(durations) / len(durations),
+                  "max": durations[-1]}
+    result.update({f"p{p}": float(v) for p, v in zip(percentiles, values)})
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in result.items()}
+
+
+def _percentile(sorted_values, p):
+    pos = (len(sorted_values) - 1) * p / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def rolling_daily_totals(spans: Spans, start_date: str, end_date: str, window: int = 7) -> dict:
+    """Cumulative active seconds per day and their trailing ``window``-day mean."""
+    first_day = (date.fromisoformat(start_date) - date(1970, 1, 1)).days
+    # A reversed range has no days, as with every other range query
+    n_days = max((date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1, 0)
+    if n_days == 0:
+        return {"window": window, "days": [], "totals": [], "rolling": []}
+    local_starts, local_ends = merge(spans.local_starts, spans.local_ends)
+    if np is not None:
+        index = (np.floor(local_starts / 86400).astype(np.int64) - first_day).clip(0, n_days - 1)
+        totals = np.bincount(index, weights=local_ends - local_starts, minlength=n_days)
+        sums = np.cumsum(np.concatenate(([0.0], totals)))
+        lows = np.maximum(np.arange(1, n_days + 1) - window, 0)
+        counts = np.arange(1, n_days + 1) - lows
+        rolling = (sums[1:] - sums[lows]) / counts
+        totals, rolling = totals.tolist(), rolling.tolist()
+    else:
+        totals = [0.0] * n_days
+        for s, e in zip(local_starts, local_ends):
+            totals[min(max(int(s // 86400) - first_day, 0), n_days - 1)] += e - s
+        rolling, running = [], 0.0
+        for i, v in enumerate(totals):
+            running += v
+            if i >= window:
+                running -= totals[i - window]
+            rolling.append(running / min(i + 1, window))
+    days = [(date.fromisoformat(start_date) + timedelta(days=i)).isoformat() for i in range(n_days)]
+    return {
+        "window": window,
+        "days": days,
+        "totals": [round(v, 2) for v in totals],
+        "rolling": [round(v, 2) for v in rolling],
+    }
+
+
+# --- Range entry points used by the dashboard (cached like db.get_*) ---
+
+@db._cached
+def get_overlap(start_date: str, end_date: str) -> dict:
+    return overlap_summary(
+        load_spans(start_date, end_date, "mouse"), load_spans(start_date, end_date, "keyboard")
+    )
+
+
+@db._cached
+def get_heatmap(start_date: str, end_date: str, session_type: str = None) -> dict:
+    spans = load_spans(start_date, end_date, session_type)
+    if not session_type or session_type == db.CUMULATIVE:
+        starts, ends = merge(spans.local_starts, spans.local_ends)
+        spans.local_starts, spans.local_ends = starts, ends
+    return {"weekdays": ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"],
+            "seconds": hour_of_week_histogram(spans)}
+
+
+@db._cached
+def get_duration_percentiles(start_date: str, end_date: str, session_type: str = None) -> dict:
+    return duration_percentiles(load_spans(start_date, end_date, session_type))
+
+
+@db._cached
+def get_rolling_totals(start_date: str, end_date: str, window: int = 7) -> dict:
+    return rolling_daily_totals(load_spans(start_date, end_date), start_date, end_date, window)
@@ -0,0 +1,70 @@
+"""Compare analytics.py array operations with the per-row Python paths in db.py.
+
+Runs on synthetic in-memory sessions, no database needed:
+
+    python benchmarks/analytics_bench.py --sessions 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+import db  # noqa: E402
+
+
+def synthetic_spans(n, seed=1, start=1_700_000_000.0):
+    """n start-sorted sessions with exponential gaps and 0.5-120 s durations."""
+    rnd = random.Random(seed)
+    starts, ends = array("d"), array("d")
+    t = start
+    for _ in range(n):
+        t += rnd.expovariate(1 / 60)
+        starts.append(t)
+        ends.append(t + rnd.uniform(0.5, 120))
+    return analytics.Spans(starts, ends, array("d", bytes(8 * n)))
+
+
+def timed(label, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<34} {best * 1000:10.1f} ms")
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions, numpy: {'yes' if analytics.np is not None else 'no'}")
+    mouse = synthetic_spans(args.sessions, seed=1)
+    keyboard = synthetic_spans(args.sessions, seed=2)
+
+    tuples = [(s, e, None, None) for s, e in zip(mouse.starts, mouse.ends)]
+    merged_py, t_py = timed("merge (db._merge_spans)", lambda: db._merge_spans(tuples), args.repeat)
+    merged_vec, t_vec = timed("merge (analytics.merge)",
+                              lambda: analytics.merge(mouse.starts, mouse.ends), args.repeat)
+    assert len(merged_py) == len(merged_vec[0])
+    print(f"  {'speedup':<34} {t_py / t_vec:10.1f} x")
+
+    timed("overlap_summary", lambda: analytics.overlap_summary(mouse, keyboard), args.repeat)
+    timed("hour_of_week_histogram", lambda: analytics.hour_of_week_histogram(mouse), args.repeat)
+    timed("duration_percentiles", lambda: analytics.duration_percentiles(mouse), args.repeat)
+    span_days = int((mouse.ends[-1] - mouse.starts[0]) // 86400) + 1
+    first = time.strftime("%Y-%m-%d", time.gmtime(mouse.starts[0]))
+    last = time.strftime("%Y-%m-%d", time.gmtime(mouse.starts[0] + (span_days - 1) * 86400))
+    timed("rolling_daily_totals (7 days)",
+          lambda: analytics.rolling_daily_totals(mouse, first, last), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
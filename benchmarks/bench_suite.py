@@ -0,0 +1,262 @@
+"""Benchmark db.py and the dashboard routes against synthetic 1/3/5-year histories.
+
+    python benchmarks/bench_suite.py                         # 1, 3 and 5 years
+    python benchmarks/bench_suite.py --years 1 --repeat 10
+    python benchmarks/bench_suite.py --save-baseline         # store as the baseline
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json
+
+Datasets are generated once (benchmarks/history.py) and reused. Each one is
+measured in its own process, since db binds its paths at import. Reads are
+timed cold (query cache cleared before every call). Results are written as
+JSON; with a baseline, timings slower than --threshold times the baseline
+are reported and the exit status is 1.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import history
+
+DEFAULT_OUTPUT = os.path.join(history.ROOT, "benchmarks", "results.json")
+DEFAULT_BASELINE = os.path.join(history.ROOT, "benchmarks", "baseline.json")
+# Differences below this many milliseconds are noise, whatever the ratio
+NOISE_FLOOR_MS = 1.0
+# Endless event streams, not timed
+SKIP_ROUTES = {"/api/stream"}
+# Far-future month used for write benchmarks, removed afterwards
+SCRATCH_DAY = date(2099, 12, 1)
+
+
+def _timed(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "best_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+    }
+
+
+def _spans(end_day):
+    last = end_day - timedelta(days=1)
+    return {
+        "day": (last.isoformat(), last.isoformat()),
+        "week": ((last - timedelta(days=6)).isoformat(), last.isoformat()),
+        "month": ((last - timedelta(days=30)).isoformat(), last.isoformat()),
+        "year": ((last - timedelta(days=364)).isoformat(), last.isoformat()),
+    }
+
+
+def _bench_reads(db, spans, repeat):
+    results = {}
+    for name in sorted(n for n in dir(db) if n.startswith("get_")):
+        fn = getattr(db, name)
+        params = inspect.signature(fn).parameters
+        if "start_date" in params:
+            cases = {label: (start, end) for label, (start, end) in spans.items() if label != "day"}
+        elif "date_str" in params or any(p.kind is p.VAR_POSITIONAL for p in params.values()):
+            cases = {"day": (spans["day"][0],)}
+        else:
+            cases = {"": ()}
+        for label, args in cases.items():
+            key = f"db.{name}[{label}]" if label else f"db.{name}"
+            results[key] = _timed(lambda: fn(*args), repeat, setup=db.clear_cache)
+    return results
+
+
+def _bench_merge(db, spans, repeat):
+    start, end = spans["year"]
+    conn = db._get_conn(readonly=True)
+    rows = [
+        tuple(r) for shard in conn.shards(start, end)
+        for r in shard.execute(
+            "SELECT start_ts, end_ts, start_time, end_time FROM sessions "
+            "WHERE day >= ? AND day <= ? ORDER BY start_ts",
+            (start, end),
+        )
+    ]
+    conn.close()
+    return {f"db._merge_spans[{len(rows)} spans]": _timed(lambda: db._merge_spans(rows), repeat)}
+
+
+def _scratch_sessions(n):
+    t = datetime.combine(SCRATCH_DAY, datetime.min.time()) + timedelta(hours=8)
+    out = []
+    for i in range(n):
+        session_type = "mouse" if i % 3 else "keyboard"
+        out.append((t, t + timedelta(seconds=2 + i % 7), session_type))
+        t += timedelta(seconds=12)
+    return out
+
+
+def _drop_scratch_shard(db):
+    month = SCRATCH_DAY.isoformat()[:7]
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        path = db._shard_path(month) + suffix
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _bench_writes(db, n):
+    results = {}
+    sessions = _scratch_sessions(n)
+    db._local.__dict__.clear()
+
+    def sync():
+        for s in sessions:
+            db.save_session(*s)
+
+    def batched():
+        db.start_writer()
+        for s in sessions:
+            db.save_session(*s)
+        db.stop_writer()
+
+    for label, fn in (("sync", sync), ("writer", batched)):
+        _drop_scratch_shard(db)
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        results[f"db.save_session[{label}]"] = {
+            "sessions_per_s": round(n / elapsed, 1),
+            "median_ms": round(elapsed * 1000 / n, 4),
+        }
+    _drop_scratch_shard(db)
+    return results
+
+
+def _bench_routes(spans, repeat):
+    import db
+    from dashboard import app
+
+    client = app.test_client()
+    day = spans["day"][0]
+    start, end = spans["month"]
+    values = {"date_str": day, "start_date": start, "end_date": end}
+    results = {}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if rule.endpoint == "static" or "GET" not in rule.methods or rule.rule in SKIP_ROUTES:
+            continue
+        url = rule.rule
+        for arg in rule.arguments:
+            url = url.replace(f"<{arg}>", values[arg])
+
+        def get():
+            response = client.get(url)
+            response.get_data()  # drains streamed responses
+            assert response.status_code < 400, (url, response.status_code)
+
+        results[f"GET {rule.rule}"] = _timed(get, repeat, setup=db.clear_cache)
+    return results
+
+
+def run_dataset(years, seed, repeat, writes):
+    """Measure one dataset (in this process); returns its results dict."""
+    end_day = date.today()
+    path = history.dataset_dir(years, seed, end_day)
+    history.use_data_dir(path)
+    if not os.path.exists(os.path.join(path, "data.db")):
+        print(f"generating {years}y history in {path} ...", file=sys.stderr)
+        history.build(years, seed, end_day)
+    import db
+
+    db.init_db()
+    spans = _spans(end_day)
+    results = {}
+    results.update(_bench_reads(db, spans, repeat))
+    results.update(_bench_merge(db, spans, repeat))
+    results.update(_bench_routes(spans, repeat))
+    if writes:
+        results.update(_bench_writes(db, writes))
+    conn = db._get_conn(readonly=True)
+    sessions = sum(s.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] for s in conn.shards())
+    conn.close()
+    return {"sessions": sessions, "results": results}
+
+
+def compare(current, baseline, threshold):
+    """Return [(dataset, key, baseline_ms, current_ms)] for timings past the threshold."""
+    regressions = []
+    for dataset, data in current["datasets"].items():
+        base = baseline.get("datasets", {}).get(dataset, {}).get("results", {})
+        for key, timing in data["results"].items():
+            if key not in base:
+                continue
+            old, new = base[key]["median_ms"], timing["median_ms"]
+            if new > old * threshold and new - old > NOISE_FLOOR_MS:
+                regressions.append((dataset, key, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--writes", type=int, default=2000,
+                        help="sessions written for the save_session benchmark (0 skips it)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--dataset", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dataset is not None:
+        json.dump(run_dataset(args.dataset, args.seed, args.repeat, args.writes), sys.stdout)
+        return 0
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "datasets": {},
+    }
+    for years in args.years:
+        print(f"== {years} year(s)", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, __file__, "--dataset", str(years), "--seed", str(args.seed),
+             "--repeat", str(args.repeat), "--writes", str(args.writes)],
+            stdout=subprocess.PIPE, check=True, text=True,
+        )
+        data = json.loads(proc.stdout)
+        report["datasets"][f"{years}y"] = data
+        print(f"   {data['sessions']} sessions", file=sys.stderr)
+        for key, timing in data["results"].items():
+            print(f"   {key:<60} {timing['median_ms']:10.3f} ms", file=sys.stderr)
+
+    target = args.baseline if args.save_baseline else args.output
+    with open(target, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {target}", file=sys.stderr)
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(report, json.load(f), args.threshold)
+    for dataset, key, old, new in regressions:
+        print(f"REGRESSION {dataset} {key}: {old:.3f} -> {new:.3f} ms", file=sys.stderr)
+    if not regressions:
+        print(f"no regressions against {args.baseline}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
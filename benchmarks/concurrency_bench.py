@@ -0,0 +1,245 @@
+"""Many simultaneous dashboard clients, with and without the tracker writing.
+
+The dashboard runs in a child process on a copy of a synthetic history
+(history.py) and N client threads hit it over keep-alive connections, cycling
+through the day bundle, summaries and session pages. With --writes,
+a second child plays the tracker and commits sessions for today at that rate,
+so today's reads keep missing the query cache and run next to the writes.
+
+Server variants:
+
+* ``dev``: Flask's development server, a thread per request and a new
+  database connection per query (the setup before the connection pool);
+* ``pooled``: dashboard.make_server (werkzeug on a fixed thread pool) with
+  per-thread pooled read-only connections.
+
+The query cache is disabled unless --cache is given, so every request reaches
+SQLite.
+
+    python benchmarks/concurrency_bench.py
+    python benchmarks/concurrency_bench.py --clients 1 16 64 --seconds 10 --writes 20 --json
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import history
+
+VARIANTS = ("dev", "pooled")
+
+
+def _routes(today):
+    # What loading and live-updating the day view asks for. The timeline
+    # routes are left out: they are CPU-bound in Python (see bench_suite.py)
+    # and would measure the GIL rather than the database.
+    month = (today - timedelta(days=30)).isoformat()
+    day = today.isoformat()
+    return [
+        f"/api/day/{day}",
+        f"/api/summary/{day}",
+        f"/api/summary/{month}/{day}",
+        f"/api/sessions/{month}/{day}?limit=200",
+        f"/api/heatmap/{month}/{day}",
+        f"/api/cumulative/{day}",
+        "/api/dates",
+    ]
+
+
+def _serve(variant, path, port, threads, cache):
+    """Child process: the dashboard on ``path``, until killed."""
+    import logging
+
+    history.use_data_dir(path)
+    import db
+    import dashboard
+
+    db.init_db()
+    if not cache:
+        db._CACHE_SIZE = 0
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    if variant == "dev":
+        from werkzeug.serving import make_server
+
+        class _Unpooled(db._ShardedConnection):
+            def close(self):
+                self.readonly = False
+                super().close()
+
+        db._get_conn = lambda readonly=False: _Unpooled(readonly)
+        server = make_server("127.0.0.1", port, dashboard.app, threaded=True)
+    else:
+        server = dashboard.make_server("127.0.0.1", port, threads)
+    print("ready", flush=True)
+    server.serve_forever()
+
+
+def _write(path, rate):
+    """Child process: commit one session for today every 1/rate seconds, like the tracker."""
+    from datetime import datetime
+
+    history.use_data_dir(path)
+    import db
+
+    db.init_db()
+    types = ("mouse", "keyboard")
+    i = 0
+    print("ready", flush=True)
+    while True:
+        end = datetime.now()
+        db.save_session(end - timedelta(seconds=1.5), end, types[i % 2])
+        i += 1
+        time.sleep(1 / rate)
+
+
+def _spawn(*args):
+    proc = subprocess.Popen(
+        [sys.executable, __file__, *args], stdout=subprocess.PIPE, text=True
+    )
+    if proc.stdout.readline().strip() != "ready":
+        proc.kill()
+        raise RuntimeError(f"child {args[:2]} failed to start")
+    return proc
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _client(port, routes, offset, stop, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    i = offset
+    while not stop.is_set():
+        url = routes[i % len(routes)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", url)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append((time.perf_counter() - t0) * 1000)
+    conn.close()
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def _load(port, routes, clients, seconds):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=_client, args=(port, routes, i, stop, latencies, errors))
+        for i in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    if not latencies:
+        return {"requests_per_s": 0.0, "errors": len(errors)}
+    return {
+        "requests_per_s": round(len(latencies) / seconds, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "errors": len(errors),
+    }
+
+
+def measure(path, clients, seconds, writes, threads, cache, variants=VARIANTS):
+    routes = _routes(date.today())
+    results = {}
+    for variant in variants:
+        for rate in ([0, writes] if writes else [0]):
+            port = _free_port()
+            server = _spawn("--serve", variant, "--data", path, "--port", str(port),
+                            "--threads", str(threads), *(["--cache"] if cache else []))
+            writer = _spawn("--write", str(rate), "--data", path) if rate else None
+            try:
+                _load(port, routes, 1, 1.0)  # warm up
+                for n in clients:
+                    key = f"{variant} writes={rate}/s clients={n}"
+                    results[key] = _load(port, routes, n, seconds)
+                    print(f"  {key:<40} {results[key]}", file=sys.stderr)
+            finally:
+                for proc in (server, writer):
+                    if proc is not None:
+                        proc.kill()
+                        proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writes", type=float, default=20.0,
+                        help="sessions per second committed by the fake tracker (0: none)")
+    parser.add_argument("--threads", type=int, default=16, help="worker threads (pooled)")
+    parser.add_argument("--variant", choices=VARIANTS, action="append")
+    parser.add_argument("--cache", action="store_true", help="keep the query cache enabled")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--serve", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--write", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return _serve(args.serve, args.data, args.port, args.threads, args.cache)
+    if args.write:
+        return _write(args.data, args.write)
+
+    source = history.dataset_dir(args.years, args.seed)
+    if not os.path.exists(os.path.join(source, "data.db")):
+        print(f"generating {args.years}y history in {source} ...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, os.path.join(history.ROOT, "benchmarks", "history.py"),
+             "--years", str(args.years), "--seed", str(args.seed), "--dir", source],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+    # The fake tracker writes into a copy, leaving the shared dataset as it is
+    scratch = tempfile.mkdtemp(prefix="nat-concurrency-")
+    try:
+        path = os.path.join(scratch, "data")
+        shutil.copytree(source, path)
+        results = measure(path, args.clients, args.seconds, args.writes, args.threads,
+                          args.cache, args.variant or VARIANTS)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'':<40} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for key, r in results.items():
+        print(f"{key:<40} {r['requests_per_s']:>9} {r.get('p50_ms', '-'):>9} "
+              f"{r.get('p95_ms', '-'):>9} {r.get('p99_ms', '-'):>9} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Deterministic synthetic activity history for the benchmarks.
+
+Weekdays have a morning and an afternoon block of work made of bursts: a few
+minutes of short mouse sessions interleaved with longer typing sessions, then
+a pause. Weekends only see the occasional evening burst. The same ``seed``
+always yields the same sessions.
+
+Use ``use_data_dir()`` before importing db so the history is written to a
+scratch directory instead of data/.
+"""
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+DATASETS_DIR = os.path.join(ROOT, "benchmarks", ".data")
+
+
+def use_data_dir(path):
+    """Point config at ``path``; must run before db is imported."""
+    if "db" in sys.modules:
+        raise RuntimeError("use_data_dir() must be called before importing db")
+    config.DATA_DIR = path
+    config.DB_PATH = os.path.join(path, "data.db")
+    config.SHARD_DIR = os.path.join(path, "shards")
+    config.SETTINGS_PATH = os.path.join(path, "settings.json")
+    config._LEGACY_DB_PATH = os.path.join(path, "mouse_activity.db")
+
+
+def _burst(rnd, t, end, sessions):
+    """One burst of activity starting at t; returns when it ends."""
+    burst_end = min(t + timedelta(minutes=rnd.uniform(2, 25)), end)
+    typing = rnd.random() < 0.6
+    while t < burst_end:
+        if typing and rnd.random() < 0.35:
+            length = rnd.uniform(2, 90)
+            sessions.append((t, t + timedelta(seconds=length), "keyboard"))
+        else:
+            length = rnd.lognormvariate(0.7, 0.9)
+            sessions.append((t, t + timedelta(seconds=length), "mouse"))
+        t += timedelta(seconds=length + rnd.expovariate(1 / 8) + 3)
+    return t
+
+
+def day_sessions(rnd, day):
+    """Sessions for one day, in start order."""
+    sessions = []
+    midnight = datetime.combine(day, datetime.min.time())
+    if day.weekday() < 5:
+        blocks = [(8.5, 12.5), (13.5, 18.0)]
+        if rnd.random() < 0.3:
+            blocks.append((20.5, 23.0))
+    else:
+        blocks = [(19.0, 22.5)] if rnd.random() < 0.5 else []
+    for first, last in blocks:
+        t = midnight + timedelta(hours=first + rnd.uniform(-0.5, 0.5))
+        end = midnight + timedelta(hours=last + rnd.uniform(-0.5, 0.5))
+        while t < end:
+            t = _burst(rnd, t, end, sessions)
+            t += timedelta(minutes=rnd.expovariate(1 / 6))
+    return sessions
+
+
+def generate(years, seed=1, end_day=None):
+    """Yield (day, sessions) for ``years`` years ending the day before ``end_day``."""
+    rnd = random.Random(seed)
+    end_day = end_day or date.today()
+    day = end_day - timedelta(days=round(365.25 * years))
+    while day < end_day:
+        yield day, day_sessions(rnd, day)
+        day += timedelta(days=1)
+
+
+def build(years, seed=1, end_day=None, progress=None):
+    """Write the history through db's normal write path, one transaction per day."""
+    import db
+
+    db.init_db()
+    conn = db._get_conn()
+    count = 0
+    try:
+        for day, sessions in generate(years, seed, end_day):
+            rows = [r for r in (db._session_row(*s) for s in sessions) if r is not None]
+            with conn:
+                db._insert_sessions(conn, rows)
+            count += len(rows)
+            if progress and day.day == 1:
+                progress(day, count)
+    finally:
+        conn.close()
+    return count
+
+
+def dataset_dir(years, seed=1, end_day=None):
+    end_day = end_day or date.today()
+    return os.path.join(DATASETS_DIR, f"{years}y-seed{seed}-{end_day.isoformat()}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic history.")
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="target data directory (default: benchmarks/.data/...)")
+    args = parser.parse_args()
+    use_data_dir(args.dir or dataset_dir(args.years, args.seed))
+    t0 = time.perf_counter()
+    n = build(args.years, args.seed, progress=lambda d, n: print(f"  {d}  {n} sessions"))
+    print(f"{n} sessions in {time.perf_counter() - t0:.1f}s -> {config.DATA_DIR}")
@@ -0,0 +1,365 @@
+"""Replay input event streams through InputTracker without a desktop session.
+
+Events are (t, kind) pairs: t in seconds from the start of the stream, kind
+one of "move", "click", "scroll" (mouse tracker) or "key" (keyboard tracker).
+Closed sessions go to an in-memory sink instead of the database.
+
+Two modes:
+
+* ``fake`` (default): a single thread feeds the events in time order on a fake
+  clock and runs the idle scheduler at each deadline, the way its thread
+  would. Deterministic; measures CPU per event and memory.
+* ``threads``: one thread per stream on the real clock (compressed by
+  ``--speed``) plus the real IdleScheduler thread. Adds lock contention and
+  session-close latency.
+
+Examples:
+
+    python benchmarks/replay.py --scenario sweep --seconds 120
+    python benchmarks/replay.py --scenario mixed --mode threads --typing-threads 4 --speed 10
+    python benchmarks/replay.py --record events.jsonl --seconds 60   # needs pynput
+    python benchmarks/replay.py --events events.jsonl --json
+    python benchmarks/replay.py --activity-log    # also write the raw activity log
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from idle import IdleScheduler  # noqa: E402
+from input_tracker import InputTracker  # noqa: E402
+
+MOUSE_KINDS = ("move", "click", "scroll")
+_TIMER_SLACK = 1e-6
+
+
+# --- Event streams ---
+
+def mouse_sweep(seconds=60.0, rate_hz=1000, active=8.0, pause=4.0):
+    """Moves at ``rate_hz`` for ``active`` seconds, then ``pause`` seconds still, repeated."""
+    t = 0.0
+    step = 1.0 / rate_hz
+    while t < seconds:
+        end = min(t + active, seconds)
+        n = int((end - t) * rate_hz)
+        for i in range(n):
+            yield t + i * step, "move"
+        t = end + pause
+
+
+def typing_bursts(seconds=60.0, seed=1):
+    """Bursts of 5-80 key presses 60-250 ms apart, separated by pauses of a few seconds."""
+    rnd = random.Random(seed)
+    t = rnd.uniform(0, 2)
+    while t < seconds:
+        for _ in range(rnd.randint(5, 80)):
+            yield t, "key"
+            t += rnd.uniform(0.06, 0.25)
+        t += rnd.expovariate(1 / 4) + 1
+
+
+def load_events(path):
+    """Read a JSON-lines recording ({"t": seconds, "kind": ...} per line)."""
+    with open(path) as f:
+        events = [(float(e["t"]), e["kind"]) for e in map(json.loads, f) if e]
+    events.sort()
+    return events
+
+
+def record_events(path, seconds):
+    """Record live input with pynput into a JSON-lines file."""
+    from pynput import keyboard, mouse
+
+    t0 = time.monotonic()
+    lines = []
+
+    def add(kind):
+        lines.append(json.dumps({"t": round(time.monotonic() - t0, 6), "kind": kind}))
+
+    listeners = [
+        mouse.Listener(
+            on_move=lambda x, y: add("move"),
+            on_click=lambda x, y, button, pressed: add("click"),
+            on_scroll=lambda x, y, dx, dy: add("scroll"),
+        ),
+        keyboard.Listener(on_press=lambda key: add("key")),
+    ]
+    for listener in listeners:
+        listener.start()
+    time.sleep(seconds)
+    for listener in listeners:
+        listener.stop()
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return len(lines)
+
+
+# --- Instrumentation ---
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLock:
+    """threading.Lock stand-in counting acquisitions and the time spent blocked."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(False):
+            if not blocking:
+                return False
+            t0 = time.perf_counter_ns()
+            if not self._lock.acquire(True, timeout):
+                return False
+            self.contended += 1
+            self.wait_ns += time.perf_counter_ns() - t0
+        self.acquisitions += 1
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _dispatch(trackers, kind):
+    if kind == "move":
+        trackers["mouse"].on_move()
+    elif kind in MOUSE_KINDS:
+        trackers["mouse"].on_event()
+    else:
+        trackers["keyboard"].on_event()
+
+
+def _make_trackers(clock, sink, activity_log=None):
+    trackers = {
+        t: InputTracker(t, clock=clock, on_session_close=sink, activity_log=activity_log)
+        for t in ("mouse", "keyboard")
+    }
+    for tracker in trackers.values():
+        tracker.lock = CountingLock()
+    scheduler = IdleScheduler(list(trackers.values()), clock=clock)
+    for tracker in trackers.values():
+        tracker.on_session_open = scheduler.notify
+    return trackers, scheduler
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _report(mode, trackers, events, sessions, cpu_ns, wall_ns, latencies, traced_peak):
+    locks = [t.lock for t in trackers.values()]
+    return {
+        "mode": mode,
+        "events": events,
+        "sessions": sessions,
+        "coalesced_moves": trackers["mouse"].coalesced_count,
+        "cpu_ns_per_event": round(cpu_ns / events) if events else 0,
+        "wall_ns_per_event": round(wall_ns / events) if events else 0,
+        "sampled_overhead_ns": {t: tr.stats()["avg_overhead_ns"] for t, tr in trackers.items()},
+        "lock": {
+            "acquisitions": sum(lock.acquisitions for lock in locks),
+            "contended": sum(lock.contended for lock in locks),
+            "wait_ms": round(sum(lock.wait_ns for lock in locks) / 1e6, 3),
+        },
+        "close_latency_ms": {
+            "p50": round(statistics.median(latencies), 3),
+            "p99": round(sorted(latencies)[int(len(latencies) * 0.99)], 3),
+            "max": round(max(latencies), 3),
+        } if latencies else None,
+        "traced_peak_kb": round(traced_peak / 1024, 1) if traced_peak is not None else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+# --- Replays ---
+
+def replay_fake(streams, trace_memory=False, activity_log=None):
+    """Deterministic single-threaded replay on a fake clock."""
+    clock = FakeClock()
+    closed = []
+    trackers, scheduler = _make_trackers(clock, lambda *s: closed.append(s), activity_log)
+    events = heapq.merge(*streams)
+    if trace_memory:
+        tracemalloc.start()
+    count = 0
+    deadline = None
+    cpu0, wall0 = time.process_time_ns(), time.perf_counter_ns()
+    for t, kind in events:
+        # The scheduler thread wakes at each deadline the clock passes
+        while deadline is not None and deadline <= t:
+            # A microsecond late, like a real timer: exactly at the deadline
+            # float rounding can leave the idle time a hair under the threshold
+            clock.now = deadline + _TIMER_SLACK
+            deadline = scheduler.run_pending()
+        clock.now = t
+        _dispatch(trackers, kind)
+        count += 1
+        if deadline is None:
+            deadline = scheduler.next_deadline()
+    if deadline is not None:
+        clock.now = deadline + _TIMER_SLACK
+        scheduler.run_pending()
+    for tracker in trackers.values():
+        tracker.flush()
+    cpu, wall = time.process_time_ns() - cpu0, time.perf_counter_ns() - wall0
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return _report("fake", trackers, count, len(closed), cpu, wall, [], traced_peak)
+
+
+def replay_threads(streams, speed=1.0, trace_memory=False, activity_log=None):
+    """One producer thread per stream on the real clock, plus the real idle scheduler.
+
+    ``speed`` compresses time (10 = ten times faster); the idle threshold and
+    move coalescing window are scaled with it. 0 replays as fast as possible.
+    """
+    latencies = []
+    scale = speed if speed > 0 else 1.0
+    threshold = config.IDLE_THRESHOLD_SECONDS / scale
+    saved = config.IDLE_THRESHOLD_SECONDS, config.EVENT_COALESCE_SECONDS
+    config.IDLE_THRESHOLD_SECONDS = threshold
+    config.EVENT_COALESCE_SECONDS /= scale
+
+    def sink(start, end, session_type):
+        # How long after its idle deadline the session was handed over
+        latencies.append((time.time() - (end.timestamp() + threshold)) * 1000)
+
+    trackers, scheduler = _make_trackers(time.monotonic, sink, activity_log)
+    counts = [0] * len(streams)
+
+    def produce(i, stream):
+        t0 = time.monotonic()
+        for t, kind in stream:
+            if speed > 0:
+                delay = t0 + t / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            _dispatch(trackers, kind)
+            counts[i] += 1
+
+    if trace_memory:
+        tracemalloc.start()
+    scheduler_thread = threading.Thread(target=scheduler.run, daemon=True)
+    scheduler_thread.start()
+    producers = [
+        threading.Thread(target=produce, args=(i, s), daemon=True) for i, s in enumerate(streams)
+    ]
+    cpu0, wall0 = time.process_time_ns(), time.perf_counter_ns()
+    for p in producers:
+        p.start()
+    for p in producers:
+        p.join()
+    # Let the scheduler close the last sessions at their deadlines
+    time.sleep(threshold * 1.5 + 0.05)
+    cpu, wall = time.process_time_ns() - cpu0, time.perf_counter_ns() - wall0
+    scheduler.stop()
+    scheduler_thread.join(1.0)
+    for tracker in trackers.values():
+        tracker.flush()
+    config.IDLE_THRESHOLD_SECONDS, config.EVENT_COALESCE_SECONDS = saved
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    report = _report("threads", trackers, sum(counts), len(latencies), cpu, wall, latencies,
+                     traced_peak)
+    report["scheduler_wakeups"] = scheduler.wakeups
+    return report
+
+
+def build_streams(args):
+    if args.events:
+        return [load_events(args.events)]
+    streams = []
+    if args.scenario in ("sweep", "mixed"):
+        streams.append(mouse_sweep(args.seconds, args.rate))
+    if args.scenario in ("typing", "mixed"):
+        streams.extend(typing_bursts(args.seconds, seed=i + 1) for i in range(args.typing_threads))
+    return streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=("sweep", "typing", "mixed"), default="mixed")
+    parser.add_argument("--events", help="replay a JSON-lines recording instead")
+    parser.add_argument("--record", help="record live input to this file and exit")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=int, default=1000, help="mouse sweep rate (Hz)")
+    parser.add_argument("--typing-threads", type=int, default=1)
+    parser.add_argument("--mode", choices=("fake", "threads"), default="fake")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="time compression in threads mode (0 = as fast as possible)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure Python allocations with tracemalloc (slows the replay)")
+    parser.add_argument("--activity-log", action="store_true",
+                        help="write the raw activity log (to a temporary directory)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.record:
+        n = record_events(args.record, args.seconds)
+        print(f"recorded {n} events to {args.record}")
+        return
+    streams = build_streams(args)
+    log = log_dir = None
+    if args.activity_log:
+        from activity_log import ActivityLog
+
+        log_dir = tempfile.mkdtemp(prefix="nat-activity-")
+        log = ActivityLog(log_dir)
+    try:
+        if args.mode == "fake":
+            report = replay_fake(streams, args.trace_memory, log)
+        else:
+            report = replay_threads([list(s) for s in streams], args.speed, args.trace_memory, log)
+        if log is not None:
+            log.close()
+            report["activity_log_bytes"] = sum(
+                os.path.getsize(os.path.join(log_dir, name)) for name in os.listdir(log_dir)
+            )
+    finally:
+        if log_dir is not None:
+            shutil.rmtree(log_dir, ignore_errors=True)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:<22} {value}")
+
+
+if __name__ == "__main__":
+    main()
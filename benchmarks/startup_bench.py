@@ -0,0 +1,179 @@
+"""Measure what tracker startup costs before input capture begins.
+
+Every sample runs in a fresh interpreter, as at logon:
+
+* ``python -c pass``: the interpreter itself, for reference;
+* capture path: importing what tracker.main needs before the listeners start
+  (config, db, idle, input_tracker, live, metrics, plus pynput when installed),
+  loading the settings and building the trackers;
+* deferred imports: what is only loaded after capture started or on demand
+  (compaction, pystray, PIL, flask/dashboard, webbrowser), each on its own
+  and with its dependencies (compaction includes db);
+* ``init_db``: on an empty data directory, on a single-file database from
+  before the monthly shards (one-off migration) and on an up-to-date one, which
+  is what every normal start pays.
+
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --repeat 20 --legacy-sessions 100000 --json
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFERRED_MODULES = (
+    "compaction", "pystray", "PIL.Image", "PIL.ImageDraw", "webbrowser", "flask", "dashboard",
+)
+
+# Runs in the child: points config at a scratch directory, then times the step
+_PRELUDE = f"""
+import json, os, sys, time
+sys.path.insert(0, {ROOT!r})
+sys.path.insert(0, {os.path.join(ROOT, "benchmarks")!r})
+"""
+
+_CAPTURE = _PRELUDE + """
+t0 = time.perf_counter()
+import config, db, idle, input_tracker, live, metrics
+try:
+    import pynput
+except Exception:
+    pynput = None
+t1 = time.perf_counter()
+settings = config.load_settings()
+trackers = [input_tracker.InputTracker(t) for t in ("mouse", "keyboard")]
+idle.IdleScheduler(trackers)
+t2 = time.perf_counter()
+print(json.dumps({"imports_ms": (t1 - t0) * 1000, "setup_ms": (t2 - t1) * 1000,
+                  "pynput": pynput is not None}))
+"""
+
+_IMPORT = _PRELUDE + """
+import importlib
+t0 = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[1])
+except Exception:
+    print("null")
+else:
+    print(json.dumps((time.perf_counter() - t0) * 1000))
+"""
+
+_INIT_DB = _PRELUDE + """
+import history
+history.use_data_dir(sys.argv[1])
+import db
+t0 = time.perf_counter()
+db.init_db()
+print(json.dumps((time.perf_counter() - t0) * 1000))
+"""
+
+
+def _run(code, *args):
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code, *args], stdout=subprocess.PIPE, text=True, check=True
+    ).stdout
+    return (time.perf_counter() - t0) * 1000, json.loads(out) if out.strip() else None
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def _legacy_db(path, sessions):
+    """Single-file data.db as written before the monthly shards."""
+    os.makedirs(path, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(path, "data.db"))
+    conn.execute("""
+        CREATE TABLE sessions (
+            session_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+            type        TEXT NOT NULL DEFAULT 'mouse',
+            start_time  TEXT NOT NULL,
+            end_time    TEXT NOT NULL,
+            duration    REAL NOT NULL
+        )
+    """)
+    t = datetime.now() - timedelta(seconds=20 * sessions)
+    rows = []
+    for i in range(sessions):
+        end = t + timedelta(seconds=2 + i % 9)
+        rows.append(("keyboard" if i % 3 else "mouse", t.isoformat(), end.isoformat(),
+                     (end - t).total_seconds()))
+        t += timedelta(seconds=20)
+    conn.executemany(
+        "INSERT INTO sessions (type, start_time, end_time, duration) VALUES (?, ?, ?, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(repeat, legacy_sessions):
+    report = {"python": [], "capture_wall": [], "capture_imports": [], "capture_setup": []}
+    for _ in range(repeat):
+        report["python"].append(_run("pass")[0])
+        wall, child = _run(_CAPTURE)
+        report["capture_wall"].append(wall)
+        report["capture_imports"].append(child["imports_ms"])
+        report["capture_setup"].append(child["setup_ms"])
+    results = {
+        "python -c pass (wall)": _median(report["python"]),
+        "capture path (wall)": _median(report["capture_wall"]),
+        "capture path: imports": _median(report["capture_imports"]),
+        "capture path: settings + trackers": _median(report["capture_setup"]),
+        "pynput installed": child["pynput"],
+    }
+    for module in DEFERRED_MODULES:
+        results[f"deferred import {module}"] = _median(
+            [_run(_IMPORT, module)[1] for _ in range(repeat)]
+        )
+
+    scratch = tempfile.mkdtemp(prefix="nat-startup-")
+    try:
+        empty, current = [], []
+        for i in range(repeat):
+            path = os.path.join(scratch, f"empty{i}")
+            empty.append(_run(_INIT_DB, path)[1])
+            # Second start on the same directory: the everyday case
+            current.append(_run(_INIT_DB, path)[1])
+        results["init_db empty dir"] = _median(empty)
+        results["init_db up to date"] = _median(current)
+        path = os.path.join(scratch, "legacy")
+        _legacy_db(path, legacy_sessions)
+        results[f"init_db legacy migration ({legacy_sessions} sessions)"] = round(
+            _run(_INIT_DB, path)[1], 3
+        )
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--legacy-sessions", type=int, default=20000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    results = measure(args.repeat, args.legacy_sessions)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f"{key:<50} {value:10.3f} ms")
+        else:
+            print(f"{key:<50} {'not installed' if value is None else str(value):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Per-second activity bitmaps: an alternative storage backend for db.py.
+
+Each (day, type) pair is one 86400-bit bitmap (10.8 KB, zlib-compressed on
+disk) where bit N is set if there was input during second N of that local day.
+Totals are popcounts, the cumulative series is mouse OR keyboard, overlap is
+mouse AND keyboard, and "sessions" are runs of consecutive set bits.
+
+Enabled with ``STORAGE_BACKEND = "bitmap"`` in config.py; the db.get_* API
+then answers from here, on the connection db passes in (this module does not
+import db). Run ``python bitmaps.py`` to convert an existing sessions table.
+"""
+import re
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+
+from summary import CUMULATIVE, summarize
+
+SECONDS_PER_DAY = 86400
+TYPES = ("mouse", "keyboard")
+_HOUR_MASK = (1 << 3600) - 1
+_RUN = re.compile("1+")
+
+
+def create_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_bitmaps (
+            day     TEXT NOT NULL,
+            type    TEXT NOT NULL,
+            bits    BLOB NOT NULL,
+            PRIMARY KEY (day, type)
+        ) WITHOUT ROWID
+    """)
+
+
+def _decode(blob):
+    return int.from_bytes(zlib.decompress(blob), "little")
+
+
+def _encode(bits):
+    return zlib.compress(bits.to_bytes(SECONDS_PER_DAY // 8, "little"))
+
+
+def _second_spans(start_ts, end_ts):
+    """Split an epoch span into (day, first_second, end_second) pieces per local day."""
+    start = datetime.fromtimestamp(round(start_ts))
+    end = datetime.fromtimestamp(max(round(end_ts), round(start_ts) + 1))
+    while start < end:
+        midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        piece_end = min(end, midnight)
+        first = start.hour * 3600 + start.minute * 60 + start.second
+        yield start.date().isoformat(), first, first + int((piece_end - start).total_seconds())
+        start = piece_end
+
+
+def record(conn, rows):
+    """OR a batch of session rows (as built by db._session_row) into the bitmaps."""
+    updates = {}
+    for session_type, _, _, _, _, start_ts, end_ts in rows:
+        for day, first, last in _second_spans(start_ts, end_ts):
+            key = (day, session_type)
+            updates[key] = updates.get(key, 0) | (((1 << (last - first)) - 1) << first)
+    for (day, session_type), bits in updates.items():
+        row = conn.execute(
+            "SELECT bits FROM activity_bitmaps WHERE day = ? AND type = ?",
+            (day, session_type),
+        ).fetchone()
+        if row:
+            bits |= _decode(row[0])
+        conn.execute(
+            "INSERT OR REPLACE INTO activity_bitmaps (day, type, bits) VALUES (?, ?, ?)",
+            (day, session_type, _encode(bits)),
+        )
+
+
+def _load(start_date, end_date, conn):
+    """Return {day: {type: bits}} for the range."""
+    rows = conn.execute(
+        "SELECT day, type, bits FROM activity_bitmaps WHERE day >= ? AND day <= ?",
+        (start_date, end_date),
+    ).fetchall()
+    days = {}
+    for day, session_type, blob in rows:
+        days.setdefault(day, {})[session_type] = _decode(blob)
+    return days
+
+
+def _select(maps, session_type):
+    if session_type == CUMULATIVE:
+        return maps.get("mouse", 0) | maps.get("keyboard", 0)
+    return maps.get(session_type, 0)
+
+
+def _run_count(bits):
+    return (bits & ~(bits << 1)).bit_count()
+
+
+def _runs(bits):
+    """Yield (first_second, end_second) for each run of set bits."""
+    text = format(bits, f"0{SECONDS_PER_DAY}b")[::-1]
+    for m in _RUN.finditer(text):
+        yield m.start(), m.end()
+
+
+def _run_dicts(day, bits, session_type):
+    midnight = datetime.combine(date.fromisoformat(day), datetime.min.time())
+    for first, last in _runs(bits):
+        start = midnight + timedelta(seconds=first)
+        end = midnight + timedelta(seconds=last)
+        yield {
+            "session_id": None,
+            "type": session_type,
+            "start_time": start.isoformat(),
+            "end_time": end.isoformat(),
+            "duration": float(last - first),
+        }
+
+
+def _sessions(start_date, end_date, session_type, conn):
+    result = []
+    for day, maps in sorted(_load(start_date, end_date, conn).items()):
+        day_rows = []
+        for t in (session_type,) if session_type else TYPES:
+            day_rows.extend(_run_dicts(day, maps.get(t, 0), t))
+        day_rows.sort(key=lambda s: s["start_time"])
+        result.extend(day_rows)
+    return result
+
+
+# --- db.get_* implementations ---
+
+def get_sessions_for_date(date_str, session_type=None, conn=None):
+    return _sessions(date_str, date_str, session_type, conn)
+
+
+def get_sessions_for_range(start_date, end_date, session_type=None, conn=None):
+    return _sessions(start_date, end_date, session_type, conn)
+
+
+# Runs have no stable ids to resume from, so a range is always a single page
+
+def iter_sessions_for_range(
+    start_date, end_date, session_type=None, after=None, limit=None, conn=None
+):
+    # A list iterator, not a generator: db closes ``conn`` once this returns
+    return iter(_sessions(start_date, end_date, session_type, conn))
+
+
+def get_sessions_since(date_str, after=None, conn=None):
+    # Runs of bits have no ids to resume from: None tells the caller to reload the day
+    return None
+
+
+def get_sessions_page(start_date, end_date, session_type=None, after=None, limit=None, conn=None):
+    return {"sessions": _sessions(start_date, end_date, session_type, conn), "next_after": None}
+
+
+def get_summary_for_date(date_str, session_type=None, conn=None):
+    return get_summary_for_range(date_str, date_str, session_type, conn)
+
+
+def get_summary_for_range(start_date, end_date, session_type=None, conn=None):
+    total = count = 0
+    for maps in _load(start_date, end_date, conn).values():
+        for t in (session_type,) if session_type else TYPES:
+            bits = _select(maps, t)
+            total += bits.bit_count()
+            count += _run_count(bits)
+    return summarize(total, count)
+
+
+def get_merged_summary_for_date(date_str, conn=None):
+    return get_summary_for_range(date_str, date_str, CUMULATIVE, conn)
+
+
+def get_merged_summary_for_range(start_date, end_date, conn=None):
+    return get_summary_for_range(start_date, end_date, CUMULATIVE, conn)
+
+
+def get_cumulative_intervals(date_str, conn=None):
+    maps = _load(date_str, date_str, conn).get(date_str, {})
+    return [
+        {k: s[k] for k in ("start_time", "end_time", "duration")}
+        for s in _run_dicts(date_str, _select(maps, CUMULATIVE), CUMULATIVE)
+    ]
+
+
+def get_merged_daily_totals(start_date, end_date, conn=None):
+    return {
+        day: float(_select(maps, CUMULATIVE).bit_count())
+        for day, maps in _load(start_date, end_date, conn).items()
+    }
+
+
+def get_weekday_hour_heatmap(start_date, end_date, session_type=None, conn=None):
+    grid = [[0.0] * 24 for _ in range(7)]
+    for day, maps in _load(start_date, end_date, conn).items():
+        bits = _select(maps, session_type or CUMULATIVE)
+        row = grid[date.fromisoformat(day).weekday()]
+        for h in range(24):
+            row[h] += ((bits >> (3600 * h)) & _HOUR_MASK).bit_count()
+    return grid
+
+
+def get_available_dates(conn=None):
+    rows = conn.execute("SELECT DISTINCT day FROM activity_bitmaps ORDER BY day DESC").fetchall()
+    return [r[0] for r in rows]
+
+
+def get_timeline_buckets(start_date, end_date, resolution=60, conn=None):
+    mask = (1 << resolution) - 1
+    n = SECONDS_PER_DAY // resolution
+    days = {}
+    for day, maps in _load(start_date, end_date, conn).items():
+        days[day] = {}
+        for t in ("mouse", "keyboard", "cumulative"):
+            bits = _select(maps, CUMULATIVE if t == "cumulative" else t)
+            runs = []
+            for b in range(n):
+                if (bits >> (b * resolution)) & mask:
+                    if runs and runs[-1][0] + runs[-1][1] == b:
+                        runs[-1][1] += 1
+                    else:
+                        runs.append([b, 1])
+            days[day][t] = runs
+    return {"resolution": resolution, "buckets_per_day": n, "days": days}
+
+
+# --- Queries only the bitmap layout makes cheap ---
+
+def get_overlap_for_range(start_date, end_date, conn=None):
+    """Seconds during which mouse and keyboard were both active."""
+    return sum(
+        (maps.get("mouse", 0) & maps.get("keyboard", 0)).bit_count()
+        for maps in _load(start_date, end_date, conn).values()
+    )
+
+
+def get_hourly_histogram(start_date, end_date, session_type=None, conn=None):
+    """Active seconds per hour of day (24 values), summed over the range.
+
+    Without a session_type the cumulative (mouse OR keyboard) series is used.
+    """
+    hours = [0] * 24
+    for maps in _load(start_date, end_date, conn).values():
+        bits = _select(maps, session_type or CUMULATIVE)
+        for h in range(24):
+            hours[h] += ((bits >> (3600 * h)) & _HOUR_MASK).bit_count()
+    return hours
+
+
+if __name__ == "__main__":
+    import db
+
+    db.init_db()
+    n = db.convert_to_bitmaps()
+    print(f"Converted {n} sessions into per-second bitmaps.")
+    if db.STORAGE_BACKEND != "bitmap":
+        print('Set STORAGE_BACKEND = "bitmap" in config.py to query them.', file=sys.stderr)
@@ -0,0 +1,159 @@
+"""Collector mode: trackers on several machines, one combined dashboard.
+
+On the collector, COLLECTOR_ENABLED adds POST /api/ingest to the dashboard.
+On every other machine COLLECTOR_URL is set: the tracker keeps writing its own
+database as usual, and a SessionPusher sends the sessions recorded since the
+last push every PUSH_INTERVAL_SECONDS, as gzip-compressed JSON batches tagged
+with the machine's host name. The collector stores them with that host
+(db.ingest_sessions, one executemany per month) and skips the ones it already
+has, so a push whose answer was lost is simply sent again. What the collector
+acknowledged is kept per month in PUSH_STATE_PATH.
+
+Day, week and month views on the collector add up every host: per-type totals
+are summed, the cumulative timeline is the union of all their activity.
+
+    python collector.py                      # push once, in the foreground
+    python collector.py --url http://127.0.0.1:5000 --host laptop
+"""
+import gzip
+import json
+import os
+import threading
+import zlib
+
+import db
+from config import (
+    COLLECTOR_TOKEN, COLLECTOR_URL, HOST_NAME, PUSH_BATCH_SIZE, PUSH_INTERVAL_SECONDS,
+    PUSH_STATE_PATH,
+)
+
+TOKEN_HEADER = "X-NAT-Token"
+# Largest batch the collector accepts, as sent and once decompressed
+MAX_BATCH_BYTES = 32 * 1024 * 1024
+
+
+def encode_batch(host, sessions) -> bytes:
+    body = json.dumps({"host": host, "sessions": sessions}, separators=(",", ":"))
+    return gzip.compress(body.encode(), compresslevel=6)
+
+
+def decode_batch(body, content_encoding=None):
+    """(host, sessions) from a request body; raises ValueError if it is not a batch."""
+    if content_encoding == "gzip":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, MAX_BATCH_BYTES)
+        except zlib.error as e:
+            raise ValueError(f"bad gzip body: {e}") from None
+        if inflater.unconsumed_tail:
+            raise ValueError("batch too large")
+    elif len(body) > MAX_BATCH_BYTES:
+        raise ValueError("batch too large")
+    batch = json.loads(body)
+    if not isinstance(batch, dict) or not isinstance(batch.get("sessions"), list):
+        raise ValueError("expected {host, sessions}")
+    return batch.get("host"), batch["sessions"]
+
+
+def _host_name():
+    if HOST_NAME:
+        return HOST_NAME
+    import socket
+
+    return socket.gethostname()
+
+
+def _load_cursors(path=PUSH_STATE_PATH) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_cursors(cursors, path=PUSH_STATE_PATH):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cursors, f)
+    os.replace(tmp, path)
+
+
+def _post(url, body, token=COLLECTOR_TOKEN, timeout=30.0) -> dict:
+    import urllib.request
+
+    headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    if token:
+        headers[TOKEN_HEADER] = token
+    request = urllib.request.Request(
+        url.rstrip("/") + "/api/ingest", data=body, headers=headers, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+def push_once(url=COLLECTOR_URL, host=None, batch_size=PUSH_BATCH_SIZE) -> dict:
+    """Send every local session the collector has not acknowledged yet.
+
+    Raises OSError (urllib's errors included) when the collector cannot be
+    reached or refuses a batch; what was acknowledged before stays pushed.
+    """
+    host = host or _host_name()
+    cursors = _load_cursors()
+    result = {"sent": 0, "inserted": 0}
+    while True:
+        sessions = db.get_unpushed_sessions(cursors, batch_size)
+        if not sessions:
+            break
+        answer = _post(url, encode_batch(host, sessions))
+        for session_id, _, start_time, *_ in sessions:
+            month = start_time[:7]
+            cursors[month] = max(cursors.get(month, 0), session_id)
+        _save_cursors(cursors)
+        result["sent"] += len(sessions)
+        result["inserted"] += answer["inserted"]
+        if len(sessions) < batch_size:
+            break
+    return result
+
+
+class SessionPusher:
+    """Background thread running push_once() every PUSH_INTERVAL_SECONDS."""
+
+    def __init__(self, url=COLLECTOR_URL, interval=PUSH_INTERVAL_SECONDS):
+        self.url = url
+        self.interval = interval
+        self.last_result = None
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="session-pusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_result = push_once(self.url)
+            except (OSError, ValueError, KeyError):
+                # Collector offline or rejecting the batch: retried next round
+                self.errors += 1
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Push local sessions to a collector once.")
+    parser.add_argument("--url", default=COLLECTOR_URL)
+    parser.add_argument("--host", default=None)
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("set COLLECTOR_URL in config.py or pass --url")
+    db.init_db()
+    result = push_once(args.url, args.host)
+    print(f"Pushed {result['sent']} sessions, {result['inserted']} new on the collector.")
@@ -0,0 +1,213 @@
+"""Compaction of old sessions.
+
+Past a few weeks nobody looks at individual one-second mouse sessions, so
+days older than COMPACT_AFTER_DAYS are rewritten with every run of same-type
+sessions separated by less than COMPACT_MAX_GAP_SECONDS merged into one row.
+The merged row keeps the summed duration of its members (not its span), so
+per-day and per-type totals are unchanged; session counts drop accordingly.
+Its start and end cover the whole run, gaps included, so the members' own
+spans are kept in its ``parts`` column: rebuilding the cumulative intervals,
+analytics and timelines read those (db._row_spans) and stay exact. The
+cumulative intervals of a day are left as they are.
+
+The tracker runs it in the background (CompactionJob); ``python compaction.py``
+runs one pass in the foreground.
+"""
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+import db
+from config import (
+    COMPACT_AFTER_DAYS, COMPACT_INTERVAL_SECONDS, COMPACT_MAX_GAP_SECONDS,
+    COMPACT_PAUSE_SECONDS, STORAGE_BACKEND,
+)
+
+# Last day already compacted, as a date ordinal in data.db's meta table
+_PROGRESS_KEY = "compacted_through"
+_VACUUM_PAGES = 256
+_TYPES = ("mouse", "keyboard")
+
+
+def _coalesce(rows, max_gap):
+    """Group start-ordered (session_id, start_ts, end_ts, end_time, duration, parts) rows.
+
+    Returns [(first_id, end_ts, end_time, total_duration, [absorbed ids], [spans]), ...]
+    for the groups that absorbed at least one other session; ``spans`` are the
+    members' own spans, overlapping ones included, so that per-session
+    statistics (duration percentiles) still see the original sessions.
+    """
+    groups = []
+    current = None
+    for session_id, start_ts, end_ts, end_time, duration, parts in rows:
+        spans = db._row_spans(start_ts, end_ts, parts)
+        if current is not None and start_ts - current[1] < max_gap:
+            if end_ts > current[1]:
+                current[1], current[2] = end_ts, end_time
+            current[3] += duration
+            current[4].append(session_id)
+            current[5].extend(spans)
+        else:
+            if current is not None and current[4]:
+                groups.append(current)
+            current = [session_id, end_ts, end_time, duration, [], list(spans)]
+    if current is not None and current[4]:
+        groups.append(current)
+    for group in groups:
+        group[5].sort()
+    return groups
+
+
+def compact_day(shard, day, max_gap=COMPACT_MAX_GAP_SECONDS) -> int:
+    """Coalesce one day's sessions inside the caller's transaction; returns rows removed."""
+    removed = 0
+    # Sessions ingested from other machines (collector.py) are only merged
+    # with sessions of the same host
+    hosts = [r[0] for r in shard.execute(
+        "SELECT DISTINCT host FROM sessions WHERE day = ?", (day,)
+    )]
+    for session_type, host in [(t, h) for t in _TYPES for h in hosts]:
+        rows = shard.execute(
+            "SELECT session_id, start_ts, end_ts, end_time, duration, parts FROM sessions "
+            "WHERE type = ? AND day = ? AND host = ? ORDER BY start_ts",
+            (session_type, day, host),
+        ).fetchall()
+        groups = _coalesce(rows, max_gap)
+        shard.executemany(
+            "UPDATE sessions SET end_ts = ?, end_time = ?, duration = ?, parts = ? "
+            "WHERE session_id = ?",
+            [(end_ts, end_time, round(total, 2), db._pack_parts(spans), first_id)
+             for first_id, end_ts, end_time, total, _, spans in groups],
+        )
+        absorbed = [(sid,) for group in groups for sid in group[4]]
+        shard.executemany("DELETE FROM sessions WHERE session_id = ?", absorbed)
+        removed += len(absorbed)
+    if removed:
+        # Per-type rollups follow the new rows; durations were summed, so the
+        # day's totals are the same and only the counts (and hour of a merged
+        # run that crossed an hour boundary) change
+        shard.execute(
+            "DELETE FROM rollups WHERE day = ? AND type IN ('mouse', 'keyboard')", (day,)
+        )
+        shard.execute("""
+            INSERT INTO rollups (day, hour, type, total_duration, session_count)
+            SELECT day, CAST(substr(start_time, 12, 2) AS INTEGER), type,
+                   SUM(duration), COUNT(*)
+            FROM sessions WHERE day = ?
+            GROUP BY 1, 2, 3
+        """, (day,))
+        shard.execute(
+            "DELETE FROM daily_rollups WHERE day = ? AND type IN ('mouse', 'keyboard')", (day,)
+        )
+        shard.execute("""
+            INSERT INTO daily_rollups (day, type, total_duration, session_count)
+            SELECT day, type, SUM(duration), COUNT(*)
+            FROM sessions WHERE day = ?
+            GROUP BY 1, 2
+        """, (day,))
+    return removed
+
+
+def _vacuum(shard, stop):
+    """Hand free pages back to the filesystem a few at a time."""
+    if shard.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Shards created before incremental vacuum was enabled: one full VACUUM
+        shard.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        shard.execute("VACUUM")
+        return
+    while shard.execute("PRAGMA freelist_count").fetchone()[0] and not stop.is_set():
+        shard.execute(f"PRAGMA incremental_vacuum({_VACUUM_PAGES})")
+        shard.commit()
+        stop.wait(COMPACT_PAUSE_SECONDS)
+
+
+def run_compaction(
+    older_than_days=COMPACT_AFTER_DAYS, max_gap=COMPACT_MAX_GAP_SECONDS, stop=None
+) -> dict:
+    """Compact every day not yet compacted that is older than ``older_than_days``.
+
+    One transaction per day, with a pause between days; ``stop`` (an Event)
+    ends the pass early and the next one resumes where it stopped.
+    """
+    stop = stop or threading.Event()
+    result = {"days": 0, "sessions_removed": 0}
+    if STORAGE_BACKEND == "bitmap" or older_than_days <= 0:
+        return result
+    cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+    conn = db._get_conn()
+    try:
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)", (_PROGRESS_KEY,)
+        )
+        conn.commit()
+        done = conn.execute("SELECT value FROM meta WHERE key = ?", (_PROGRESS_KEY,)).fetchone()[0]
+        after = date.fromordinal(done).isoformat() if done else ""
+        for shard in conn.shards(after or None, cutoff):
+            days = [r[0] for r in shard.execute(
+                "SELECT day FROM daily_rollups WHERE type = ? AND day > ? AND day <= ? "
+                "ORDER BY day",
+                (db.CUMULATIVE, after, cutoff),
+            )]
+            compacted = 0
+            for day in days:
+                if stop.is_set():
+                    return result
+                with conn:
+                    removed = compact_day(shard, day, max_gap)
+                    conn.execute(
+                        "UPDATE meta SET value = ? WHERE key = ?",
+                        (date.fromisoformat(day).toordinal(), _PROGRESS_KEY),
+                    )
+                    if removed:
+                        db._mark_changed(conn, history=True)
+                result["days"] += 1
+                result["sessions_removed"] += removed
+                compacted += removed
+                stop.wait(COMPACT_PAUSE_SECONDS)
+            if compacted:
+                _vacuum(shard, stop)
+        with conn:
+            conn.execute(
+                "UPDATE meta SET value = ? WHERE key = ?",
+                (date.fromisoformat(cutoff).toordinal(), _PROGRESS_KEY),
+            )
+    finally:
+        conn.close()
+    return result
+
+
+class CompactionJob:
+    """Background thread running run_compaction() every COMPACT_INTERVAL_SECONDS."""
+
+    def __init__(self, interval=COMPACT_INTERVAL_SECONDS, first_delay=60.0):
+        self.interval = interval
+        self.first_delay = first_delay
+        self.last_result = None
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = self.first_delay
+        while not self._stop.wait(delay):
+            try:
+                self.last_result = run_compaction(stop=self._stop)
+            except sqlite3.Error:
+                # Busy or locked: try again on the next round
+                self.errors += 1
+            delay = self.interval
+
+
+if __name__ == "__main__":
+    db.init_db()
+    result = run_compaction()
+    print(f"Compacted {result['days']} days, removed {result['sessions_removed']} sessions.")
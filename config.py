@@ -1,9 +1,17 @@
 import os
+import hashlib
 import json
+import tempfile
+import threading
+import time
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+# NAT_DATA_DIR runs a second copy on its own data (e.g. a collector next to a
+# tracker on the same machine)
+DATA_DIR = os.environ.get("NAT_DATA_DIR") or os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "data.db")
+# Sessions and their aggregates live in one file per month: shards/YYYY-MM.db
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
 SETTINGS_PATH = os.path.join(DATA_DIR, "settings.json")
 
 # Legacy path for automatic migration
@@ -12,12 +20,81 @@ _LEGACY_DB_PATH = os.path.join(DATA_DIR, "mouse_activity.db")
 # If input is idle for this many seconds, the session is closed
 IDLE_THRESHOLD_SECONDS = 3
 
+# Mouse moves closer together than this (seconds) are coalesced into one event
+EVENT_COALESCE_SECONDS = 0.05
+
 # Sessions shorter than this threshold (seconds) are discarded
 MIN_SESSION_DURATION = 0.5
 
+# "sessions" stores one row per session; "bitmap" stores per-second activity
+# bitmaps per day and type instead (see bitmaps.py)
+STORAGE_BACKEND = "sessions"
+
+# Background session writer: closed sessions are group-committed once this many
+# are queued, or at most this many seconds after the first one was queued
+WRITER_BATCH_SIZE = 64
+WRITER_FLUSH_INTERVAL = 2.0
+
+# Compaction of old history: sessions older than COMPACT_AFTER_DAYS that follow
+# the previous session of the same type within COMPACT_MAX_GAP_SECONDS are
+# merged into one row (per-day totals stay exact). The tracker runs it every
+# COMPACT_INTERVAL_SECONDS, pausing COMPACT_PAUSE_SECONDS between days.
+# COMPACT_AFTER_DAYS = 0 disables it.
+COMPACT_AFTER_DAYS = 30
+COMPACT_MAX_GAP_SECONDS = 5.0
+COMPACT_INTERVAL_SECONDS = 6 * 3600
+COMPACT_PAUSE_SECONDS = 0.25
+
+# Sessions in progress, published by the tracker for the dashboard's live view;
+# republished every LIVE_HEARTBEAT_SECONDS while one is open
+LIVE_STATE_PATH = os.path.join(DATA_DIR, "live.json")
+LIVE_HEARTBEAT_SECONDS = 10.0
+
+# Append-only log of the raw activity (100 ms slots) under ACTIVITY_LOG_DIR,
+# one file per day, from which sessions can be recomputed for another idle
+# threshold (see activity_log.py). Off by default; day files older than
+# ACTIVITY_LOG_RETENTION_DAYS are deleted (0 keeps them all)
+ACTIVITY_LOG_ENABLED = False
+ACTIVITY_LOG_DIR = os.path.join(DATA_DIR, "activity")
+ACTIVITY_LOG_RETENTION_DAYS = 90
+
+# Runtime metrics (/api/metrics), off by default. The tracker writes its own
+# to METRICS_SNAPSHOT_PATH every METRICS_SNAPSHOT_INTERVAL seconds for the
+# dashboard to pick up.
+METRICS_ENABLED = False
+METRICS_SNAPSHOT_PATH = os.path.join(DATA_DIR, "tracker_metrics.json")
+METRICS_SNAPSHOT_INTERVAL = 15.0
+
 # Flask dashboard
 DASHBOARD_HOST = "127.0.0.1"
 DASHBOARD_PORT = 5000
+# Worker threads of the dashboard server; each keeps its own read-only
+# database connections
+DASHBOARD_THREADS = 16
+# Serve the dashboard from a thread of the tracker (started the first time it
+# is opened) instead of a separate dashboard.py process
+DASHBOARD_IN_PROCESS = True
+
+# How often the tracker checks settings.json for changes saved by a dashboard
+# running in another process (only polled when DASHBOARD_IN_PROCESS is off)
+SETTINGS_POLL_SECONDS = 15.0
+
+# Collector mode (see collector.py). On the collector: COLLECTOR_ENABLED adds
+# POST /api/ingest to the dashboard, which must then listen on a reachable
+# DASHBOARD_HOST. On the other machines: COLLECTOR_URL (e.g.
+# "http://192.168.1.10:5000") makes the tracker push its sessions there every
+# PUSH_INTERVAL_SECONDS, in batches of up to PUSH_BATCH_SIZE, tagged with
+# HOST_NAME (None: the machine's name). COLLECTOR_TOKEN must be set, the same,
+# on both sides: without it the collector refuses every batch. With a
+# DASHBOARD_HOST other than loopback the whole dashboard asks for the token
+# too, except from the collector's own machine.
+COLLECTOR_ENABLED = False
+COLLECTOR_URL = None
+COLLECTOR_TOKEN = None
+HOST_NAME = None
+PUSH_INTERVAL_SECONDS = 30.0
+PUSH_BATCH_SIZE = 1000
+PUSH_STATE_PATH = os.path.join(DATA_DIR, "push_state.json")
 
 # Default colors
 COLOR_MOUSE = "#4CAF50"
@@ -32,21 +109,92 @@ _DEFAULT_SETTINGS = {
 }
 
 
-def load_settings():
-    settings = dict(_DEFAULT_SETTINGS)
+# Parsed settings.json, keyed on a hash of its bytes (an edit can keep the
+# size and land in the same mtime tick); listeners are called with the new
+# settings whenever they change
+_settings_lock = threading.Lock()
+_settings_cache = {"key": None, "settings": None}
+_settings_listeners = []
+_notified_key = [None]
+_notify_lock = threading.Lock()
+
+
+def _read_settings():
+    """(key, bytes) of settings.json, or (None, None) if there is none."""
     try:
-        with open(SETTINGS_PATH, "r") as f:
-            saved = json.load(f)
-        settings.update(saved)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return settings
+        with open(SETTINGS_PATH, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, None
+    return hashlib.sha1(data).digest(), data
+
+
+def _settings_key():
+    return _read_settings()[0]
+
+
+def load_settings():
+    """Saved settings over the defaults; the file is parsed again only when it changes."""
+    key, data = _read_settings()
+    with _settings_lock:
+        if _settings_cache["settings"] is None or key != _settings_cache["key"]:
+            settings = dict(_DEFAULT_SETTINGS)
+            if data is not None:
+                try:
+                    settings.update(json.loads(data))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    pass
+            _settings_cache["key"] = key
+            _settings_cache["settings"] = settings
+        return dict(_settings_cache["settings"])
 
 
 def save_settings(settings):
+    """Write settings.json atomically and notify this process's listeners."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    with open(SETTINGS_PATH, "w") as f:
+    # A name of its own, so two threads saving at once never share a temp file
+    fd, tmp = tempfile.mkstemp(prefix="settings.", suffix=".tmp", dir=DATA_DIR)
+    with os.fdopen(fd, "w") as f:
         json.dump(settings, f, indent=2)
+    for attempt in range(5):
+        try:
+            os.replace(tmp, SETTINGS_PATH)
+            break
+        except PermissionError:
+            # Windows: the other process is reading the old file right now
+            if attempt == 4:
+                raise
+            time.sleep(0.05)
+    check_settings()
+
+
+def on_settings_change(callback):
+    """Call ``callback(settings)`` whenever the saved settings change."""
+    _settings_listeners.append(callback)
+
+
+def check_settings():
+    """Notify the listeners if settings.json changed since they last heard."""
+    with _notify_lock:
+        key = _settings_key()
+        if key == _notified_key[0]:
+            return
+        _notified_key[0] = key
+    settings = load_settings()
+    for callback in _settings_listeners:
+        callback(settings)
+
+
+def watch_settings(interval=SETTINGS_POLL_SECONDS):
+    """Poll settings.json from a daemon thread, for changes saved by another process."""
+    _notified_key[0] = _settings_key()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            check_settings()
+
+    threading.Thread(target=run, name="settings-watch", daemon=True).start()
 
 
 def get_idle_threshold():
@@ -1,15 +1,53 @@
 import calendar
-from datetime import date, timedelta
-
-from flask import Flask, jsonify, redirect, render_template, request, url_for
-
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from flask import (
+    Flask, g, jsonify, redirect, render_template, request, stream_with_context, url_for,
+)
+from werkzeug.serving import BaseWSGIServer
+
+import analytics
 import config
 import db
-from config import DASHBOARD_HOST, DASHBOARD_PORT
+import live
+import metrics
+from config import DASHBOARD_HOST, DASHBOARD_PORT, DASHBOARD_THREADS, METRICS_SNAPSHOT_INTERVAL
 
 app = Flask(__name__)
 app.config["TEMPLATES_AUTO_RELOAD"] = True
-app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
+# Static URLs carry the file's mtime (see static_url), so they can be cached for long
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 365 * 24 * 3600
+
+MAX_PAGE_SIZE = 10000
+# Set when the app is served from inside the tracker process (DashboardServer)
+_embedded = False
+# /api/stream: how often the change token and live state are checked, and the
+# longest silence before a keep-alive comment
+STREAM_POLL_SECONDS = 1.0
+STREAM_KEEPALIVE_SECONDS = 15.0
+# Open streams each hold a worker thread; past half the workers (see
+# make_server) /api/stream answers 503, so other requests always find one
+_stream_slots = threading.BoundedSemaphore(max(1, DASHBOARD_THREADS // 2))
+# Set by server_close(): open streams end within STREAM_POLL_SECONDS, so the
+# workers they hold can be joined
+_stopping = threading.Event()
+_SESSION_FIELDS = ("session_id", "type", "start_time", "end_time", "duration")
+
+
+@app.template_global()
+def static_url(filename):
+    """url_for('static') with the file's mtime as a version, so edits bust the cache."""
+    path = os.path.join(app.static_folder, filename)
+    return url_for("static", filename=filename, v=int(os.path.getmtime(path)))
 
 
 def _format_duration(seconds):
@@ -24,14 +62,37 @@ def _format_duration(seconds):
     return f"{s}s"
 
 
-def _build_summary(date_str, session_type=None, date_range=None):
-    if date_range:
-        summary = db.get_summary_for_range(date_range[0], date_range[1], session_type)
+def _format_summary(summary):
+    return {
+        **summary,
+        "total_duration_formatted": _format_duration(summary["total_duration"]),
+        "avg_duration_formatted": _format_duration(summary["avg_duration"]),
+    }
+
+
+def _conditional_json(compute, *dates):
+    return _conditional(lambda: jsonify(compute()), *dates)
+
+
+def _conditional(make_response, *dates):
+    """Response with ETag/Last-Modified; 304 without querying if unchanged."""
+    token, modified = db.get_change_token(*dates)
+    etag = hashlib.sha1(f"{request.full_path}|{token}".encode()).hexdigest()
+    modified = datetime.fromtimestamp(modified, timezone.utc) if modified else None
+    if etag in request.if_none_match or (
+        not request.if_none_match
+        and modified is not None
+        and request.if_modified_since is not None
+        and modified <= request.if_modified_since
+    ):
+        response = app.response_class(status=304)
     else:
-        summary = db.get_summary_for_date(date_str, session_type)
-    summary["total_duration_formatted"] = _format_duration(summary["total_duration"])
-    summary["avg_duration_formatted"] = _format_duration(summary["avg_duration"])
-    return summary
+        response = make_response()
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 def _week_bounds(date_str):
@@ -49,18 +110,17 @@ def _month_bounds(date_str):
     return first.isoformat(), last.isoformat()
 
 
+def _year_bounds(date_str):
+    d = date.fromisoformat(date_str)
+    return d.replace(month=1, day=1).isoformat(), d.replace(month=12, day=31).isoformat()
+
+
 def _render_dashboard(view_mode, date_str, start_date, end_date, nav_label):
     settings = config.load_settings()
-    date_range = (start_date, end_date) if view_mode != "day" else None
-    mouse_summary = _build_summary(date_str, "mouse", date_range)
-    keyboard_summary = _build_summary(date_str, "keyboard", date_range)
-    if date_range:
-        cumulative_summary = db.get_merged_summary_for_range(start_date, end_date)
-    else:
-        cumulative_summary = db.get_merged_summary_for_date(date_str)
-    cumulative_summary["total_duration_formatted"] = _format_duration(cumulative_summary["total_duration"])
-    cumulative_summary["avg_duration_formatted"] = _format_duration(cumulative_summary["avg_duration"])
-    dates = db.get_available_dates()
+    view = db.get_view_summaries(start_date, end_date)
+    mouse_summary = _format_summary(view["mouse"])
+    keyboard_summary = _format_summary(view["keyboard"])
+    cumulative_summary = _format_summary(view["cumulative"])
     return render_template(
         "index.html",
         view_mode=view_mode,
@@ -71,7 +131,6 @@ def _render_dashboard(view_mode, date_str, start_date, end_date, nav_label):
         mouse_summary=mouse_summary,
         keyboard_summary=keyboard_summary,
         cumulative_summary=cumulative_summary,
-        dates=dates,
         colors={
             "mouse": settings["color_mouse"],
             "keyboard": settings["color_keyboard"],
@@ -106,40 +165,359 @@ def show_month(date_str):
     return _render_dashboard("month", date_str, start, end, nav_label)
 
 
+@app.route("/year/<date_str>")
+def show_year(date_str):
+    start, end = _year_bounds(date_str)
+    nav_label = str(date.fromisoformat(date_str).year)
+    return _render_dashboard("year", date_str, start, end, nav_label)
+
+
 # --- API endpoints ---
 
+@app.route("/api/day/<date_str>")
+def api_day(date_str):
+    return _conditional_json(lambda: db.get_day_bundle(date_str), date_str)
+
+
 @app.route("/api/sessions/<date_str>")
 def api_sessions(date_str):
     session_type = request.args.get("type")
-    return jsonify(db.get_sessions_for_date(date_str, session_type))
+    return _conditional_json(lambda: db.get_sessions_for_date(date_str, session_type), date_str)
 
 
 @app.route("/api/sessions/<start_date>/<end_date>")
 def api_sessions_range(start_date, end_date):
+    """Sessions of a range, either paginated or streamed.
+
+    ``?after=<cursor>&limit=<n>`` returns one keyset page with ``next_after``, the
+    cursor of the next one (410 if an old-style numeric cursor names a deleted session);
+    ``?format=ndjson`` or ``?format=csv`` streams every row. Without either the
+    response is still a plain JSON array, streamed row by row.
+    """
     session_type = request.args.get("type")
-    return jsonify(db.get_sessions_for_range(start_date, end_date, session_type))
+    fmt = request.args.get("format", "json")
+    if "after" in request.args or "limit" in request.args:
+        after = request.args.get("after") or None
+        limit = min(request.args.get("limit", db.SESSION_PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+        try:
+            return _conditional_json(
+                lambda: db.get_sessions_page(start_date, end_date, session_type, after, max(limit, 1)),
+                start_date, end_date,
+            )
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 410
+        except ValueError:
+            return jsonify({"error": f"bad cursor: {after}"}), 400
+
+    def stream():
+        rows = db.iter_sessions_for_range(start_date, end_date, session_type)
+        if fmt == "ndjson":
+            return app.response_class(_ndjson(rows), mimetype="application/x-ndjson")
+        if fmt == "csv":
+            return app.response_class(
+                _csv(rows), mimetype="text/csv",
+                headers={"Content-Disposition": f"attachment; filename=sessions_{start_date}_{end_date}.csv"},
+            )
+        return app.response_class(_json_array(rows), mimetype="application/json")
+
+    return _conditional(stream, start_date, end_date)
+
+
+def _json_array(rows):
+    yield "["
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(row)
+    yield "]"
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def _csv(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=_SESSION_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+@app.route("/api/cumulative/<date_str>")
+def api_cumulative(date_str):
+    return _conditional_json(lambda: db.get_cumulative_intervals(date_str), date_str)
+
+
+@app.route("/api/timeline/<start_date>/<end_date>")
+def api_timeline(start_date, end_date):
+    resolution = request.args.get("resolution", 60, type=int)
+    if resolution not in db.TIMELINE_RESOLUTIONS:
+        resolution = 60
+    return _conditional_json(
+        lambda: db.get_timeline_buckets(start_date, end_date, resolution), start_date, end_date
+    )
 
 
 @app.route("/api/summary/<date_str>")
 def api_summary(date_str):
     session_type = request.args.get("type")
-    return jsonify(db.get_summary_for_date(date_str, session_type))
+    return _conditional_json(lambda: db.get_summary_for_date(date_str, session_type), date_str)
 
 
 @app.route("/api/summary/<start_date>/<end_date>")
 def api_summary_range(start_date, end_date):
     session_type = request.args.get("type")
-    return jsonify(db.get_summary_for_range(start_date, end_date, session_type))
+    return _conditional_json(
+        lambda: db.get_summary_for_range(start_date, end_date, session_type), start_date, end_date
+    )
 
 
 @app.route("/api/daily-totals/<start_date>/<end_date>")
 def api_daily_totals(start_date, end_date):
-    return jsonify(db.get_merged_daily_totals(start_date, end_date))
+    return _conditional_json(
+        lambda: db.get_merged_daily_totals(start_date, end_date), start_date, end_date
+    )
+
+
+@app.route("/api/heatmap/<start_date>/<end_date>")
+def api_heatmap(start_date, end_date):
+    session_type = request.args.get("type")
+    return _conditional_json(
+        lambda: db.get_weekday_hour_heatmap(start_date, end_date, session_type),
+        start_date, end_date,
+    )
+
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events with the changes to one day (default today).
+
+    ``session``: a newly committed session (its id is the event id, so a
+    reconnecting EventSource resumes through Last-Event-ID); ``summary``: the
+    day's three stat cards, after every commit; ``live``: the tracker's
+    sessions in progress, whenever they change; ``reload``: the storage
+    backend cannot list new sessions, fetch the day again; ``day``: a stream
+    that followed today passed midnight, and ends (data: the new date).
+    ``?after=<session_id>`` skips the sessions the page already shows.
+    """
+    day = request.args.get("date") or date.today().isoformat()
+    after = request.headers.get("Last-Event-ID", type=int)
+    if after is None:
+        after = request.args.get("after", type=int)
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"error": "too many open streams"}), 503, {"Retry-After": "30"}
+    response = app.response_class(
+        stream_with_context(_stream_events(day, after)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # The server closes the response however the stream ended, even unstarted
+    response.call_on_close(_stream_slots.release)
+    return response
+
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _stream_events(day, after):
+    token = live_state = None
+    last_sent = time.monotonic()
+    follows_today = day == date.today().isoformat()
+    while not _stopping.is_set():
+        today = date.today().isoformat()
+        if follows_today and today != day:
+            yield _sse("day", {"date": today})
+            return
+        out = []
+        new_token = db.get_change_token(day)[0]
+        if new_token != token:
+            first, token = token is None, new_token
+            sessions = db.get_sessions_since(day, after)
+            if sessions is None and not first:
+                out.append(_sse("reload", {}))
+            for s in sessions or ():
+                after = s["session_id"]
+                out.append(_sse("session", s, after))
+            view = db.get_view_summaries(day, day)
+            out.append(_sse("summary", {
+                k: _format_summary(view[k]) for k in ("mouse", "keyboard", "cumulative")
+            }))
+        state = live.read_state()
+        types = state["types"] if state else {}
+        if types != live_state:
+            live_state = types
+            out.append(_sse("live", types))
+        if out:
+            yield "".join(out)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > STREAM_KEEPALIVE_SECONDS:
+            # Comment line: keeps proxies from closing the connection and
+            # surfaces a disconnected client as a write error
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        _stopping.wait(STREAM_POLL_SECONDS)
 
 
 @app.route("/api/dates")
 def api_dates():
-    return jsonify(db.get_available_dates())
+    return _conditional_json(db.get_available_dates)
+
+
+# --- Long-range analytics ---
+
+@app.route("/api/analytics/overlap/<start_date>/<end_date>")
+def api_analytics_overlap(start_date, end_date):
+    return _conditional_json(
+        lambda: analytics.get_overlap(start_date, end_date), start_date, end_date
+    )
+
+
+@app.route("/api/analytics/heatmap/<start_date>/<end_date>")
+def api_analytics_heatmap(start_date, end_date):
+    session_type = request.args.get("type")
+    return _conditional_json(
+        lambda: analytics.get_heatmap(start_date, end_date, session_type), start_date, end_date
+    )
+
+
+@app.route("/api/analytics/percentiles/<start_date>/<end_date>")
+def api_analytics_percentiles(start_date, end_date):
+    session_type = request.args.get("type")
+    return _conditional_json(
+        lambda: analytics.get_duration_percentiles(start_date, end_date, session_type),
+        start_date, end_date,
+    )
+
+
+@app.route("/api/analytics/rolling/<start_date>/<end_date>")
+def api_analytics_rolling(start_date, end_date):
+    window = max(1, min(request.args.get("window", 7, type=int), 365))
+    return _conditional_json(
+        lambda: analytics.get_rolling_totals(start_date, end_date, window), start_date, end_date
+    )
+
+
+# --- Collector ---
+
+if config.COLLECTOR_ENABLED:
+    import hmac
+    import ipaddress
+
+    import collector
+
+    TOKEN_COOKIE = "nat_token"
+
+    if not config.COLLECTOR_TOKEN:
+        logging.getLogger(__name__).error(
+            "COLLECTOR_ENABLED without COLLECTOR_TOKEN: /api/ingest refuses every batch"
+        )
+
+    def _token_ok(token):
+        return bool(config.COLLECTOR_TOKEN) and hmac.compare_digest(
+            (token or "").encode(), config.COLLECTOR_TOKEN.encode()
+        )
+
+    def _is_loopback(host):
+        if host == "localhost":
+            return True
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return address.is_loopback or bool(
+            getattr(address, "ipv4_mapped", None) and address.ipv4_mapped.is_loopback
+        )
+
+    if not _is_loopback(DASHBOARD_HOST):
+        # Reachable from the network: the dashboard, its APIs and POST /settings
+        # want the collector token too, except from this machine. A browser
+        # opens it once with ?token=... and then carries it in a cookie.
+        @app.before_request
+        def _require_token():
+            if request.endpoint in ("api_ingest", "static") or _is_loopback(request.remote_addr):
+                return None
+            if _token_ok(request.headers.get(collector.TOKEN_HEADER)) or _token_ok(
+                request.cookies.get(TOKEN_COOKIE)
+            ):
+                return None
+            if _token_ok(request.args.get("token")):
+                g.set_token_cookie = True
+                return None
+            return jsonify({"error": "collector token required"}), 403
+
+        @app.after_request
+        def _remember_token(response):
+            if g.get("set_token_cookie"):
+                response.set_cookie(
+                    TOKEN_COOKIE, config.COLLECTOR_TOKEN, max_age=365 * 86400,
+                    httponly=True, samesite="Strict",
+                )
+            return response
+
+    @app.route("/api/ingest", methods=["POST"])
+    def api_ingest():
+        """Sessions pushed by the tracker of another machine (see collector.py)."""
+        if not config.COLLECTOR_TOKEN:
+            return jsonify({"error": "COLLECTOR_TOKEN is not set on the collector"}), 403
+        if not _token_ok(request.headers.get(collector.TOKEN_HEADER)):
+            return jsonify({"error": "bad token"}), 403
+        # Read only bodies of a known, bounded size (a gzip body is capped
+        # again once decompressed)
+        if request.content_length is None:
+            return jsonify({"error": "missing Content-Length"}), 411
+        if request.content_length > collector.MAX_BATCH_BYTES:
+            return jsonify({"error": "batch too large"}), 413
+        try:
+            host, sessions = collector.decode_batch(
+                request.get_data(), request.headers.get("Content-Encoding")
+            )
+            result = db.ingest_sessions(host, sessions)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        metrics.inc("nat_ingested_sessions_total", result["inserted"], host=host)
+        return jsonify(result)
+
+
+# --- Metrics ---
+
+if metrics.ENABLED:
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_timing(response):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        # Not set when an earlier before_request answered (e.g. the collector token)
+        if "request_started" in g:
+            metrics.observe(
+                "nat_http_request_seconds", time.perf_counter() - g.request_started, route=route
+            )
+        metrics.inc("nat_http_requests_total", route=route, status=response.status_code)
+        return response
+
+    @app.route("/api/metrics")
+    def api_metrics():
+        """Prometheus text format; ``?format=json`` for the same samples as JSON."""
+        if _embedded:
+            # Same process and registry as the tracker
+            samples = metrics.snapshot("tracker")
+        else:
+            # A tracker snapshot older than a few intervals means the tracker is gone
+            samples = metrics.snapshot("dashboard") + metrics.read_snapshot(
+                max_age=3 * METRICS_SNAPSHOT_INTERVAL
+            )
+        if request.args.get("format") == "json":
+            return jsonify(samples)
+        return app.response_class(
+            metrics.render_prometheus(samples), mimetype="text/plain; version=0.0.4"
+        )
 
 
 # --- Settings ---
@@ -177,6 +555,116 @@ def settings_save():
     return redirect(url_for("index"))
 
 
+# --- Serving ---
+
+class _PooledWSGIServer(BaseWSGIServer):
+    """werkzeug's server with a fixed pool of worker threads.
+
+    The development server starts a thread per request, so the per-thread
+    read-only connections of db._get_conn would be reopened every time.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, threads):
+        # Before binding: werkzeug calls server_close() when the port is taken
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="dashboard-worker")
+        super().__init__(host, port, app)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        _stopping.set()
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def make_server(host=DASHBOARD_HOST, port=DASHBOARD_PORT, threads=DASHBOARD_THREADS):
+    """The dashboard's server: werkzeug with a pool of ``threads`` workers.
+
+    Each worker keeps its own pooled database connections. An open
+    /api/stream holds a worker for as long as the page stays open, or until
+    server_close(). Meant for a personal dashboard on one machine or a LAN,
+    not as a public-facing server.
+    """
+    global _stream_slots
+    _stream_slots = threading.BoundedSemaphore(max(1, threads // 2))
+    _stopping.clear()
+    return _PooledWSGIServer(host, port, threads)
+
+
+class DashboardServer:
+    """Serves the app from a daemon thread of the calling process.
+
+    Used by the tracker (DASHBOARD_IN_PROCESS), which has already run
+    db.init_db() and shares its connections and query cache with the app.
+    ``ready`` is set once the socket is listening, or when binding failed
+    (``error``), e.g. because a standalone dashboard already holds the port.
+    """
+
+    def __init__(self, host=DASHBOARD_HOST, port=DASHBOARD_PORT):
+        self.host = host
+        self.port = port
+        self.ready = threading.Event()
+        self.error = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        global _embedded
+        _embedded = True
+        # No per-request log lines inside the tracker
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+
+    def wait_ready(self, timeout=5.0) -> bool:
+        return self.ready.wait(timeout) and self.error is None
+
+    def stop(self, timeout=5.0):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._server = make_server(self.host, self.port)
+        except (OSError, SystemExit) as e:
+            # werkzeug reports a port in use by exiting rather than raising
+            self.error = e
+            return
+        finally:
+            self.ready.set()
+        self._server.serve_forever()
+
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Nerd Activity Tracker dashboard")
+    parser.add_argument("--dev", action="store_true", help="Flask's development server")
+    parser.add_argument("--threads", type=int, default=DASHBOARD_THREADS)
+    args = parser.parse_args()
     db.init_db()
-    app.run(host=DASHBOARD_HOST, port=DASHBOARD_PORT, debug=False)
+    if args.dev:
+        app.run(host=DASHBOARD_HOST, port=DASHBOARD_PORT, debug=False)
+    else:
+        server = make_server(threads=args.threads)
+        print(f"Serving on http://{DASHBOARD_HOST}:{DASHBOARD_PORT} ({args.threads} threads)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,217 +1,1541 @@
+import functools
+import logging
 import os
+import queue
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime
 
-from config import DATA_DIR, DB_PATH, MIN_SESSION_DURATION, _LEGACY_DB_PATH
+from config import (
+    DATA_DIR, DB_PATH, MIN_SESSION_DURATION, PUSH_BATCH_SIZE, SHARD_DIR, STORAGE_BACKEND,
+    WRITER_BATCH_SIZE, WRITER_FLUSH_INTERVAL, _LEGACY_DB_PATH,
+)
+import bitmaps
+import metrics
+from summary import CUMULATIVE, summarize as _summary
 
 
-def _get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=5)
+# Read-only connections are pooled per thread (see _get_conn), so their page
+# cache, memory map and prepared statements carry over from one query to the
+# next. A monthly shard is well under the mmap size, so reads are served from
+# the mapping and the page cache can stay small.
+READER_MMAP_SIZE = 64 * 1024 * 1024
+READER_CACHE_KIB = 4096
+READER_CACHED_STATEMENTS = 256
+
+
+def _connect(path, readonly=False, wal=True):
+    if readonly:
+        conn = sqlite3.connect(path, timeout=5, cached_statements=READER_CACHED_STATEMENTS)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {READER_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{READER_CACHE_KIB}")
+    else:
+        conn = sqlite3.connect(path, timeout=5)
+        if wal:
+            conn.execute("PRAGMA journal_mode=WAL;")
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
 
-def init_db():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    # Migrate legacy database name (mouse_activity.db -> data.db)
+# --- Monthly shards ---
+#
+# Sessions, rollups and cumulative intervals are all keyed by day, so each month
+# lives in its own file (SHARD_DIR/YYYY-MM.db) and a range query fans out over
+# the months it covers. Only the current month is written in the normal course
+# of things; past months are sealed (rollback journal) once they are over.
+# data.db keeps what is global: the change markers and the bitmap backend.
+
+# Session ids are (year * 12 + month - 1) << 32 plus a per-shard sequence, so
+# they stay unique across shards and point back at the shard that holds them
+_ID_BITS = 32
+
+_local = threading.local()
+
+
+def _shard_path(month):
+    return os.path.join(SHARD_DIR, f"{month}.db")
+
+
+def _shard_months() -> list[str]:
     try:
-        if os.path.exists(_LEGACY_DB_PATH) and not os.path.exists(DB_PATH):
-            os.rename(_LEGACY_DB_PATH, DB_PATH)
-    except OSError:
-        pass
-    conn = _get_conn()
+        names = os.listdir(SHARD_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(n[:-3] for n in names if len(n) == 10 and n.endswith(".db"))
+
+
+def _current_month():
+    return date.today().isoformat()[:7]
+
+
+def _id_base(month):
+    return (int(month[:4]) * 12 + int(month[5:7]) - 1) << _ID_BITS
+
+
+def _id_day(session_id):
+    """First day of the month whose shard allocated ``session_id``."""
+    year, month = divmod(session_id >> _ID_BITS, 12)
+    return f"{year:04d}-{month + 1:02d}-01"
+
+
+def _init_shard(conn):
+    """Create the per-month schema; returns whether the aggregate tables already existed."""
     conn.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
             session_id  INTEGER PRIMARY KEY AUTOINCREMENT,
             type        TEXT NOT NULL DEFAULT 'mouse',
             start_time  TEXT NOT NULL,
             end_time    TEXT NOT NULL,
-            duration    REAL NOT NULL
+            duration    REAL NOT NULL,
+            day         TEXT,
+            start_ts    REAL,
+            end_ts      REAL,
+            host        TEXT NOT NULL DEFAULT '',
+            source_id   INTEGER,
+            parts       BLOB
+        )
+    """)
+    _add_host_columns(conn)
+    _add_parts_column(conn)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_day_start
+        ON sessions(day, start_ts)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_type_day_start
+        ON sessions(type, day, start_ts)
+    """)
+    aggregates_exist = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master "
+        "WHERE type = 'table' AND name IN ('rollups', 'daily_rollups', 'merged_intervals')"
+    ).fetchone()[0] == 3
+    # Pre-aggregated totals per (day, hour, type); type 'any' holds the
+    # cumulative (mouse OR keyboard) series, attributed to the hour it starts in
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollups (
+            day             TEXT NOT NULL,
+            hour            INTEGER NOT NULL,
+            type            TEXT NOT NULL,
+            total_duration  REAL NOT NULL DEFAULT 0,
+            session_count   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour, type)
+        ) WITHOUT ROWID
+    """)
+    # Same totals summed per day, so long ranges (year calendar) read one row per day
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            day             TEXT NOT NULL,
+            type            TEXT NOT NULL,
+            total_duration  REAL NOT NULL DEFAULT 0,
+            session_count   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (type, day)
+        ) WITHOUT ROWID
+    """)
+    # Cumulative (mouse OR keyboard) timeline: disjoint intervals per day,
+    # merged incrementally as sessions are written
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS merged_intervals (
+            interval_id INTEGER PRIMARY KEY,
+            day         TEXT NOT NULL,
+            start_ts    REAL NOT NULL,
+            end_ts      REAL NOT NULL,
+            start_time  TEXT NOT NULL,
+            end_time    TEXT NOT NULL
         )
     """)
-    # Migration: add type column if the DB predates it
-    try:
-        conn.execute("ALTER TABLE sessions ADD COLUMN type TEXT NOT NULL DEFAULT 'mouse'")
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass
     conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_sessions_start
-        ON sessions(start_time)
+        CREATE INDEX IF NOT EXISTS idx_merged_day_start
+        ON merged_intervals(day, start_ts)
     """)
+    return aggregates_exist
+
+
+def _add_host_columns(conn):
+    """Sessions pushed by other machines (collector.py) carry their host name
+    and their id there; local sessions have host '' and no source_id."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+    if "host" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN host TEXT NOT NULL DEFAULT ''")
+        conn.execute("ALTER TABLE sessions ADD COLUMN source_id INTEGER")
     conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_sessions_type
-        ON sessions(type)
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_host_source
+        ON sessions(host, source_id) WHERE source_id IS NOT NULL
     """)
+
+
+def _add_parts_column(conn):
+    """A row merged by compaction keeps its members' spans in ``parts`` (see _row_spans)."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+    if "parts" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN parts BLOB")
+
+
+def _pack_parts(spans) -> bytes:
+    values = array("d", (ts for span in spans for ts in span))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _row_spans(start_ts, end_ts, parts):
+    """(start_ts, end_ts) spans a session row was active in.
+
+    A row merged by compaction spans the gaps between its members, so anything
+    adding up or drawing active time must use its parts instead.
+    """
+    if parts is None:
+        return ((start_ts, end_ts),)
+    values = array("d")
+    values.frombytes(parts)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return tuple(zip(values[::2], values[1::2]))
+
+
+def _create_shard(month):
+    """Build an empty shard under a temporary name and move it into place,
+    so readers listing SHARD_DIR never see a file without its schema."""
+    path = _shard_path(month)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    # Past months (backfills) are born sealed; init_db seals the others once
+    # their month is over
+    conn = _connect(tmp, wal=month >= _current_month())
+    # Lets compaction return freed pages with PRAGMA incremental_vacuum
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    _init_shard(conn)
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES ('sessions', ?)", (_id_base(month),)
+    )
     conn.commit()
     conn.close()
+    if os.path.exists(path):
+        os.remove(tmp)
+    else:
+        os.replace(tmp, path)
 
 
-def save_session(start_time: datetime, end_time: datetime, session_type: str = "mouse"):
+def _seal_shard(month) -> bool:
+    """Switch a past month back to a rollback journal so it can be opened read-only."""
+    conn = sqlite3.connect(_shard_path(month), timeout=0)
+    try:
+        # Answers "wal" instead of failing while another connection has it open
+        return conn.execute("PRAGMA journal_mode=DELETE;").fetchone()[0] == "delete"
+    except sqlite3.OperationalError:
+        return False  # still open elsewhere; retried on the next start
+    finally:
+        conn.close()
+
+
+class _ShardedConnection:
+    """data.db plus the monthly shards, opened lazily and committed together.
+
+    ``execute``/``executemany`` run on data.db. ``shard(day)`` returns the
+    connection for the month holding ``day`` and ``shards(start, end)`` yields
+    those of every existing month in the range, oldest first. Writable handles
+    create missing shards; read-only ones get an empty in-memory stand-in.
+    """
+
+    def __init__(self, readonly=False):
+        self.readonly = readonly
+        self._main = None
+        self._shards = {}
+        self._owned = []
+        self._empty = None
+
+    @property
+    def main(self):
+        if self._main is None:
+            self._main = _connect(DB_PATH, readonly=self.readonly)
+            self._owned.append(self._main)
+        return self._main
+
+    def execute(self, *args):
+        return self.main.execute(*args)
+
+    def executemany(self, *args):
+        return self.main.executemany(*args)
+
+    def shard(self, day):
+        month = day[:7]
+        conn = self._shards.get(month)
+        if conn is None:
+            conn = self._open_shard(month)
+        return conn
+
+    def shards(self, start_date=None, end_date=None):
+        for month in _shard_months():
+            if (start_date and month < start_date[:7]) or (end_date and month > end_date[:7]):
+                continue
+            yield self.shard(month)
+
+    def _open_shard(self, month):
+        path = _shard_path(month)
+        if not self.readonly:
+            if not os.path.exists(path):
+                _create_shard(month)
+            conn = _connect(path, wal=month >= _current_month())
+        elif not os.path.exists(path):
+            # Not kept in _shards: the month's file may be created later on
+            if self._empty is None:
+                self._empty = _connect(":memory:")
+                _init_shard(self._empty)
+            return self._empty
+        else:
+            conn = _connect(path, readonly=True)
+        self._shards[month] = conn
+        self._owned.append(conn)
+        return conn
+
+    def _writable(self):
+        # Shards first: data.db holds the change markers, which must not move
+        # until the data they describe is committed
+        return [c for c in self._owned if c is not self._main] + (
+            [self._main] if self._main is not None else []
+        )
+
+    def commit(self):
+        for conn in self._writable():
+            conn.commit()
+
+    def rollback(self):
+        for conn in self._writable():
+            conn.rollback()
+
+    def close(self):
+        if self.readonly:
+            return  # pooled: stays open for the thread's next query
+        for conn in self._owned:
+            conn.close()
+        self._owned.clear()
+        self._shards.clear()
+        self._main = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+def _get_conn(readonly=False):
+    """A new writable handle, or the calling thread's pooled read-only one.
+
+    Read-only handles are opened once per thread and kept: close() leaves them
+    open, and they go away with their thread. Servers should therefore use a
+    fixed pool of worker threads (see dashboard.serve).
+    """
+    if not readonly:
+        return _ShardedConnection()
+    conn = getattr(_local, "reader", None)
+    if conn is None:
+        conn = _local.reader = _ShardedConnection(readonly=True)
+    return conn
+
+
+# Schema version of data.db (PRAGMA user_version): init_db runs the steps of
+# _MIGRATIONS past the stored version, so an up-to-date database costs one
+# PRAGMA read. Schema changes are new steps appended to the list.
+def _migrate_to_sharded(conn):
+    """Version 1: meta and bitmap tables, monthly shards with their aggregates.
+
+    Also brings any older layout up to date: the single-file database (with or
+    without the type/day columns) is split into shards, and shards missing
+    their aggregates get them rebuilt.
+    """
+    main = conn.main
+    bitmaps.create_table(main)
+    # Change markers read by the query cache and the dashboard's ETags:
+    # write_* moves on every write, history_* only when a past day changes
+    main.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key     TEXT PRIMARY KEY,
+            value   INTEGER NOT NULL
+        )
+    """)
+    main.executemany(
+        "INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)",
+        [(k,) for k in (*_CHANGE_KEYS, _SEALED_KEY)],
+    )
+    main.commit()
+    if main.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+    ).fetchone():
+        # Single-file database from before the monthly shards
+        columns = {r["name"] for r in main.execute("PRAGMA table_info(sessions)")}
+        if "type" not in columns:
+            main.execute("ALTER TABLE sessions ADD COLUMN type TEXT NOT NULL DEFAULT 'mouse'")
+            main.commit()
+        _migrate_day_columns(main)
+        _split_into_shards(conn)
+    rebuilt = False
+    for shard in conn.shards():
+        if not _init_shard(shard):
+            _rebuild_shard(shard)
+            rebuilt = True
+        shard.commit()
+    if rebuilt:
+        with conn:
+            _mark_changed(conn, history=True)
+
+
+def _migrate_host_columns(conn):
+    """Version 2: host and source_id columns for sessions ingested by a collector."""
+    for shard in conn.shards():
+        _add_host_columns(shard)
+        shard.commit()
+
+
+def _migrate_parts_column(conn):
+    """Version 3: member spans of the rows merged by compaction."""
+    for shard in conn.shards():
+        _add_parts_column(shard)
+        shard.commit()
+
+
+_MIGRATIONS = [_migrate_to_sharded, _migrate_host_columns, _migrate_parts_column]
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+# Month index (year * 12 + month - 1) up to which shards are sealed, in meta
+_SEALED_KEY = "sealed_through"
+
+
+def _month_index(month):
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def init_db():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    # Migrate legacy database name (mouse_activity.db -> data.db)
+    try:
+        if os.path.exists(_LEGACY_DB_PATH) and not os.path.exists(DB_PATH):
+            os.rename(_LEGACY_DB_PATH, DB_PATH)
+    except OSError:
+        pass
+    conn = _get_conn()
+    try:
+        version = conn.main.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            _MIGRATIONS[target - 1](conn)
+            conn.main.execute(f"PRAGMA user_version = {target}")
+            conn.main.commit()
+        sealed = conn.main.execute(
+            "SELECT value FROM meta WHERE key = ?", (_SEALED_KEY,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    # Past months are sealed once, on the first start after the month ends
+    last_month = _month_index(_current_month()) - 1
+    if sealed < last_month:
+        past = [m for m in _shard_months() if m < _current_month()]
+        if all([_seal_shard(m) for m in past]):
+            conn = _get_conn()
+            with conn:
+                conn.execute(
+                    "UPDATE meta SET value = ? WHERE key = ?", (last_month, _SEALED_KEY)
+                )
+            conn.close()
+
+
+def _migrate_day_columns(conn):
+    """Add and backfill the day / start_ts / end_ts columns on older databases."""
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(sessions)")}
+    for name, decl in (("day", "TEXT"), ("start_ts", "REAL"), ("end_ts", "REAL")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE sessions ADD COLUMN {name} {decl}")
+    rows = conn.execute(
+        "SELECT session_id, start_time, end_time FROM sessions WHERE day IS NULL"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE sessions SET day = ?, start_ts = ?, end_ts = ? WHERE session_id = ?",
+        (
+            (r["start_time"][:10],
+             datetime.fromisoformat(r["start_time"]).timestamp(),
+             datetime.fromisoformat(r["end_time"]).timestamp(),
+             r["session_id"])
+            for r in rows
+        ),
+    )
+    conn.commit()
+
+
+def _split_into_shards(conn):
+    """Move the sessions of a single-file database into monthly shards.
+
+    Ids are reassigned in the target shard's range (in start order, so a rerun
+    after an interruption rewrites the same rows); the aggregates are rebuilt
+    per shard and the old tables are dropped from data.db at the end.
+    """
+    main = conn.main
+    main.execute("CREATE INDEX IF NOT EXISTS idx_sessions_day_start ON sessions(day, start_ts)")
+    months = [r[0] for r in main.execute(
+        "SELECT DISTINCT substr(day, 1, 7) FROM sessions WHERE day IS NOT NULL"
+    )]
+    for month in months:
+        shard = conn.shard(f"{month}-01")
+        shard.commit()
+        main.execute("ATTACH DATABASE ? AS shard", (_shard_path(month),))
+        try:
+            main.execute("""
+                INSERT OR REPLACE INTO shard.sessions
+                    (session_id, type, start_time, end_time, duration, day, start_ts, end_ts)
+                SELECT ? + ROW_NUMBER() OVER (ORDER BY start_ts, session_id),
+                       type, start_time, end_time, duration, day, start_ts, end_ts
+                FROM main.sessions WHERE day >= ? AND day <= ?
+            """, (_id_base(month), f"{month}-01", f"{month}-31"))
+            main.commit()
+        finally:
+            main.execute("DETACH DATABASE shard")
+        _rebuild_shard(shard)
+        shard.commit()
+    for table in ("sessions", "rollups", "daily_rollups", "merged_intervals"):
+        main.execute(f"DROP TABLE IF EXISTS {table}")
+    _mark_changed(main, history=True)
+    main.commit()
+    main.execute("VACUUM")
+
+
+def _session_row(start_time: datetime, end_time: datetime, session_type: str):
     duration = (end_time - start_time).total_seconds()
     if duration < MIN_SESSION_DURATION:
+        return None
+    return (
+        session_type, start_time.isoformat(), end_time.isoformat(), round(duration, 2),
+        start_time.date().isoformat(), start_time.timestamp(), end_time.timestamp(),
+    )
+
+
+def _insert_sessions(conn, rows):
+    today = date.today().isoformat()
+    _mark_changed(conn, history=any(row[4] < today for row in rows))
+    if STORAGE_BACKEND == "bitmap":
+        bitmaps.record(conn, rows)
         return
-    conn = _get_conn()
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[4][:7], []).append(row)
+    for month_rows in by_month.values():
+        shard = conn.shard(month_rows[0][4])
+        shard.executemany(
+            "INSERT INTO sessions (type, start_time, end_time, duration, day, start_ts, end_ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            month_rows,
+        )
+        _update_rollups(shard, month_rows)
+
+
+# --- Change markers and query cache ---
+
+_CHANGE_KEYS = ("write_version", "write_time", "history_version", "history_time")
+
+
+def _mark_changed(conn, history=False):
+    """Bump the change markers inside the caller's write transaction."""
+    now = int(time.time())
+    keys = ("write", "history") if history else ("write",)
+    for k in keys:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (f"{k}_version",))
+        conn.execute("UPDATE meta SET value = ? WHERE key = ?", (now, f"{k}_time"))
+
+
+class _ChangeWatch:
+    """Reads the change markers, skipping the read while PRAGMA data_version is unchanged."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._markers = dict.fromkeys(_CHANGE_KEYS, 0)
+
+    def markers(self) -> dict:
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(DB_PATH, timeout=5, check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._markers.update(self._conn.execute("SELECT key, value FROM meta"))
+                self._data_version = data_version
+            return dict(self._markers)
+
+
+_watch = _ChangeWatch()
+
+
+def _is_past(dates) -> bool:
+    return bool(dates) and max(dates) < date.today().isoformat()
+
+
+def get_change_token(*dates) -> tuple[str, int]:
+    """(token, modified_epoch) that changes whenever data for these dates may have.
+
+    Days before today only change through backfills (midnight flushes,
+    rebuilds, imports), so ranges entirely in the past key on history_* only.
+    """
+    markers = _watch.markers()
+    if _is_past(dates):
+        return f"h{markers['history_version']}", markers["history_time"]
+    return f"w{markers['write_version']}.{markers['history_version']}", markers["write_time"]
+
+
+_CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(fn):
+    """Memoize a read until the change token of its date arguments moves.
+
+    Cached results are shared between callers and must be treated as read-only.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, conn=None, **kwargs):
+        if conn is not None:
+            return fn(*args, conn=conn, **kwargs)
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        token = get_change_token(*(a for a in args if _looks_like_date(a)))
+        with _cache_lock:
+            hit = _cache.get(key)
+            if hit is not None and hit[0] == token:
+                _cache.move_to_end(key)
+                return hit[1]
+        value = fn(*args, **kwargs)
+        with _cache_lock:
+            _cache[key] = (token, value)
+            if len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+        return value
+    return wrapper
+
+
+def _looks_like_date(value) -> bool:
+    return isinstance(value, str) and len(value) == 10 and value[4] == "-" and value[7] == "-"
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+# --- Rollups ---
+
+
+def _update_rollups(conn, rows):
+    """Fold a batch of freshly inserted session rows into the rollup tables."""
+    buckets = {}
+    for session_type, start_iso, _, duration, day, *_ in rows:
+        key = (day, int(start_iso[11:13]), session_type)
+        total, count = buckets.get(key, (0.0, 0))
+        buckets[key] = (total + duration, count + 1)
+    # The batch is merged on its own first, so the day's stored intervals are
+    # probed once per disjoint run rather than once per session (a writer
+    # flush, or thousands of sessions ingested from another host)
+    spans = {}
+    for _, start_iso, end_iso, _, day, start_ts, end_ts, *parts in rows:
+        if parts and parts[0] is not None:
+            # A compacted row ingested from another host (rows may carry parts)
+            spans.setdefault(day, []).extend(
+                (s, e, datetime.fromtimestamp(s).isoformat(), datetime.fromtimestamp(e).isoformat())
+                for s, e in _row_spans(start_ts, end_ts, parts[0])
+            )
+            continue
+        spans.setdefault(day, []).append((start_ts, end_ts, start_iso, end_iso))
+    for day, day_spans in spans.items():
+        day_spans.sort()
+        for start_ts, end_ts, start_iso, end_iso in _merge_spans(day_spans):
+            _merge_into_cumulative(conn, day, start_ts, end_ts, start_iso, end_iso, buckets)
+    _add_to_rollups(conn, buckets)
+
+
+def _add_to_rollups(conn, buckets):
+    daily = {}
+    for (day, _, session_type), (total, count) in buckets.items():
+        day_total, day_count = daily.get((day, session_type), (0.0, 0))
+        daily[(day, session_type)] = (day_total + total, day_count + count)
+    conn.executemany(
+        "INSERT INTO rollups (day, hour, type, total_duration, session_count) "
+        "VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (day, hour, type) DO UPDATE SET "
+        "    total_duration = total_duration + excluded.total_duration, "
+        "    session_count = session_count + excluded.session_count",
+        [(*key, total, count) for key, (total, count) in buckets.items()],
+    )
+    # Cumulative buckets whose intervals were all absorbed into another hour
+    conn.executemany(
+        "DELETE FROM rollups WHERE day = ? AND hour = ? AND type = ? AND session_count <= 0",
+        [key for key, (_, count) in buckets.items() if count <= 0],
+    )
+    conn.executemany(
+        "INSERT INTO daily_rollups (day, type, total_duration, session_count) "
+        "VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (type, day) DO UPDATE SET "
+        "    total_duration = total_duration + excluded.total_duration, "
+        "    session_count = session_count + excluded.session_count",
+        [(*key, total, count) for key, (total, count) in daily.items() if count or total],
+    )
+
+
+def _merge_into_cumulative(conn, day, start_ts, end_ts, start_iso, end_iso, buckets):
+    """Merge one session into the day's cumulative intervals.
+
+    Intervals are disjoint and sorted, so the ones touching the new session are
+    a contiguous run found by walking backwards from the last one starting
+    before it ends. Their rollup contributions are swapped for the union's.
+    """
+    cur = conn.execute(
+        "SELECT interval_id, start_ts, end_ts, start_time, end_time FROM merged_intervals "
+        "WHERE day = ? AND start_ts <= ? ORDER BY start_ts DESC",
+        (day, end_ts),
+    )
+    absorbed = []
+    for row in cur:
+        if row[2] < start_ts:
+            break
+        absorbed.append(row)
+    cur.close()
+
+    for interval_id, i_start, i_end, i_start_iso, i_end_iso in absorbed:
+        if i_start < start_ts:
+            start_ts, start_iso = i_start, i_start_iso
+        if i_end > end_ts:
+            end_ts, end_iso = i_end, i_end_iso
+        key = (day, int(i_start_iso[11:13]), CUMULATIVE)
+        total, count = buckets.get(key, (0.0, 0))
+        buckets[key] = (total - (i_end - i_start), count - 1)
+    if absorbed:
+        conn.executemany(
+            "DELETE FROM merged_intervals WHERE interval_id = ?",
+            [(row[0],) for row in absorbed],
+        )
     conn.execute(
-        "INSERT INTO sessions (type, start_time, end_time, duration) VALUES (?, ?, ?, ?)",
-        (session_type, start_time.isoformat(), end_time.isoformat(), round(duration, 2)),
+        "INSERT INTO merged_intervals (day, start_ts, end_ts, start_time, end_time) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (day, start_ts, end_ts, start_iso, end_iso),
     )
+    key = (day, int(start_iso[11:13]), CUMULATIVE)
+    total, count = buckets.get(key, (0.0, 0))
+    buckets[key] = (total + (end_ts - start_ts), count + 1)
+
+
+def _merge_spans(spans):
+    """Merge (start_ts, end_ts, start_time, end_time) rows sorted by start."""
+    merged = []
+    for start_ts, end_ts, start_iso, end_iso in spans:
+        if merged and start_ts <= merged[-1][1]:
+            if end_ts > merged[-1][1]:
+                merged[-1][1] = end_ts
+                merged[-1][3] = end_iso
+        else:
+            merged.append([start_ts, end_ts, start_iso, end_iso])
+    return merged
+
+
+def rebuild_rollups(conn=None):
+    """One-shot rebuild of the rollup and cumulative tables of every shard."""
+    own_conn = conn is None
+    if own_conn:
+        conn = _get_conn()
+    with conn:
+        for shard in conn.shards():
+            _rebuild_shard(shard)
+        _mark_changed(conn, history=True)
+    if own_conn:
+        conn.close()
+
+
+def _rebuild_shard(conn):
+    """Rebuild one shard's rollups and cumulative intervals from its raw sessions."""
+    conn.execute("DELETE FROM rollups")
+    conn.execute("DELETE FROM daily_rollups")
+    conn.execute("DELETE FROM merged_intervals")
+    conn.execute("""
+        INSERT INTO rollups (day, hour, type, total_duration, session_count)
+        SELECT day, CAST(substr(start_time, 12, 2) AS INTEGER), type,
+               SUM(duration), COUNT(*)
+        FROM sessions
+        GROUP BY 1, 2, 3
+    """)
+    days = [r[0] for r in conn.execute("SELECT DISTINCT day FROM rollups").fetchall()]
+    for day in days:
+        spans = []
+        expanded = False
+        for start_ts, end_ts, start_iso, end_iso, parts in conn.execute(
+            "SELECT start_ts, end_ts, start_time, end_time, parts FROM sessions "
+            "WHERE day = ? ORDER BY start_ts",
+            (day,),
+        ):
+            if parts is None:
+                spans.append((start_ts, end_ts, start_iso, end_iso))
+                continue
+            expanded = True
+            spans.extend(
+                (s, e, datetime.fromtimestamp(s).isoformat(), datetime.fromtimestamp(e).isoformat())
+                for s, e in _row_spans(start_ts, end_ts, parts)
+            )
+        if expanded:
+            spans.sort()
+        conn.executemany(
+            "INSERT INTO merged_intervals (day, start_ts, end_ts, start_time, end_time) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(day, *span) for span in _merge_spans(spans)],
+        )
+    conn.execute("""
+        INSERT INTO rollups (day, hour, type, total_duration, session_count)
+        SELECT day, CAST(substr(start_time, 12, 2) AS INTEGER), ?,
+               SUM(end_ts - start_ts), COUNT(*)
+        FROM merged_intervals
+        GROUP BY 1, 2
+    """, (CUMULATIVE,))
+    conn.execute("""
+        INSERT INTO daily_rollups (day, type, total_duration, session_count)
+        SELECT day, type, SUM(total_duration), SUM(session_count)
+        FROM rollups
+        GROUP BY 1, 2
+    """)
+
+
+_STOP = object()
+_log = logging.getLogger(__name__)
+
+
+class _Flush:
+    """Queued by SessionWriter.flush(): set once the batch before it was handled."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.committed = False
+
+
+class SessionWriter:
+    """Background thread that group-commits closed sessions over one connection.
+
+    A batch that fails to commit is kept and retried; only a final commit
+    that keeps failing at stop() gives up, and then logs the sessions it
+    could not save.
+    """
+
+    # Attempts at the final commit when stopping, and the pause between them
+    STOP_RETRIES = 3
+    STOP_RETRY_SECONDS = 0.5
+
+    def __init__(self, batch_size=WRITER_BATCH_SIZE, flush_interval=WRITER_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.sessions_written = 0
+        self.batches_committed = 0
+        self.commit_errors = 0
+        self.sessions_lost = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, row):
+        self.queue.put(row)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been committed.
+
+        False if that did not happen within ``timeout`` or the commit failed
+        (the sessions stay queued for the next attempt).
+        """
+        waiter = _Flush()
+        self.queue.put(waiter)
+        return waiter.done.wait(timeout) and waiter.committed
+
+    def stop(self, timeout=20.0):
+        """Commit what is left (retrying a failed commit) and stop; False if
+        sessions were lost or the thread did not finish within ``timeout``."""
+        lost = self.sessions_lost
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        return not self._thread.is_alive() and self.sessions_lost == lost
+
+    def stats(self) -> dict:
+        batches = self.batches_committed
+        return {
+            "queue_depth": self.queue.qsize(),
+            "sessions_written": self.sessions_written,
+            "batches_committed": batches,
+            "commit_errors": self.commit_errors,
+            "sessions_lost": self.sessions_lost,
+            "last_commit_ms": round(self.last_commit_ms, 3),
+            "max_commit_ms": round(self.max_commit_ms, 3),
+            "avg_commit_ms": round(self._total_commit_ms / batches, 3) if batches else 0.0,
+        }
+
+    def _commit(self, conn, pending):
+        if not pending:
+            return True
+        t0 = time.perf_counter()
+        try:
+            with conn:
+                _insert_sessions(conn, pending)
+        except sqlite3.Error:
+            # Keep the batch and retry on the next deadline (e.g. the DB was locked)
+            self.commit_errors += 1
+            return False
+        except Exception:
+            # Anything else must not end the thread and what it holds: same
+            # as above, but worth a trace
+            _log.exception("committing %d sessions failed", len(pending))
+            self.commit_errors += 1
+            return False
+        elapsed = (time.perf_counter() - t0) * 1000
+        metrics.observe("nat_writer_commit_seconds", elapsed / 1000)
+        self.sessions_written += len(pending)
+        self.batches_committed += 1
+        self.last_commit_ms = elapsed
+        self.max_commit_ms = max(self.max_commit_ms, elapsed)
+        self._total_commit_ms += elapsed
+        pending.clear()
+        return True
+
+    def _commit_last(self, conn, pending):
+        # Sessions submitted while stopping are part of the last batch
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _Flush):
+                item.done.set()
+            elif item is not _STOP:
+                pending.append(item)
+        for attempt in range(self.STOP_RETRIES):
+            if self._commit(conn, pending):
+                return
+            time.sleep(self.STOP_RETRY_SECONDS)
+        # Past this point they only exist here: leave them in the log
+        self.sessions_lost += len(pending)
+        for row in pending:
+            _log.error("session not saved: %s %s - %s", row[0], row[1], row[2])
+        pending.clear()
+
+    def _run(self):
+        conn = _get_conn()
+        pending = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if not pending else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is None:
+                    if not self._commit(conn, pending):
+                        deadline = time.monotonic() + self.flush_interval
+                elif item is _STOP:
+                    self._commit_last(conn, pending)
+                    break
+                elif isinstance(item, _Flush):
+                    item.committed = self._commit(conn, pending)
+                    if not item.committed:
+                        deadline = time.monotonic() + self.flush_interval
+                    item.done.set()
+                else:
+                    if not pending:
+                        deadline = time.monotonic() + self.flush_interval
+                    pending.append(item)
+                    if len(pending) >= self.batch_size and not self._commit(conn, pending):
+                        deadline = time.monotonic() + self.flush_interval
+        finally:
+            conn.close()
+
+
+_writer = None
+
+
+def start_writer():
+    """Route save_session through a background group-committing writer."""
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = SessionWriter()
+        _writer.start()
+    return _writer
+
+
+def stop_writer(timeout=20.0):
+    """Commit everything still queued and stop the writer thread.
+
+    The timeout leaves room for the final commit's retries, each of which can
+    wait out the 5 s busy timeout of a locked database.
+    """
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        _writer.stop(timeout)
+    _writer = None
+
+
+def get_writer_stats() -> dict:
+    if _writer is None:
+        return {"running": False}
+    return {"running": _writer.is_alive(), **_writer.stats()}
+
+
+def _writer_metrics():
+    stats = get_writer_stats()
+    if stats["running"]:
+        yield "nat_writer_sessions_written_total", "counter", {}, stats["sessions_written"]
+        yield "nat_writer_commit_errors_total", "counter", {}, stats["commit_errors"]
+        yield "nat_writer_queue_depth", "gauge", {}, stats["queue_depth"]
+
+
+@metrics.timed("nat_save_session_seconds")
+def save_session(start_time: datetime, end_time: datetime, session_type: str = "mouse"):
+    row = _session_row(start_time, end_time, session_type)
+    if row is None:
+        return
+    if _writer is not None and _writer.is_alive():
+        _writer.submit(row)
+        return
+    conn = _get_conn()
+    _insert_sessions(conn, [row])
     conn.commit()
     conn.close()
 
 
-def get_sessions_for_date(date_str: str, session_type: str = None) -> list[dict]:
+def ingest_sessions(host: str, sessions) -> dict:
+    """Store sessions pushed by the tracker of another machine (collector.py).
+
+    ``sessions`` are [source_id, type, start_time, end_time] lists, source_id
+    being the session's id on ``host``; a row merged by compaction adds its
+    members' [[start_ts, end_ts], ...] as a fifth item. Sessions already
+    stored for that host are skipped, so a batch sent twice (a retried push)
+    is only counted once. Times are the host's naive local times, as stored
+    everywhere else. Raises ValueError on a malformed batch, one with UTC
+    offsets or sessions of another length included.
+    """
+    if not isinstance(host, str) or not host:
+        raise ValueError("missing host")
+    # {month: {source_id: (session row, packed parts or None)}}
+    by_month = {}
+    for session in sessions:
+        if not isinstance(session, (list, tuple)) or len(session) not in (4, 5):
+            raise ValueError(f"expected [source_id, type, start, end(, parts)], got {session!r}")
+        source_id, session_type, start_iso, end_iso = session[:4]
+        if session_type not in ("mouse", "keyboard"):
+            raise ValueError(f"unknown session type {session_type!r}")
+        start_time, end_time = datetime.fromisoformat(start_iso), datetime.fromisoformat(end_iso)
+        if start_time.tzinfo is not None or end_time.tzinfo is not None:
+            raise ValueError(f"expected local times without a UTC offset, got {start_iso!r}")
+        row = _session_row(start_time, end_time, session_type)
+        if row is None:
+            continue
+        parts = None
+        if len(session) == 5:
+            spans = [(float(s), float(e)) for s, e in session[4]]
+            row = (*row[:3], round(sum(e - s for s, e in spans), 2), *row[4:])
+            parts = _pack_parts(spans)
+        by_month.setdefault(row[4][:7], {})[int(source_id)] = (row, parts)
+    rows = [entry for month_rows in by_month.values() for entry in month_rows.values()]
+    if not rows:
+        return {"received": len(sessions), "inserted": 0}
     conn = _get_conn()
+    try:
+        if STORAGE_BACKEND == "bitmap":
+            # ORing bits is idempotent already
+            with conn:
+                _insert_sessions(conn, [
+                    (*row[:5], s, e) for row, parts in rows
+                    for s, e in _row_spans(row[5], row[6], parts)
+                ])
+            return {"received": len(sessions), "inserted": len(rows)}
+        inserted = []
+        # data.db first, as the writer does; holding its write lock for the whole
+        # batch also keeps two pushes from the same host from racing past the
+        # duplicate check
+        conn.main.execute("BEGIN IMMEDIATE")
+        with conn:
+            for month, month_rows in sorted(by_month.items()):
+                shard = conn.shard(f"{month}-01")
+                seen = {r[0] for r in shard.execute(
+                    "SELECT source_id FROM sessions "
+                    "WHERE host = ? AND source_id BETWEEN ? AND ?",
+                    (host, min(month_rows), max(month_rows)),
+                )}
+                new = []
+                for source_id, (row, parts) in month_rows.items():
+                    if source_id in seen:
+                        continue
+                    session_type, start_iso, end_iso, duration, day, start_ts, end_ts = row
+                    new.append((
+                        host, source_id, session_type, start_iso, end_iso,
+                        duration, day, start_ts, end_ts, parts,
+                    ))
+                if not new:
+                    continue
+                shard.executemany(
+                    "INSERT INTO sessions (host, source_id, type, start_time, end_time, "
+                    "duration, day, start_ts, end_ts, parts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    new,
+                )
+                _update_rollups(shard, [row[2:] for row in new])
+                inserted.extend(new)
+            if inserted:
+                today = date.today().isoformat()
+                _mark_changed(conn, history=any(row[6] < today for row in inserted))
+    finally:
+        conn.close()
+    return {"received": len(sessions), "inserted": len(inserted)}
+
+
+def _bitmap_backed(fn):
+    """Serve this query from bitmaps.py when the bitmap storage backend is enabled.
+
+    The bitmap version runs on a connection from here, like the ones under _reads.
+    """
+    if STORAGE_BACKEND == "bitmap":
+        return _reads(getattr(bitmaps, fn.__name__))
+    return fn
+
+
+def convert_to_bitmaps(conn=None) -> int:
+    """Build bitmaps for every row of the sessions table. Returns the row count."""
+    own_conn = conn is None
+    if own_conn:
+        conn = _get_conn()
+    count = 0
+    with conn:
+        bitmaps.create_table(conn)
+        for shard in conn.shards():
+            cur = shard.execute(
+                "SELECT type, start_time, end_time, duration, day, start_ts, end_ts, parts "
+                "FROM sessions"
+            )
+            while True:
+                rows = cur.fetchmany(5000)
+                if not rows:
+                    break
+                # Rows merged by compaction are recorded as their members' spans
+                bitmaps.record(conn, [
+                    (*r[:5], s, e) for r in rows for s, e in _row_spans(r[5], r[6], r[7])
+                ])
+                count += len(rows)
+        _mark_changed(conn, history=True)
+    if own_conn:
+        conn.close()
+    return count
+
+
+def _reads(fn):
+    """Run the query on the thread's pooled read-only handle unless the caller passes ``conn``."""
+    @functools.wraps(fn)
+    def wrapper(*args, conn=None, **kwargs):
+        if conn is not None:
+            return fn(*args, conn=conn, **kwargs)
+        conn = _get_conn(readonly=True)
+        try:
+            return fn(*args, conn=conn, **kwargs)
+        finally:
+            conn.close()
+    return wrapper
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_sessions_for_date(date_str: str, session_type: str = None, conn=None) -> list[dict]:
+    shard = conn.shard(date_str)
     if session_type:
-        rows = conn.execute(
+        rows = shard.execute(
             "SELECT session_id, type, start_time, end_time, duration "
-            "FROM sessions WHERE date(start_time) = ? AND type = ? ORDER BY start_time",
-            (date_str, session_type),
+            "FROM sessions WHERE type = ? AND day = ? ORDER BY start_ts",
+            (session_type, date_str),
         ).fetchall()
     else:
-        rows = conn.execute(
+        rows = shard.execute(
             "SELECT session_id, type, start_time, end_time, duration "
-            "FROM sessions WHERE date(start_time) = ? ORDER BY start_time",
+            "FROM sessions WHERE day = ? ORDER BY start_ts",
             (date_str,),
         ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
-def get_summary_for_date(date_str: str, session_type: str = None) -> dict:
-    conn = _get_conn()
-    if session_type:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(duration), 0) AS total_duration, "
-            "       COUNT(*) AS session_count, "
-            "       COALESCE(AVG(duration), 0) AS avg_duration "
-            "FROM sessions WHERE date(start_time) = ? AND type = ?",
-            (date_str, session_type),
-        ).fetchone()
-    else:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(duration), 0) AS total_duration, "
-            "       COUNT(*) AS session_count, "
-            "       COALESCE(AVG(duration), 0) AS avg_duration "
-            "FROM sessions WHERE date(start_time) = ?",
-            (date_str,),
-        ).fetchone()
-    conn.close()
-    return dict(row)
+@_cached
+@_bitmap_backed
+@_reads
+def get_summary_for_date(date_str: str, session_type: str = None, conn=None) -> dict:
+    return get_summary_for_range(date_str, date_str, session_type, conn=conn)
 
 
-def get_sessions_for_range(start_date: str, end_date: str, session_type: str = None) -> list[dict]:
-    conn = _get_conn()
+@_cached
+@_bitmap_backed
+@_reads
+def get_sessions_for_range(
+    start_date: str, end_date: str, session_type: str = None, conn=None
+) -> list[dict]:
     if session_type:
-        rows = conn.execute(
+        sql = (
             "SELECT session_id, type, start_time, end_time, duration "
-            "FROM sessions WHERE date(start_time) >= ? AND date(start_time) <= ? AND type = ? "
-            "ORDER BY start_time",
-            (start_date, end_date, session_type),
-        ).fetchall()
+            "FROM sessions WHERE type = ? AND day >= ? AND day <= ? "
+            "ORDER BY day, start_ts"
+        )
+        params = (session_type, start_date, end_date)
     else:
-        rows = conn.execute(
+        sql = (
             "SELECT session_id, type, start_time, end_time, duration "
-            "FROM sessions WHERE date(start_time) >= ? AND date(start_time) <= ? "
-            "ORDER BY start_time",
-            (start_date, end_date),
-        ).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+            "FROM sessions WHERE day >= ? AND day <= ? "
+            "ORDER BY day, start_ts"
+        )
+        params = (start_date, end_date)
+    # Shards come oldest first, so concatenating keeps (day, start) order
+    return [dict(r) for shard in conn.shards(start_date, end_date) for r in shard.execute(sql, params)]
 
 
-def get_summary_for_range(start_date: str, end_date: str, session_type: str = None) -> dict:
-    conn = _get_conn()
-    if session_type:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(duration), 0) AS total_duration, "
-            "       COUNT(*) AS session_count, "
-            "       COALESCE(AVG(duration), 0) AS avg_duration "
-            "FROM sessions WHERE date(start_time) >= ? AND date(start_time) <= ? AND type = ?",
-            (start_date, end_date, session_type),
-        ).fetchone()
-    else:
-        row = conn.execute(
-            "SELECT COALESCE(SUM(duration), 0) AS total_duration, "
-            "       COUNT(*) AS session_count, "
-            "       COALESCE(AVG(duration), 0) AS avg_duration "
-            "FROM sessions WHERE date(start_time) >= ? AND date(start_time) <= ?",
-            (start_date, end_date),
+SESSION_PAGE_SIZE = 1000
+
+
+_PAGE_FIELDS = ("session_id", "type", "start_time", "end_time", "duration")
+
+
+def _page_cursor(row) -> str:
+    return f"{row['day']}:{row['start_ts']!r}:{row['session_id']}"
+
+
+def _cursor_key(conn, after):
+    """(day, start_ts, session_id) to resume after.
+
+    ``after`` is a page cursor (``next_after``), which carries its own sort key,
+    so it keeps working after compaction or activity_log.apply has deleted the
+    session it ends on. A bare session_id (the older form) is looked up and
+    raises LookupError if that session is gone. Malformed input raises ValueError.
+    """
+    after = str(after)
+    if after.isdigit():
+        row = conn.shard(_id_day(int(after))).execute(
+            "SELECT day, start_ts, session_id FROM sessions WHERE session_id = ?", (int(after),)
         ).fetchone()
-    conn.close()
-    return dict(row)
+        if row is None:
+            raise LookupError(f"session {after} no longer exists")
+        return tuple(row)
+    day, start_ts, session_id = after.split(":")
+    date.fromisoformat(day)
+    return day, float(start_ts), int(session_id)
 
 
-def _merge_intervals(sessions):
-    """Merge overlapping sessions into non-overlapping intervals."""
-    if not sessions:
-        return []
-    merged = []
-    cur_start = sessions[0]["start_time"]
-    cur_end = sessions[0]["end_time"]
-    for s in sessions[1:]:
-        if s["start_time"] <= cur_end:
-            if s["end_time"] > cur_end:
-                cur_end = s["end_time"]
+def _range_rows(conn, start_date, end_date, session_type=None, after=None, limit=None):
+    cursor_key = ("", 0.0, 0) if after is None else _cursor_key(conn, after)
+    if cursor_key[0] < start_date:
+        cursor_key = (start_date, float("-inf"), 0)
+    sql = (
+        "SELECT session_id, type, start_time, end_time, duration, day, start_ts FROM sessions "
+        "WHERE (day, start_ts, session_id) > (?, ?, ?) AND day <= ? "
+    )
+    params = [*cursor_key, end_date]
+    if session_type:
+        sql += "AND type = ? "
+        params.append(session_type)
+    sql += "ORDER BY day, start_ts, session_id"
+    for shard in conn.shards(cursor_key[0], end_date):
+        if limit is not None:
+            if limit <= 0:
+                break
+            rows = shard.execute(sql + " LIMIT ?", (*params, limit))
         else:
-            merged.append((cur_start, cur_end))
-            cur_start = s["start_time"]
-            cur_end = s["end_time"]
-    merged.append((cur_start, cur_end))
-    return merged
+            rows = shard.execute(sql, params)
+        for row in rows:
+            if limit is not None:
+                limit -= 1
+            yield row
 
 
-def _merged_summary(sessions):
-    """Compute summary stats from merged (non-overlapping) intervals."""
-    intervals = _merge_intervals(sessions)
-    if not intervals:
-        return {"total_duration": 0, "session_count": 0, "avg_duration": 0}
-    total = 0.0
-    for start_iso, end_iso in intervals:
-        start = datetime.fromisoformat(start_iso)
-        end = datetime.fromisoformat(end_iso)
-        total += (end - start).total_seconds()
-    count = len(intervals)
-    return {
-        "total_duration": round(total, 2),
-        "session_count": count,
-        "avg_duration": round(total / count, 2),
-    }
+@_bitmap_backed
+def iter_sessions_for_range(
+    start_date: str, end_date: str, session_type: str = None, after=None, limit: int = None
+):
+    """Yield session dicts straight off the cursor, in (day, start) order.
+
+    ``after`` is the ``next_after`` of a previous page: the scan resumes right
+    after it through the (day, start_ts) index instead of skipping rows.
+    """
+    conn = _get_conn(readonly=True)
+    try:
+        for row in _range_rows(conn, start_date, end_date, session_type, after, limit):
+            yield {k: row[k] for k in _PAGE_FIELDS}
+    finally:
+        conn.close()
 
 
-def get_merged_summary_for_date(date_str: str) -> dict:
-    sessions = get_sessions_for_date(date_str)
-    return _merged_summary(sessions)
+@_bitmap_backed
+@_reads
+def get_sessions_since(date_str: str, after: int = None, conn=None) -> list[dict]:
+    """Sessions of a day committed after session ``after``, in commit order.
 
+    For live updates: a session can close after another that started later, so
+    the start-ordered keyset of iter_sessions_for_range would skip it.
+    """
+    rows = conn.shard(date_str).execute(
+        "SELECT session_id, type, start_time, end_time, duration FROM sessions "
+        "WHERE day = ? AND session_id > ? ORDER BY session_id",
+        (date_str, after or 0),
+    )
+    return [dict(r) for r in rows]
 
-def get_merged_summary_for_range(start_date: str, end_date: str) -> dict:
-    sessions = get_sessions_for_range(start_date, end_date)
-    return _merged_summary(sessions)
 
+@_reads
+def get_unpushed_sessions(
+    cursors: dict = None, limit: int = PUSH_BATCH_SIZE, conn=None
+) -> list[list]:
+    """Local sessions past ``cursors`` ({month: last pushed session_id}), oldest month first.
 
-def get_merged_daily_totals(start_date: str, end_date: str) -> dict:
-    """Return {date: merged_total_seconds} for each date in the range."""
-    sessions = get_sessions_for_range(start_date, end_date)
-    by_date: dict[str, list] = {}
-    for s in sessions:
-        d = s["start_time"].split("T")[0]
-        by_date.setdefault(d, []).append(s)
-    result = {}
-    for d, day_sessions in by_date.items():
-        intervals = _merge_intervals(day_sessions)
-        total = sum(
-            (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
-            for start, end in intervals
+    Rows are [session_id, type, start_time, end_time], plus the member spans of
+    a row merged by compaction, as ingest_sessions takes them.
+    """
+    rows = []
+    for month in _shard_months():
+        if len(rows) >= limit:
+            break
+        for *row, start_ts, end_ts, parts in conn.shard(f"{month}-01").execute(
+            "SELECT session_id, type, start_time, end_time, start_ts, end_ts, parts FROM sessions "
+            "WHERE session_id > ? AND host = '' ORDER BY session_id LIMIT ?",
+            ((cursors or {}).get(month, 0), limit - len(rows)),
+        ):
+            if parts is not None:
+                row.append([list(span) for span in _row_spans(start_ts, end_ts, parts)])
+            rows.append(row)
+    return rows
+
+
+@_bitmap_backed
+def get_sessions_page(
+    start_date: str, end_date: str, session_type: str = None, after=None,
+    limit: int = SESSION_PAGE_SIZE,
+) -> dict:
+    """One keyset page: {"sessions": [...], "next_after": cursor or None}."""
+    conn = _get_conn(readonly=True)
+    try:
+        rows = list(_range_rows(conn, start_date, end_date, session_type, after, limit + 1))
+    finally:
+        conn.close()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = _page_cursor(rows[-1])
+    return {"sessions": [{k: r[k] for k in _PAGE_FIELDS} for r in rows], "next_after": next_after}
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_summary_for_range(
+    start_date: str, end_date: str, session_type: str = None, conn=None
+) -> dict:
+    if session_type:
+        sql = (
+            "SELECT COALESCE(SUM(total_duration), 0), COALESCE(SUM(session_count), 0) "
+            "FROM daily_rollups WHERE type = ? AND day >= ? AND day <= ?"
         )
-        result[d] = round(total, 2)
-    return result
+        params = (session_type, start_date, end_date)
+    else:
+        sql = (
+            "SELECT COALESCE(SUM(total_duration), 0), COALESCE(SUM(session_count), 0) "
+            "FROM daily_rollups WHERE type IN ('mouse', 'keyboard') AND day >= ? AND day <= ?"
+        )
+        params = (start_date, end_date)
+    total = count = 0
+    for shard in conn.shards(start_date, end_date):
+        shard_total, shard_count = shard.execute(sql, params).fetchone()
+        total += shard_total
+        count += shard_count
+    return _summary(total, count)
 
 
-def get_available_dates() -> list[str]:
-    conn = _get_conn()
-    rows = conn.execute(
-        "SELECT DISTINCT date(start_time) AS d FROM sessions ORDER BY d DESC"
+@_cached
+@_bitmap_backed
+@_reads
+def get_merged_summary_for_date(date_str: str, conn=None) -> dict:
+    return get_merged_summary_for_range(date_str, date_str, conn=conn)
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_merged_summary_for_range(start_date: str, end_date: str, conn=None) -> dict:
+    return get_summary_for_range(start_date, end_date, CUMULATIVE, conn=conn)
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_cumulative_intervals(date_str: str, conn=None) -> list[dict]:
+    """Merged (mouse OR keyboard) intervals of one day, for the cumulative timeline."""
+    rows = conn.shard(date_str).execute(
+        "SELECT start_time, end_time, round(end_ts - start_ts, 2) AS duration "
+        "FROM merged_intervals WHERE day = ? ORDER BY start_ts",
+        (date_str,),
     ).fetchall()
-    conn.close()
-    return [r["d"] for r in rows]
+    return [dict(r) for r in rows]
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_merged_daily_totals(start_date: str, end_date: str, conn=None) -> dict:
+    """Return {date: merged_total_seconds} for each date in the range."""
+    totals = {}
+    for shard in conn.shards(start_date, end_date):
+        rows = shard.execute(
+            "SELECT day, total_duration FROM daily_rollups "
+            "WHERE type = ? AND day >= ? AND day <= ?",
+            (CUMULATIVE, start_date, end_date),
+        )
+        totals.update((day, round(total, 2)) for day, total in rows)
+    return totals
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_weekday_hour_heatmap(
+    start_date: str, end_date: str, session_type: str = None, conn=None
+) -> list[list[float]]:
+    """Active seconds as [weekday][hour] (Monday = 0), summed over the range.
+
+    Read from the hourly rollups, so sessions count in the hour they start in.
+    Without a session_type the cumulative (mouse OR keyboard) series is used.
+    """
+    grid = [[0.0] * 24 for _ in range(7)]
+    for shard in conn.shards(start_date, end_date):
+        rows = shard.execute(
+            "SELECT (CAST(strftime('%w', day) AS INTEGER) + 6) % 7, hour, SUM(total_duration) "
+            "FROM rollups WHERE day >= ? AND day <= ? AND type = ? GROUP BY 1, 2",
+            (start_date, end_date, session_type or CUMULATIVE),
+        )
+        for weekday, hour, total in rows:
+            grid[weekday][hour] += total
+    return [[round(v, 2) for v in row] for row in grid]
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_available_dates(conn=None) -> list[str]:
+    # Walk each shard's day index from the newest day backwards, one seek per distinct day
+    dates = []
+    for shard in reversed(list(conn.shards())):
+        rows = shard.execute("""
+            WITH RECURSIVE days(d) AS (
+                SELECT MAX(day) FROM sessions
+                UNION ALL
+                SELECT (SELECT MAX(day) FROM sessions WHERE day < days.d)
+                FROM days WHERE days.d IS NOT NULL
+            )
+            SELECT d FROM days WHERE d IS NOT NULL
+        """)
+        dates.extend(r["d"] for r in rows)
+    return dates
+
+
+TIMELINE_RESOLUTIONS = (60, 300, 900, 3600)
+
+
+def _active_runs(spans, midnight, resolution):
+    """Run-length encode the buckets of one day touched by (start_ts, end_ts) spans."""
+    buckets = set()
+    last = 86400 // resolution - 1
+    for start_ts, end_ts in spans:
+        first = int((start_ts - midnight) // resolution)
+        end = min(int((end_ts - midnight) // resolution), last)
+        buckets.update(range(max(first, 0), end + 1))
+    runs = []
+    for b in sorted(buckets):
+        if runs and runs[-1][0] + runs[-1][1] == b:
+            runs[-1][1] += 1
+        else:
+            runs.append([b, 1])
+    return runs
+
+
+@_cached
+@_bitmap_backed
+@_reads
+def get_timeline_buckets(start_date: str, end_date: str, resolution: int = 60, conn=None) -> dict:
+    """Per-day activity as runs of [first_bucket, length] per type.
+
+    The payload is bounded by the number of buckets per day, however many
+    sessions the range holds.
+    """
+    spans = {}
+    for shard in conn.shards(start_date, end_date):
+        rows = shard.execute(
+            "SELECT day, type, start_ts, end_ts, parts FROM sessions "
+            "WHERE day >= ? AND day <= ? ORDER BY day, start_ts",
+            (start_date, end_date),
+        )
+        for day, session_type, start_ts, end_ts, parts in rows:
+            spans.setdefault(day, {}).setdefault(session_type, []).extend(
+                _row_spans(start_ts, end_ts, parts)
+            )
+        rows = shard.execute(
+            "SELECT day, start_ts, end_ts FROM merged_intervals "
+            "WHERE day >= ? AND day <= ? ORDER BY day, start_ts",
+            (start_date, end_date),
+        )
+        for day, start_ts, end_ts in rows:
+            spans.setdefault(day, {}).setdefault("cumulative", []).append((start_ts, end_ts))
+
+    days = {}
+    for day, by_type in spans.items():
+        midnight = datetime.fromisoformat(day).timestamp()
+        days[day] = {
+            t: _active_runs(by_type.get(t, ()), midnight, resolution)
+            for t in ("mouse", "keyboard", "cumulative")
+        }
+    return {"resolution": resolution, "buckets_per_day": 86400 // resolution, "days": days}
+
+
+# --- Bundled reads: everything one dashboard view needs, over one connection ---
+
+@_cached
+@_reads
+def get_view_summaries(start_date: str, end_date: str, conn=None) -> dict:
+    """Mouse, keyboard and cumulative summaries for a range.
+
+    The available dates are left to get_available_dates: they change with
+    today's writes, while a past range is cached until history changes.
+    """
+    return {
+        "mouse": get_summary_for_range(start_date, end_date, "mouse", conn=conn),
+        "keyboard": get_summary_for_range(start_date, end_date, "keyboard", conn=conn),
+        "cumulative": get_merged_summary_for_range(start_date, end_date, conn=conn),
+    }
+
+
+@_cached
+@_reads
+def get_day_bundle(date_str: str, conn=None) -> dict:
+    """Sessions, summaries and cumulative intervals for one day."""
+    return {
+        "date": date_str,
+        "sessions": get_sessions_for_date(date_str, conn=conn),
+        "cumulative_intervals": get_cumulative_intervals(date_str, conn=conn),
+        "summary": get_view_summaries(date_str, date_str, conn=conn),
+    }
+
+
+if metrics.ENABLED:
+    metrics.register_collector(_writer_metrics)
+    # Wrapped outermost so cache hits are timed too; queries called from other
+    # queries (e.g. by get_day_bundle) are counted under their own name as well
+    for _name in [n for n in globals() if n.startswith("get_") and n != "get_writer_stats"]:
+        globals()[_name] = metrics.timed("nat_db_query_seconds", function=_name)(globals()[_name])
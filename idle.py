@@ -0,0 +1,68 @@
+import threading
+import time
+
+import config
+
+
+class IdleScheduler:
+    """Closes idle sessions at their deadline instead of polling.
+
+    The deadline of an open session is ``last_event_time + IDLE_THRESHOLD_SECONDS``.
+    The thread sleeps until the earliest one; if input arrived meanwhile the
+    deadline has moved and it simply sleeps again. With no open session it
+    waits indefinitely until a tracker calls ``notify()``.
+
+    ``clock`` must be the same monotonic clock the trackers stamp events with;
+    tests can pass a fake one and drive ``run_pending()`` directly.
+    """
+
+    def __init__(self, trackers, clock=time.monotonic):
+        self.trackers = trackers
+        self.clock = clock
+        self.wakeups = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+        # Set by notify() so a wakeup arriving while run_pending() is busy
+        # is not lost
+        self._notified = False
+
+    def notify(self):
+        """Called when a tracker opens a session (never while holding its lock)."""
+        with self._cond:
+            self._notified = True
+            self._cond.notify()
+
+    def next_deadline(self):
+        threshold = config.IDLE_THRESHOLD_SECONDS
+        deadlines = [
+            t.last_event_time + threshold
+            for t in self.trackers
+            if t.session_start is not None and t.last_event_time is not None
+        ]
+        return min(deadlines) if deadlines else None
+
+    def run_pending(self):
+        """Close every session past its deadline; return the next deadline or None."""
+        now = self.clock()
+        for t in self.trackers:
+            t.check_idle(now)
+        return self.next_deadline()
+
+    def run(self):
+        while True:
+            # Outside the lock: closing sessions writes them out, and notify()
+            # is called from the listener threads
+            deadline = self.run_pending()
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._notified:
+                    timeout = None if deadline is None else max(deadline - self.clock(), 0)
+                    self._cond.wait(timeout)
+                self._notified = False
+                self.wakeups += 1
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
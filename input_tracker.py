@@ -0,0 +1,159 @@
+import threading
+import time
+from array import array
+from datetime import datetime
+
+import config
+import db
+from activity_log import SLOTS_PER_SECOND
+
+
+class InputTracker:
+    """Tracks one input type; called from the pynput listener threads.
+
+    The event path only stores a monotonic timestamp (and its activity slot)
+    under the lock, so that a close never sees half an event: an event racing
+    check_idle either lands in the session before it closes or opens the next.
+    Wall-clock datetimes are built when the session closes.
+    """
+
+    # Every Nth event is timed to estimate the per-event overhead
+    OVERHEAD_SAMPLE_EVERY = 64
+
+    def __init__(self, session_type, clock=time.monotonic, on_session_open=None,
+                 on_session_close=None, activity_log=None):
+        self.session_type = session_type
+        self.clock = clock
+        # Called (outside the lock) when an event opens a new session
+        self.on_session_open = on_session_open
+        # Receives (start, end, type) of each closed session; db.save_session by default
+        self.on_session_close = on_session_close
+        # ActivityLog that receives the active 100 ms slots of each closed session
+        self.activity_log = activity_log
+        self._slots = array("q")
+        self._last_slot = None
+        self.last_event_time = None
+        self.session_start = None
+        # (start, end) datetimes of the most recently closed session
+        self.last_closed = None
+        self.lock = threading.Lock()
+        # time.time() - time.monotonic() when the session opened
+        self._wall_offset = 0.0
+        self.event_count = 0
+        self.coalesced_count = 0
+        self._overhead_ns = 0
+        self._overhead_samples = 0
+        self._started = clock()
+
+    def on_event(self):
+        self.event_count += 1
+        if self.event_count % self.OVERHEAD_SAMPLE_EVERY:
+            self._record(self.clock())
+            return
+        t0 = time.perf_counter_ns()
+        self._record(self.clock())
+        self._overhead_ns += time.perf_counter_ns() - t0
+        self._overhead_samples += 1
+
+    def on_move(self):
+        # Moves arrive at the mouse polling rate; closely spaced ones carry no
+        # extra information for session boundaries
+        last = self.last_event_time
+        if last is not None and self.clock() - last < config.EVENT_COALESCE_SECONDS:
+            self.coalesced_count += 1
+            return
+        self.on_event()
+
+    def _record(self, now):
+        with self.lock:
+            opened = self.session_start is None
+            if opened:
+                self.session_start = now
+                self._wall_offset = time.time() - now
+            self.last_event_time = now
+            if self.activity_log is not None:
+                slot = int(now * SLOTS_PER_SECOND)
+                if slot != self._last_slot:
+                    self._last_slot = slot
+                    self._slots.append(slot)
+        if opened and self.on_session_open:
+            self.on_session_open()
+
+    def check_idle(self, now=None):
+        with self.lock:
+            session = None
+            if self.session_start is not None and self.last_event_time is not None:
+                if now is None:
+                    now = self.clock()
+                idle = now - self.last_event_time
+                if idle >= config.IDLE_THRESHOLD_SECONDS:
+                    session = self._close_session()
+        if session:
+            self._save(session)
+
+    def flush(self):
+        with self.lock:
+            session = None
+            if self.session_start is not None and self.last_event_time is not None:
+                session = self._close_session()
+        if session:
+            self._save(session)
+
+    def _save(self, session):
+        if self.activity_log is not None:
+            slots, offset = session[3:]
+            session = session[:3]
+            self.activity_log.append(self.session_type, slots, offset)
+        (self.on_session_close or db.save_session)(*session)
+
+    def _close_session(self):
+        session = (
+            datetime.fromtimestamp(self.session_start + self._wall_offset),
+            datetime.fromtimestamp(self.last_event_time + self._wall_offset),
+            self.session_type,
+        )
+        self.session_start = None
+        self.last_event_time = None
+        self.last_closed = session[:2]
+        if self.activity_log is not None:
+            session += (self._slots, self._wall_offset)
+            self._slots = array("q")
+            self._last_slot = None
+        return session
+
+    def open_session(self):
+        """{"start_time", "last_event"} of the session in progress (ISO), or None."""
+        with self.lock:
+            start, last = self.session_start, self.last_event_time
+            offset = self._wall_offset
+        if start is None or last is None:
+            return None
+        return {
+            "start_time": datetime.fromtimestamp(start + offset).isoformat(),
+            "last_event": datetime.fromtimestamp(last + offset).isoformat(),
+        }
+
+    def stats(self, window=None) -> dict:
+        """Event counters.
+
+        ``window`` is a dict owned by the caller, so that several readers each
+        get their own rate: events_per_second covers the time since the same
+        caller's previous call (since the tracker started on the first one).
+        """
+        now = self.clock()
+        events = self.event_count
+        rate = 0.0
+        if window is not None:
+            since, count_then = window.get(self.session_type, (self._started, 0))
+            window[self.session_type] = (now, events)
+            elapsed = now - since
+            rate = round((events - count_then) / elapsed, 2) if elapsed else 0.0
+        return {
+            "type": self.session_type,
+            "events": events,
+            "coalesced_moves": self.coalesced_count,
+            "events_per_second": rate,
+            "avg_overhead_ns": (
+                self._overhead_ns // self._overhead_samples if self._overhead_samples else 0
+            ),
+        }
@@ -0,0 +1,102 @@
+"""Sessions still in progress, shared from the tracker to the dashboard.
+
+The open sessions only exist in the tracker's memory, so the tracker rewrites
+LIVE_STATE_PATH whenever a session opens or closes (temp file + os.replace:
+readers never see a partial file), plus a heartbeat every
+LIVE_HEARTBEAT_SECONDS while a session is open. The dashboard takes a
+missing file or one older than a few heartbeats as nothing in progress, so
+an idle tracker never wakes up for it and one that died does not leave a
+session open forever.
+"""
+import json
+import os
+import threading
+import time
+
+from config import LIVE_HEARTBEAT_SECONDS, LIVE_STATE_PATH
+
+
+def write_state(trackers, path=LIVE_STATE_PATH):
+    state = {"updated": time.time(), "types": {}}
+    for tracker in trackers:
+        closed = tracker.last_closed
+        state["types"][tracker.session_type] = {
+            "open": tracker.open_session(),
+            "last_closed": {
+                "start_time": closed[0].isoformat(),
+                "end_time": closed[1].isoformat(),
+            } if closed else None,
+        }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+_cache = {"key": None, "state": None}
+
+
+def read_state(path=LIVE_STATE_PATH, max_age=3 * LIVE_HEARTBEAT_SECONDS):
+    """The tracker's last published state, or None if missing or stale.
+
+    The file is parsed again only when its mtime changes.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    if key != _cache["key"]:
+        try:
+            with open(path) as f:
+                _cache["state"] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        _cache["key"] = key
+    state = _cache["state"]
+    if time.time() - state["updated"] > max_age:
+        return None
+    return state
+
+
+class LivePublisher:
+    """Background thread writing the live state when poked, and on a heartbeat
+    while a session is open.
+
+    ``poke()`` only sets an Event, so it is cheap enough for the input path.
+    """
+
+    def __init__(self, trackers, path=LIVE_STATE_PATH, heartbeat=LIVE_HEARTBEAT_SECONDS):
+        self.trackers = trackers
+        self.path = path
+        self.heartbeat = heartbeat
+        self._event = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def poke(self):
+        self._event.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="live-state", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._event.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+
+    def _run(self):
+        timeout = 0
+        while True:
+            self._event.wait(timeout)
+            self._event.clear()
+            try:
+                write_state(self.trackers, self.path)
+            except OSError:
+                pass
+            if self._stopped:
+                break
+            open_now = any(t.session_start is not None for t in self.trackers)
+            timeout = self.heartbeat if open_now else None
@@ -0,0 +1,198 @@
+"""Opt-in runtime metrics (METRICS_ENABLED in config.py).
+
+Counters and latency histograms live in a process-wide registry; values that
+already exist elsewhere (tracker event counts, writer stats) are read at export
+time through collectors instead of being counted twice. When metrics are
+disabled ``timed`` returns the function unchanged and ``inc``/``observe``
+return immediately.
+
+The tracker and the dashboard run in separate processes: the tracker writes
+its snapshot to METRICS_SNAPSHOT_PATH every METRICS_SNAPSHOT_INTERVAL seconds
+and the dashboard's /api/metrics merges it with its own, labelled by process.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+from config import METRICS_ENABLED, METRICS_SNAPSHOT_INTERVAL, METRICS_SNAPSHOT_PATH
+
+ENABLED = METRICS_ENABLED
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+HELP = {
+    "nat_input_events_total": "Input events handled by the tracker",
+    "nat_input_moves_coalesced_total": "Mouse moves dropped by coalescing",
+    "nat_input_events_per_second": "Input event rate since the previous snapshot",
+    "nat_input_overhead_ns": "Sampled average cost of one input event",
+    "nat_save_session_seconds": "Time spent in db.save_session",
+    "nat_writer_commit_seconds": "Duration of one group commit of the session writer",
+    "nat_writer_sessions_written_total": "Sessions committed by the session writer",
+    "nat_writer_commit_errors_total": "Failed group commits (retried)",
+    "nat_writer_queue_depth": "Sessions waiting for the session writer",
+    "nat_db_query_seconds": "Latency of db.get_* calls, cache hits included",
+    "nat_http_request_seconds": "Dashboard request handling time",
+    "nat_http_requests_total": "Dashboard requests by route and status",
+    "nat_ingested_sessions_total": "Sessions stored by /api/ingest, by host",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            # One count per bucket (the last one is +Inf), then sum
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        hist[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist[-1] += seconds
+
+
+def timed(name, **labels):
+    """Decorator recording each call's duration in histogram ``name``."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - t0, **labels)
+        return wrapper
+    return decorate
+
+
+def register_collector(fn):
+    """``fn()`` yields (name, kind, labels, value) samples, read at every export."""
+    _collectors.append(fn)
+
+
+def snapshot(process=None) -> list[dict]:
+    """Every sample as a dict; ``process`` is added as a label when given."""
+    extra = {"process": process} if process else {}
+    samples = []
+    with _lock:
+        counters = list(_counters.items())
+        histograms = [(key, list(hist)) for key, hist in _histograms.items()]
+    for (name, labels), value in counters:
+        samples.append({"name": name, "type": "counter", "labels": {**dict(labels), **extra},
+                        "value": value})
+    for (name, labels), hist in histograms:
+        counts = hist[:-1]
+        samples.append({
+            "name": name, "type": "histogram", "labels": {**dict(labels), **extra},
+            "buckets": [[le, sum(counts[:i + 1])] for i, le in enumerate(BUCKETS)],
+            "count": sum(counts), "sum": round(hist[-1], 6),
+        })
+    for collect in _collectors:
+        for name, kind, labels, value in collect():
+            samples.append({"name": name, "type": kind, "labels": {**labels, **extra},
+                            "value": value})
+    return samples
+
+
+def _labels(labels, **more):
+    items = {**labels, **more}
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in sorted(items.items())
+    )
+    return "{" + body + "}"
+
+
+def render_prometheus(samples) -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    seen = set()
+    for s in sorted(samples, key=lambda s: s["name"]):
+        name = s["name"]
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {s['type']}")
+        if s["type"] == "histogram":
+            for le, count in s["buckets"]:
+                lines.append(f"{name}_bucket{_labels(s['labels'], le=le)} {count}")
+            lines.append(f"{name}_bucket{_labels(s['labels'], le='+Inf')} {s['count']}")
+            lines.append(f"{name}_sum{_labels(s['labels'])} {s['sum']}")
+            lines.append(f"{name}_count{_labels(s['labels'])} {s['count']}")
+        else:
+            lines.append(f"{name}{_labels(s['labels'])} {s['value']}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Cross-process snapshot (tracker -> dashboard) ---
+
+def write_snapshot(path=METRICS_SNAPSHOT_PATH, process="tracker"):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"time": time.time(), "samples": snapshot(process)}, f)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path=METRICS_SNAPSHOT_PATH, max_age=None) -> list[dict]:
+    """Samples written by another process; [] if missing or older than ``max_age``."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    if max_age is not None and time.time() - data["time"] > max_age:
+        return []
+    return data["samples"]
+
+
+class SnapshotExporter:
+    """Background thread calling write_snapshot() every ``interval`` seconds."""
+
+    def __init__(self, path=METRICS_SNAPSHOT_PATH, interval=METRICS_SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        write_snapshot(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write_snapshot(self.path)
+            except OSError:
+                pass
@@ -6,16 +6,19 @@ document.addEventListener("DOMContentLoaded", () => {
     const endDate = cfg.endDate;
 
     if (viewMode === "day") {
-        loadTimeline(dateStr, "mouse", "timeline-mouse", "session-segment-mouse");
-        loadTimeline(dateStr, "keyboard", "timeline-keyboard", "session-segment-keyboard");
-        loadTimeline(dateStr, null, "timeline-cumulative", "session-segment-cumulative");
-        loadSessionsTable(dateStr);
+        loadDayView(dateStr);
     } else if (viewMode === "week") {
         loadWeekChart(startDate, endDate);
         loadSessionsTableRange(startDate, endDate);
     } else if (viewMode === "month") {
         loadMonthChart(startDate, endDate);
         loadSessionsTableRange(startDate, endDate);
+    } else if (viewMode === "year") {
+        loadYearChart(startDate, endDate);
+        loadSessionsTableRange(startDate, endDate);
+    }
+    if (viewMode !== "day") {
+        loadHeatmap(startDate, endDate);
     }
 
     document.getElementById("nav-prev").addEventListener("click", () => navigate(viewMode, dateStr, -1));
@@ -30,6 +33,8 @@ function navigate(viewMode, dateStr, offset) {
         current.setDate(current.getDate() + offset * 7);
     } else if (viewMode === "month") {
         current.setMonth(current.getMonth() + offset);
+    } else if (viewMode === "year") {
+        current.setFullYear(current.getFullYear() + offset);
     }
     const y = current.getFullYear();
     const m = String(current.getMonth() + 1).padStart(2, "0");
@@ -39,31 +44,153 @@ function navigate(viewMode, dateStr, offset) {
 
 // --- Day view ---
 
-async function loadTimeline(dateStr, type, barId, segmentClass) {
-    let url = `/api/sessions/${dateStr}`;
-    if (type) url += `?type=${type}`;
-    const resp = await fetch(url);
-    const sessions = await resp.json();
+const MINUTES_IN_DAY = 1440;
+
+// What the day view currently shows, kept so live updates can patch it
+const dayState = { sessions: [], cumulative: [], lastId: 0 };
+
+// One request per day view: sessions, summaries and cumulative intervals
+async function loadDayView(dateStr) {
+    const resp = await fetch(`/api/day/${dateStr}`);
+    const bundle = await resp.json();
+    dayState.sessions = bundle.sessions;
+    dayState.cumulative = bundle.cumulative_intervals;
+    dayState.lastId = Math.max(0, ...bundle.sessions.map(s => s.session_id || 0));
+    renderTimeline(bundle.sessions.filter(s => s.type === "mouse"), "timeline-mouse", "session-segment-mouse");
+    renderTimeline(bundle.sessions.filter(s => s.type === "keyboard"), "timeline-keyboard", "session-segment-keyboard");
+    renderTimeline(bundle.cumulative_intervals, "timeline-cumulative", "session-segment-cumulative");
+    renderSessionsTable(bundle.sessions);
+    if (dateStr === localToday()) {
+        startLiveUpdates(dateStr);
+    }
+}
+
+function renderTimeline(sessions, barId, segmentClass) {
     const bar = document.getElementById(barId);
     if (!bar) return;
     bar.innerHTML = "";
+    sessions.forEach(s => addSegment(bar, s, segmentClass));
+}
 
-    const MINUTES_IN_DAY = 1440;
-    sessions.forEach(s => {
-        const startMin = parseTimeToMinutes(s.start_time);
-        const endMin = parseTimeToMinutes(s.end_time);
-        const seg = document.createElement("div");
-        seg.className = `session-segment ${segmentClass}`;
-        seg.style.left = `${(startMin / MINUTES_IN_DAY) * 100}%`;
-        seg.style.width = `${(Math.max(endMin - startMin, 0.2) / MINUTES_IN_DAY) * 100}%`;
-        seg.title = `${formatTimeFromISO(s.start_time)} - ${formatTimeFromISO(s.end_time)}  (${formatDuration(s.duration)})`;
-        bar.appendChild(seg);
+function addSegment(bar, s, segmentClass) {
+    const seg = document.createElement("div");
+    seg.className = `session-segment ${segmentClass}`;
+    placeSegment(seg, s.start_time, s.end_time);
+    seg.title = `${formatTimeFromISO(s.start_time)} - ${formatTimeFromISO(s.end_time)}  (${formatDuration(s.duration)})`;
+    bar.appendChild(seg);
+    return seg;
+}
+
+function placeSegment(seg, startTime, endTime) {
+    const startMin = parseTimeToMinutes(startTime);
+    const endMin = parseTimeToMinutes(endTime);
+    seg.style.left = `${(startMin / MINUTES_IN_DAY) * 100}%`;
+    seg.style.width = `${(Math.max(endMin - startMin, 0.2) / MINUTES_IN_DAY) * 100}%`;
+}
+
+// --- Live updates (today only) ---
+
+let liveSource = null;
+let liveTypes = {};
+// One timer per page: a reload reopens the stream but keeps this one
+let liveTimer = null;
+
+// Server-Sent Events from /api/stream: committed sessions are appended to the
+// timelines and table, the stat cards are replaced, and the sessions still in
+// progress are drawn as live segments that grow until they are committed
+function startLiveUpdates(dateStr) {
+    if (liveSource || !window.EventSource) return;
+    liveSource = new EventSource(`/api/stream?date=${dateStr}&after=${dayState.lastId}`);
+    liveSource.addEventListener("session", e => addLiveSession(JSON.parse(e.data)));
+    liveSource.addEventListener("summary", e => updateStatCards(JSON.parse(e.data)));
+    liveSource.addEventListener("live", e => {
+        liveTypes = JSON.parse(e.data);
+        renderLiveSegments();
     });
+    liveSource.addEventListener("reload", () => {
+        liveSource.close();
+        liveSource = null;
+        loadDayView(dateStr);
+    });
+    // Past midnight the stream ends; move on to the new day
+    liveSource.addEventListener("day", e => {
+        liveSource.close();
+        liveSource = null;
+        window.location.href = `/day/${JSON.parse(e.data).date}`;
+    });
+    if (liveTimer === null) liveTimer = setInterval(renderLiveSegments, 1000);
 }
 
-async function loadSessionsTable(dateStr) {
-    const resp = await fetch(`/api/sessions/${dateStr}`);
-    const sessions = await resp.json();
+function addLiveSession(s) {
+    if (s.session_id <= dayState.lastId) return;
+    dayState.lastId = s.session_id;
+    dayState.sessions.push(s);
+    const bar = document.getElementById(`timeline-${s.type}`);
+    if (bar) addSegment(bar, s, `session-segment-${s.type}`);
+    dayState.cumulative = mergeInterval(dayState.cumulative, s);
+    renderTimeline(dayState.cumulative, "timeline-cumulative", "session-segment-cumulative");
+    appendSessionRow(s, dayState.sessions.length);
+    renderLiveSegments();
+}
+
+// Insert one session into the sorted, non-overlapping cumulative intervals
+function mergeInterval(intervals, s) {
+    let start = s.start_time;
+    let end = s.end_time;
+    const out = [];
+    intervals.forEach(iv => {
+        if (iv.end_time < start || iv.start_time > end) {
+            out.push(iv);
+        } else {
+            if (iv.start_time < start) start = iv.start_time;
+            if (iv.end_time > end) end = iv.end_time;
+        }
+    });
+    const duration = (new Date(end) - new Date(start)) / 1000;
+    out.push({ start_time: start, end_time: end, duration: duration });
+    out.sort((a, b) => (a.start_time < b.start_time ? -1 : 1));
+    return out;
+}
+
+function updateStatCards(summaries) {
+    document.querySelectorAll("[data-stat]").forEach(el => {
+        const [type, field] = el.dataset.stat.split(".");
+        if (summaries[type] && summaries[type][field] !== undefined) {
+            el.textContent = summaries[type][field];
+        }
+    });
+}
+
+function renderLiveSegments() {
+    ["mouse", "keyboard"].forEach(type => {
+        const bar = document.getElementById(`timeline-${type}`);
+        if (!bar) return;
+        const state = liveTypes[type] || {};
+        let span = null;
+        if (state.open) {
+            span = { start_time: state.open.start_time, end_time: localNowISO() };
+        } else if (state.last_closed &&
+                   !dayState.sessions.some(s => s.type === type && s.start_time === state.last_closed.start_time)) {
+            // Closed but not committed yet (the writer batches for a couple of seconds)
+            span = state.last_closed;
+        }
+        let seg = document.getElementById(`live-${type}`);
+        if (!span) {
+            if (seg) seg.remove();
+            return;
+        }
+        if (!seg) {
+            seg = document.createElement("div");
+            seg.id = `live-${type}`;
+            seg.className = `session-segment session-segment-${type} session-segment-live`;
+            bar.appendChild(seg);
+        }
+        placeSegment(seg, span.start_time, span.end_time);
+        seg.title = `${formatTimeFromISO(span.start_time)} - ${state.open ? "now" : formatTimeFromISO(span.end_time)}`;
+    });
+}
+
+function renderSessionsTable(sessions) {
     const tbody = document.querySelector("#sessions-table tbody");
     const noSessions = document.getElementById("no-sessions");
     tbody.innerHTML = "";
@@ -77,19 +204,24 @@ async function loadSessionsTable(dateStr) {
     noSessions.classList.add("hidden");
     document.getElementById("sessions-table").classList.remove("hidden");
 
-    sessions.forEach((s, i) => {
-        const tr = document.createElement("tr");
-        const typeLabel = s.type === "mouse" ? "Mouse" : "Keyboard";
-        const typeClass = s.type === "mouse" ? "mouse-color" : "keyboard-color";
-        tr.innerHTML = `
-            <td>${i + 1}</td>
-            <td><span class="${typeClass}">${typeLabel}</span></td>
-            <td>${formatTimeFromISO(s.start_time)}</td>
-            <td>${formatTimeFromISO(s.end_time)}</td>
-            <td>${formatDuration(s.duration)}</td>
-        `;
-        tbody.appendChild(tr);
-    });
+    sessions.forEach((s, i) => appendSessionRow(s, i + 1));
+}
+
+function appendSessionRow(s, number) {
+    const tbody = document.querySelector("#sessions-table tbody");
+    document.getElementById("no-sessions").classList.add("hidden");
+    document.getElementById("sessions-table").classList.remove("hidden");
+    const tr = document.createElement("tr");
+    const typeLabel = s.type === "mouse" ? "Mouse" : "Keyboard";
+    const typeClass = s.type === "mouse" ? "mouse-color" : "keyboard-color";
+    tr.innerHTML = `
+        <td>${number}</td>
+        <td><span class="${typeClass}">${typeLabel}</span></td>
+        <td>${formatTimeFromISO(s.start_time)}</td>
+        <td>${formatTimeFromISO(s.end_time)}</td>
+        <td>${formatDuration(s.duration)}</td>
+    `;
+    tbody.appendChild(tr);
 }
 
 // --- Week view ---
@@ -99,16 +231,10 @@ async function loadWeekChart(startDate, endDate) {
     if (!container) return;
     container.innerHTML = "";
 
-    const resp = await fetch(`/api/sessions/${startDate}/${endDate}`);
-    const sessions = await resp.json();
-
-    // Group sessions by date
-    const byDate = {};
-    sessions.forEach(s => {
-        const d = s.start_time.split("T")[0];
-        if (!byDate[d]) byDate[d] = [];
-        byDate[d].push(s);
-    });
+    // Per-minute activity runs per day, computed server-side
+    const resp = await fetch(`/api/timeline/${startDate}/${endDate}?resolution=60`);
+    const timeline = await resp.json();
+    const bucketsPerDay = timeline.buckets_per_day;
 
     // Hour labels (shared across all rows)
     const hours = document.createElement("div");
@@ -122,13 +248,13 @@ async function loadWeekChart(startDate, endDate) {
 
     const dayNames = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"];
     const start = new Date(startDate + "T12:00:00");
-    const MINUTES_IN_DAY = 1440;
+    const minutesPerBucket = timeline.resolution / 60;
 
     for (let i = 0; i < 7; i++) {
         const d = new Date(start);
         d.setDate(d.getDate() + i);
         const iso = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
-        const daySessions = byDate[iso] || [];
+        const dayRuns = timeline.days[iso] || {};
 
         const row = document.createElement("div");
         row.className = "week-row";
@@ -140,16 +266,15 @@ async function loadWeekChart(startDate, endDate) {
         const bar = document.createElement("div");
         bar.className = "week-timeline-bar";
 
-        daySessions.forEach(s => {
-            const startMin = parseTimeToMinutes(s.start_time);
-            const endMin = parseTimeToMinutes(s.end_time);
-            const seg = document.createElement("div");
-            const segClass = s.type === "mouse" ? "session-segment-mouse" : "session-segment-keyboard";
-            seg.className = `session-segment ${segClass}`;
-            seg.style.left = `${(startMin / MINUTES_IN_DAY) * 100}%`;
-            seg.style.width = `${(Math.max(endMin - startMin, 0.2) / MINUTES_IN_DAY) * 100}%`;
-            seg.title = `${s.type === "mouse" ? "Mouse" : "Keyboard"}: ${formatTimeFromISO(s.start_time)} - ${formatTimeFromISO(s.end_time)} (${formatDuration(s.duration)})`;
-            bar.appendChild(seg);
+        ["mouse", "keyboard"].forEach(type => {
+            (dayRuns[type] || []).forEach(([first, length]) => {
+                const seg = document.createElement("div");
+                seg.className = `session-segment session-segment-${type}`;
+                seg.style.left = `${(first / bucketsPerDay) * 100}%`;
+                seg.style.width = `${(length / bucketsPerDay) * 100}%`;
+                seg.title = `${type === "mouse" ? "Mouse" : "Keyboard"}: ${formatMinutes(first * minutesPerBucket)} - ${formatMinutes((first + length) * minutesPerBucket)}`;
+                bar.appendChild(seg);
+            });
         });
 
         row.appendChild(label);
@@ -215,16 +340,129 @@ async function loadMonthChart(startDate, endDate) {
     container.appendChild(grid);
 }
 
-// --- Range session table (week/month) ---
+// --- Year view ---
+
+const DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"];
+
+// GitHub-style calendar: one column per week, one cell per day, from the daily rollups
+async function loadYearChart(startDate, endDate) {
+    const container = document.getElementById("year-chart");
+    if (!container) return;
+    container.innerHTML = "";
+
+    const resp = await fetch(`/api/daily-totals/${startDate}/${endDate}`);
+    const byDate = await resp.json();
+
+    let maxDuration = 0;
+    Object.values(byDate).forEach(v => { if (v > maxDuration) maxDuration = v; });
+    if (maxDuration === 0) maxDuration = 1;
+
+    const firstDay = new Date(startDate + "T12:00:00");
+    const startDow = (firstDay.getDay() + 6) % 7; // Mon=0
+
+    // Month labels above the week in which each month starts
+    const months = document.createElement("div");
+    months.className = "year-months";
+    const monthCells = [document.createElement("span")];
+    for (let w = 0; w < 53; w++) monthCells.push(document.createElement("span"));
+    for (let m = 0; m < 12; m++) {
+        const first = new Date(firstDay.getFullYear(), m, 1, 12);
+        const dayOfYear = Math.round((first - firstDay) / 86400000);
+        const week = Math.floor((dayOfYear + startDow) / 7);
+        monthCells[week + 1].textContent = first.toLocaleString("en", { month: "short" });
+    }
+    monthCells.forEach(c => months.appendChild(c));
+    container.appendChild(months);
+
+    const grid = document.createElement("div");
+    grid.className = "year-grid";
+    DAY_NAMES.forEach((name, i) => {
+        const label = document.createElement("span");
+        label.className = "year-label";
+        label.textContent = i % 2 === 0 ? name : "";
+        grid.appendChild(label);
+    });
+
+    for (let i = 0; i < startDow; i++) {
+        const empty = document.createElement("div");
+        empty.className = "year-cell empty";
+        grid.appendChild(empty);
+    }
+
+    const endD = new Date(endDate + "T12:00:00");
+    for (let d = new Date(firstDay); d <= endD; d.setDate(d.getDate() + 1)) {
+        const iso = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
+        const duration = byDate[iso] || 0;
+        const cell = document.createElement("div");
+        cell.className = "year-cell";
+        if (duration > 0) {
+            cell.style.backgroundColor = "var(--color-cumulative)";
+            cell.style.opacity = 0.2 + (duration / maxDuration) * 0.8;
+        }
+        cell.title = `${iso}: ${formatDuration(duration)}`;
+        grid.appendChild(cell);
+    }
+
+    container.appendChild(grid);
+}
+
+// --- Hour x weekday heatmap (week/month/year) ---
+
+async function loadHeatmap(startDate, endDate) {
+    const container = document.getElementById("heatmap");
+    if (!container) return;
+    container.innerHTML = "";
+
+    const resp = await fetch(`/api/heatmap/${startDate}/${endDate}`);
+    const grid = await resp.json();
+
+    let maxSeconds = 0;
+    grid.forEach(row => row.forEach(v => { if (v > maxSeconds) maxSeconds = v; }));
+    if (maxSeconds === 0) maxSeconds = 1;
+
+    container.appendChild(document.createElement("span"));
+    for (let h = 0; h < 24; h++) {
+        const label = document.createElement("span");
+        label.className = "heatmap-label";
+        label.textContent = h % 3 === 0 ? String(h).padStart(2, "0") : "";
+        container.appendChild(label);
+    }
+
+    grid.forEach((row, weekday) => {
+        const label = document.createElement("span");
+        label.className = "heatmap-label";
+        label.textContent = DAY_NAMES[weekday];
+        container.appendChild(label);
+        row.forEach((seconds, h) => {
+            const cell = document.createElement("div");
+            cell.className = "heatmap-cell";
+            if (seconds > 0) {
+                cell.style.backgroundColor = "var(--color-cumulative)";
+                cell.style.opacity = 0.15 + (seconds / maxSeconds) * 0.85;
+            }
+            cell.title = `${DAY_NAMES[weekday]} ${String(h).padStart(2, "0")}:00  ${formatDuration(seconds)}`;
+            container.appendChild(cell);
+        });
+    });
+}
 
-async function loadSessionsTableRange(startDate, endDate) {
-    const resp = await fetch(`/api/sessions/${startDate}/${endDate}`);
-    const sessions = await resp.json();
+// --- Range session table (week/month/year) ---
+
+const SESSION_PAGE_SIZE = 500;
+
+// Pages through the range with keyset cursors; more rows load on demand
+async function loadSessionsTableRange(startDate, endDate, after = null, offset = 0) {
+    let url = `/api/sessions/${startDate}/${endDate}?limit=${SESSION_PAGE_SIZE}`;
+    if (after !== null) url += `&after=${encodeURIComponent(after)}`;
+    const resp = await fetch(url);
+    const page = await resp.json();
+    const sessions = page.sessions;
     const tbody = document.querySelector("#sessions-table tbody");
     const noSessions = document.getElementById("no-sessions");
-    tbody.innerHTML = "";
+    const loadMore = document.getElementById("load-more");
+    if (after === null) tbody.innerHTML = "";
 
-    if (sessions.length === 0) {
+    if (sessions.length === 0 && after === null) {
         noSessions.classList.remove("hidden");
         document.getElementById("sessions-table").classList.add("hidden");
         return;
@@ -239,7 +477,7 @@ async function loadSessionsTableRange(startDate, endDate) {
         const typeClass = s.type === "mouse" ? "mouse-color" : "keyboard-color";
         const sessionDate = s.start_time.split("T")[0];
         tr.innerHTML = `
-            <td>${i + 1}</td>
+            <td>${offset + i + 1}</td>
             <td>${sessionDate}</td>
             <td><span class="${typeClass}">${typeLabel}</span></td>
             <td>${formatTimeFromISO(s.start_time)}</td>
@@ -248,10 +486,28 @@ async function loadSessionsTableRange(startDate, endDate) {
         `;
         tbody.appendChild(tr);
     });
+
+    if (page.next_after !== null) {
+        loadMore.classList.remove("hidden");
+        loadMore.onclick = () => loadSessionsTableRange(startDate, endDate, page.next_after, offset + sessions.length);
+    } else {
+        loadMore.classList.add("hidden");
+    }
 }
 
 // --- Helpers ---
 
+function localToday() {
+    return localNowISO().substring(0, 10);
+}
+
+// Local wall-clock time in the same ISO form the server uses (no zone)
+function localNowISO() {
+    const now = new Date();
+    const offset = now.getTimezoneOffset() * 60000;
+    return new Date(now - offset).toISOString().substring(0, 19);
+}
+
 function parseTimeToMinutes(isoString) {
     const timePart = isoString.split("T")[1];
     if (!timePart) return 0;
@@ -268,6 +524,12 @@ function formatTimeFromISO(isoString) {
     return timePart.substring(0, 8);
 }
 
+function formatMinutes(minutes) {
+    const h = Math.floor(minutes / 60);
+    const m = Math.round(minutes % 60);
+    return `${String(h).padStart(2, "0")}:${String(m).padStart(2, "0")}`;
+}
+
 function formatDuration(seconds) {
     seconds = Math.round(seconds);
     const h = Math.floor(seconds / 3600);
@@ -0,0 +1,13 @@
+"""Shared by the two storage backends, db.py and bitmaps.py."""
+
+# Pseudo session type of the cumulative (mouse OR keyboard) series
+CUMULATIVE = "any"
+
+
+def summarize(total, count) -> dict:
+    """The {total_duration, session_count, avg_duration} dict of every summary query."""
+    return {
+        "total_duration": round(total, 2),
+        "session_count": count,
+        "avg_duration": round(total / count, 2) if count else 0,
+    }
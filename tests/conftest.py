@@ -0,0 +1,13 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# config reads NAT_DATA_DIR on import: point it at a scratch directory before
+# any test module imports config or db
+_data_dir = tempfile.mkdtemp(prefix="nat-tests-")
+os.environ["NAT_DATA_DIR"] = _data_dir
+atexit.register(shutil.rmtree, _data_dir, ignore_errors=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import activity_log
+from activity_log import SLOTS_PER_SECOND, ActivityLog
+
+
+def _slot(dt):
+    return int(dt.timestamp() * SLOTS_PER_SECOND)
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = ActivityLog(str(tmp_path), retention_days=0)
+    yield log
+    log.close()
+
+
+def test_gap_of_exactly_the_threshold_keeps_the_session(log, tmp_path):
+    t = datetime(2026, 6, 1, 10)
+    first = _slot(t)
+    # Runs of slots 0-9, 39-49 (30 slots after) and 80-89 (31 slots after)
+    slots = list(range(first, first + 10)) + list(range(first + 39, first + 50)) \
+        + list(range(first + 80, first + 90))
+    log.append("mouse", slots, 0.0)
+    sessions = list(activity_log.resessionize(3, log_dir=str(tmp_path)))
+    assert [(s - t.timestamp(), e - t.timestamp()) for _, s, e in sessions] == [
+        pytest.approx((0.0, 4.9)), pytest.approx((8.0, 8.9)),
+    ]
+
+
+def test_old_day_files_are_deleted(tmp_path):
+    log = ActivityLog(str(tmp_path), retention_days=2)
+    start = datetime(2026, 6, 1, 12)
+    for days in range(5):
+        t = start + timedelta(days=days)
+        log.append("keyboard", [_slot(t)], 0.0)
+    log.close()
+    assert activity_log.logged_days(log_dir=str(tmp_path)) == [
+        "2026-06-03", "2026-06-04", "2026-06-05",
+    ]
+
+
+def test_apply_is_refused_when_pushing_to_a_collector(monkeypatch, tmp_path):
+    monkeypatch.setattr(activity_log, "COLLECTOR_URL", "http://collector:5000")
+    with pytest.raises(RuntimeError):
+        activity_log.apply(3, log_dir=str(tmp_path))
@@ -0,0 +1,82 @@
+"""The NumPy and pure-Python paths of analytics.py must agree."""
+from datetime import datetime, timedelta
+import random
+
+import pytest
+
+import analytics
+import db
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+backends = pytest.mark.parametrize("use_numpy", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(numpy is None, reason="numpy not installed")),
+])
+
+
+@pytest.fixture(scope="module", autouse=True)
+def history():
+    db.init_db()
+    rnd = random.Random(7)
+    t = datetime(2026, 4, 1, 8)
+    while t < datetime(2026, 4, 20):
+        length = rnd.uniform(0.5, 5000)
+        db.save_session(t, t + timedelta(seconds=length), rnd.choice(("mouse", "keyboard")))
+        t += timedelta(seconds=rnd.uniform(-length, 3000) + length)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def use(use_numpy):
+        monkeypatch.setattr(analytics, "np", numpy if use_numpy else None)
+        db.clear_cache()
+    yield use
+    db.clear_cache()
+
+
+def _compute():
+    return {
+        "overlap": analytics.get_overlap("2026-04-01", "2026-04-30"),
+        "heatmap": analytics.get_heatmap("2026-04-01", "2026-04-30"),
+        "heatmap_mouse": analytics.get_heatmap("2026-04-01", "2026-04-30", "mouse"),
+        "percentiles": analytics.get_duration_percentiles("2026-04-01", "2026-04-30"),
+        "rolling": analytics.get_rolling_totals("2026-04-01", "2026-04-30", 7),
+    }
+
+
+@pytest.mark.skipif(numpy is None, reason="numpy not installed")
+def test_backends_agree(backend):
+    backend(False)
+    python = _compute()
+    backend(True)
+    vectorized = _compute()
+    assert vectorized["overlap"] == pytest.approx(python["overlap"])
+    for key in ("heatmap", "heatmap_mouse"):
+        for a, b in zip(vectorized[key]["seconds"], python[key]["seconds"]):
+            assert a == pytest.approx(b, abs=0.02)
+    assert vectorized["percentiles"] == pytest.approx(python["percentiles"], abs=0.02)
+    assert vectorized["rolling"]["days"] == python["rolling"]["days"]
+    assert vectorized["rolling"]["totals"] == pytest.approx(python["rolling"]["totals"], abs=0.02)
+    assert vectorized["rolling"]["rolling"] == pytest.approx(python["rolling"]["rolling"], abs=0.02)
+
+
+@backends
+def test_overlap_is_mouse_plus_keyboard_minus_either(backend, use_numpy):
+    backend(use_numpy)
+    overlap = analytics.get_overlap("2026-04-01", "2026-04-30")
+    assert overlap["overlap"] > 0
+    assert overlap["overlap"] == pytest.approx(
+        overlap["mouse"] + overlap["keyboard"] - overlap["cumulative"], abs=0.02
+    )
+
+
+@backends
+def test_reversed_range_is_empty(backend, use_numpy):
+    backend(use_numpy)
+    rolling = analytics.get_rolling_totals("2026-04-30", "2026-04-01", 7)
+    assert rolling == {"window": 7, "days": [], "totals": [], "rolling": []}
+    assert analytics.get_duration_percentiles("2026-04-30", "2026-04-01")["count"] == 0
@@ -0,0 +1,70 @@
+"""The bitmap backend answers the summary queries like the SQL one."""
+from datetime import date, datetime, timedelta
+import random
+
+import pytest
+
+import bitmaps
+import db
+
+START, END = "2026-06-01", "2026-06-30"
+
+
+def _sessions(rnd):
+    # Whole seconds, at least a second apart within a type and never across an
+    # hour: runs of set bits are then the sessions, and the hourly rollups
+    # (which file a session under its start hour) see the same seconds
+    sessions = []
+    for day in range(1, 31):
+        for hour in rnd.sample(range(24), 6):
+            for session_type in ("mouse", "keyboard"):
+                t = datetime(2026, 6, day, hour, rnd.randrange(5))
+                hour_end = datetime(2026, 6, day, hour, 59, 59)
+                while True:
+                    end = t + timedelta(seconds=rnd.randrange(1, 600))
+                    if end > hour_end:
+                        break
+                    sessions.append((t, end, session_type))
+                    t = end + timedelta(seconds=rnd.choice((1, 2, 30, 400)))
+    return sessions
+
+
+@pytest.fixture(scope="module")
+def conn():
+    db.init_db()
+    for start, end, session_type in _sessions(random.Random(5)):
+        db.save_session(start, end, session_type)
+    db.convert_to_bitmaps()
+    conn = db._get_conn(readonly=True)
+    yield conn
+    conn.close()
+
+
+def _weeks():
+    monday = date(2026, 6, 1)
+    while monday.isoformat() <= END:
+        yield monday.isoformat(), min((monday + timedelta(days=6)).isoformat(), END)
+        monday += timedelta(days=7)
+
+
+@pytest.mark.parametrize("session_type", ["mouse", "keyboard", None, db.CUMULATIVE])
+def test_summaries_match(conn, session_type):
+    days = [(f"2026-06-{d:02d}",) * 2 for d in (1, 14, 30)]
+    for start, end in [*days, *_weeks(), (START, END)]:
+        assert bitmaps.get_summary_for_range(start, end, session_type, conn=conn) == \
+            db.get_summary_for_range(start, end, session_type, conn=conn), (start, end)
+
+
+def test_merged_queries_match(conn):
+    assert bitmaps.get_merged_summary_for_range(START, END, conn=conn) == \
+        db.get_merged_summary_for_range(START, END, conn=conn)
+    assert bitmaps.get_merged_daily_totals(START, END, conn=conn) == \
+        db.get_merged_daily_totals(START, END, conn=conn)
+    assert bitmaps.get_cumulative_intervals("2026-06-10", conn=conn) == \
+        db.get_cumulative_intervals("2026-06-10", conn=conn)
+
+
+@pytest.mark.parametrize("session_type", ["mouse", "keyboard", None])
+def test_heatmap_matches(conn, session_type):
+    assert bitmaps.get_weekday_hour_heatmap(START, END, session_type, conn=conn) == \
+        db.get_weekday_hour_heatmap(START, END, session_type, conn=conn)
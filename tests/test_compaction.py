@@ -0,0 +1,68 @@
+"""Compaction changes session counts, never the active time derived from them."""
+from datetime import datetime, timedelta
+import random
+
+import pytest
+
+import analytics
+import compaction
+import db
+
+START, END = "2026-05-01", "2026-05-10"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def history():
+    db.init_db()
+    rnd = random.Random(11)
+    for session_type, offset in (("mouse", 0), ("keyboard", 1.5)):
+        t = datetime(2026, 5, 1, 9) + timedelta(seconds=offset)
+        while t < datetime(2026, 5, 9):
+            length = rnd.uniform(1, 30)
+            db.save_session(t, t + timedelta(seconds=length), session_type)
+            # Mostly gaps compaction merges across, now and then a long pause
+            t += timedelta(seconds=length + rnd.choice((1, 2, 4, 4.5, 900, 40000)))
+    # Same-type sessions that overlap or touch (a backfill, two machines'
+    # trackers): compaction merges their rows, not their durations
+    t = datetime(2026, 5, 9, 12)
+    for start, length in ((0, 20), (5, 10), (30, 12), (42, 3), (44, 1)):
+        db.save_session(t + timedelta(seconds=start), t + timedelta(seconds=start + length), "mouse")
+    db.clear_cache()
+
+
+def _derived():
+    conn = db._get_conn(readonly=True)
+    try:
+        summary = db.get_summary_for_range(START, END, db.CUMULATIVE, conn=conn)
+        timeline = db.get_timeline_buckets(START, END, 5, conn=conn)
+    finally:
+        conn.close()
+    return {
+        "cumulative": summary["total_duration"],
+        "timeline": timeline,
+        "overlap": analytics.get_overlap(START, END),
+        "percentiles": analytics.get_duration_percentiles(START, END),
+    }
+
+
+def test_compacted_rows_keep_their_active_spans():
+    before = _derived()
+    conn = db._get_conn()
+    removed = 0
+    for shard in conn.shards(START, END):
+        days = [r[0] for r in shard.execute("SELECT DISTINCT day FROM sessions ORDER BY day")]
+        for day in days:
+            with conn:
+                removed += compaction.compact_day(shard, day, max_gap=5.0)
+    conn.close()
+    assert removed > 0
+
+    # Rebuilding the aggregates from the compacted rows gives the same intervals
+    db.rebuild_rollups()
+    db.clear_cache()
+    after = _derived()
+    assert after["cumulative"] == pytest.approx(before["cumulative"], abs=0.1)
+    assert after["timeline"] == before["timeline"]
+    assert after["overlap"] == pytest.approx(before["overlap"], abs=0.1)
+    # Percentiles stay those of the original sessions
+    assert after["percentiles"] == before["percentiles"]
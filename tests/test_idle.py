@@ -0,0 +1,170 @@
+import threading
+
+import pytest
+
+import config
+from idle import IdleScheduler
+from input_tracker import InputTracker
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(config, "IDLE_THRESHOLD_SECONDS", 3)
+    return FakeClock()
+
+
+def _trackers(clock, sink):
+    return [
+        InputTracker(t, clock=clock, on_session_close=lambda *s: sink.append(s))
+        for t in ("mouse", "keyboard")
+    ]
+
+
+def test_no_deadline_without_open_sessions(clock):
+    scheduler = IdleScheduler(_trackers(clock, []), clock=clock)
+    assert scheduler.run_pending() is None
+
+
+def test_sessions_close_at_their_deadline(clock):
+    closed = []
+    mouse, keyboard = _trackers(clock, closed)
+    scheduler = IdleScheduler([mouse, keyboard], clock=clock)
+    mouse.on_event()
+    clock.now += 1
+    keyboard.on_event()
+    clock.now += 1
+    mouse.on_event()
+    assert scheduler.run_pending() == pytest.approx(1004.0)  # keyboard's deadline
+
+    clock.now = 1004.0
+    assert scheduler.run_pending() == pytest.approx(1005.0)  # mouse's deadline
+    assert [s[2] for s in closed] == ["keyboard"]
+
+    clock.now = 1004.9
+    scheduler.run_pending()
+    assert len(closed) == 1
+
+    clock.now = 1005.0
+    assert scheduler.run_pending() is None
+    start, end, session_type = closed[1]
+    assert session_type == "mouse"
+    assert (end - start).total_seconds() == pytest.approx(2.0)
+
+
+def test_new_input_moves_the_deadline(clock):
+    closed = []
+    mouse, _ = _trackers(clock, closed)
+    scheduler = IdleScheduler([mouse], clock=clock)
+    mouse.on_event()
+    clock.now += 2.5
+    mouse.on_event()
+    clock.now = 1003.0  # the first event's deadline, now stale
+    assert scheduler.run_pending() == pytest.approx(1005.5)
+    assert closed == []
+
+
+def test_threshold_change_applies_to_open_sessions(clock, monkeypatch):
+    closed = []
+    mouse, _ = _trackers(clock, closed)
+    scheduler = IdleScheduler([mouse], clock=clock)
+    mouse.on_event()
+    monkeypatch.setattr(config, "IDLE_THRESHOLD_SECONDS", 10)
+    assert scheduler.next_deadline() == pytest.approx(1010.0)
+
+
+def test_notify_does_not_wait_for_sessions_being_saved(clock):
+    saving = threading.Event()
+    release = threading.Event()
+
+    def slow_sink(*session):
+        saving.set()
+        release.wait(5)
+
+    mouse = InputTracker("mouse", clock=clock, on_session_close=slow_sink)
+    scheduler = IdleScheduler([mouse], clock=clock)
+    mouse.on_event()
+    clock.now += 5
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    try:
+        assert saving.wait(5)
+        notified = threading.Thread(target=scheduler.notify, daemon=True)
+        notified.start()
+        notified.join(1)
+        assert not notified.is_alive(), "notify() blocked behind a session save"
+    finally:
+        release.set()
+        scheduler.stop()
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+class SlotSink:
+    """Stands in for ActivityLog: keeps each handed-off slot array and its length."""
+
+    def __init__(self):
+        self.batches = []
+
+    def append(self, session_type, slots, offset):
+        self.batches.append((slots, len(slots), offset))
+
+
+class PreemptedTracker(InputTracker):
+    """Replays the interleaving where the idle check has decided to close the
+    session and the event ending the pause stores its time before the close."""
+
+    checkers = ()
+    stored = None
+
+    def __setattr__(self, name, value):
+        previous = self.__dict__.get(name)
+        if name != "last_event_time" or None in (previous, value) or \
+                value - previous < config.IDLE_THRESHOLD_SECONDS:
+            return super().__setattr__(name, value)
+        self.stored = threading.Event()
+        checker = threading.Thread(target=self.check_idle, kwargs={"now": value})
+        self.checkers += (checker,)
+        checker.start()
+        # Long enough for the check to reach the close, unless it waits on a
+        # lock the event thread holds
+        checker.join(0.05)
+        super().__setattr__(name, value)
+        self.stored.set()
+        checker.join(0.05)
+
+    def _close_session(self):
+        if self.stored is not None:
+            self.stored.wait(0.2)
+        return super()._close_session()
+
+
+def test_events_racing_a_close_stay_out_of_the_closed_session(clock):
+    closed, sink = [], SlotSink()
+    tracker = PreemptedTracker(
+        "mouse", clock=clock, on_session_close=lambda *s: closed.append(s), activity_log=sink
+    )
+    # Bursts of events 0.1 s apart, each after a pause of twice the threshold
+    events = [1000.0 + burst * 10 + i * 0.1 for burst in range(10) for i in range(5)]
+    for t in events:
+        tracker._record(t)
+    for checker in tracker.checkers:
+        checker.join(5)
+    tracker.flush()
+
+    assert closed
+    slots = []
+    for (start, end, _), (batch, length, offset) in zip(closed, sink.batches, strict=True):
+        assert len(batch) == length, "a slot was appended after the handoff"
+        # Each session starts and ends on its own first and last event
+        assert round((start.timestamp() - offset) * 10) == batch[0]
+        assert round((end.timestamp() - offset) * 10) == batch[-1]
+        slots += batch
+    assert slots == [int(t * 10) for t in events]
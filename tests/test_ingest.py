@@ -0,0 +1,147 @@
+from datetime import datetime
+import gzip
+import importlib
+import json
+
+import pytest
+
+import config
+import db
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "COLLECTOR_ENABLED", True)
+    monkeypatch.setattr(config, "COLLECTOR_TOKEN", "s3cret")
+    import collector
+    import dashboard
+
+    dashboard = importlib.reload(dashboard)
+    db.init_db()
+    yield dashboard.app.test_client(), collector
+    monkeypatch.setattr(config, "COLLECTOR_ENABLED", False)
+    importlib.reload(dashboard)
+
+
+def _post(client, collector, sessions, token="s3cret", **kwargs):
+    body = json.dumps({"host": "laptop", "sessions": sessions}).encode()
+    return client.post(
+        "/api/ingest", data=body, headers={collector.TOKEN_HEADER: token}, **kwargs
+    )
+
+
+def test_batch_is_stored(client):
+    client, collector = client
+    answer = _post(client, collector, [[1, "mouse", "2026-08-03T10:00:00", "2026-08-03T10:00:09"]])
+    assert answer.status_code == 200
+    assert answer.get_json()["inserted"] == 1
+
+
+def test_refused_without_a_token_configured(client, monkeypatch):
+    client, collector = client
+    monkeypatch.setattr(config, "COLLECTOR_TOKEN", None)
+    answer = _post(client, collector, [], token="")
+    assert answer.status_code == 403
+
+
+def test_wrong_token(client):
+    client, collector = client
+    assert _post(client, collector, [], token="guess").status_code == 403
+
+
+def test_plain_body_is_capped(client, monkeypatch):
+    client, collector = client
+    monkeypatch.setattr(collector, "MAX_BATCH_BYTES", 1000)
+    sessions = [[1, "mouse", "2026-08-03T10:00:00", "2026-08-03T10:00:09"]] * 40
+    assert _post(client, collector, sessions).status_code == 413
+    body = gzip.compress(json.dumps({"host": "laptop", "sessions": sessions}).encode())
+    answer = client.post(
+        "/api/ingest", data=body,
+        headers={collector.TOKEN_HEADER: "s3cret", "Content-Encoding": "gzip"},
+    )
+    assert answer.status_code == 400
+
+
+def test_timestamps_with_an_offset_are_rejected(client):
+    client, collector = client
+    answer = _post(
+        client, collector, [[2, "mouse", "2026-08-03T10:00:00+02:00", "2026-08-03T10:00:09+02:00"]]
+    )
+    assert answer.status_code == 400
+
+
+@pytest.fixture
+def lan_client(monkeypatch):
+    monkeypatch.setattr(config, "COLLECTOR_ENABLED", True)
+    monkeypatch.setattr(config, "COLLECTOR_TOKEN", "s3cret")
+    monkeypatch.setattr(config, "DASHBOARD_HOST", "0.0.0.0")
+    import metrics
+    import dashboard
+
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    dashboard = importlib.reload(dashboard)
+    db.init_db()
+    yield dashboard.app.test_client()
+    monkeypatch.undo()
+    importlib.reload(dashboard)
+
+
+LAN = {"REMOTE_ADDR": "192.168.1.20"}
+
+
+def test_lan_requests_need_the_token(lan_client):
+    for path in ("/", "/api/dates", "/api/summary/2026-08-03", "/settings"):
+        assert lan_client.get(path, environ_base=LAN).status_code == 403, path
+    before = config.load_settings()
+    answer = lan_client.post("/settings", data={"idle_threshold": "60"}, environ_base=LAN)
+    assert answer.status_code == 403
+    assert config.load_settings() == before
+
+    for token, status in (("s3cret", 200), ("guess", 403)):
+        answer = lan_client.get("/api/dates", environ_base=LAN, headers={"X-NAT-Token": token})
+        assert answer.status_code == status
+    # This machine needs none
+    assert lan_client.get("/api/dates").status_code == 200
+
+
+def test_token_in_the_url_is_kept_in_a_cookie(lan_client):
+    assert lan_client.get("/api/dates?token=guess", environ_base=LAN).status_code == 403
+    assert lan_client.get("/api/dates?token=s3cret", environ_base=LAN).status_code == 200
+    assert lan_client.get("/api/dates", environ_base=LAN).status_code == 200
+
+
+def test_ingest_from_the_lan_still_works(lan_client):
+    body = json.dumps({"host": "laptop", "sessions": []}).encode()
+    answer = lan_client.post(
+        "/api/ingest", data=body, headers={"X-NAT-Token": "s3cret"}, environ_base=LAN
+    )
+    assert answer.status_code == 200
+
+
+@pytest.mark.parametrize("session", [
+    [3, "mouse", "2026-08-04T10:00:00"],
+    [3, "mouse", "2026-08-04T10:00:00", "2026-08-04T10:00:09", [], "extra"],
+    {"id": 3},
+])
+def test_sessions_of_the_wrong_shape_are_rejected(client, session):
+    client, collector = client
+    assert _post(client, collector, [session]).status_code == 400
+    with pytest.raises(ValueError):
+        db.ingest_sessions("laptop", [session])
+
+
+def test_compacted_row_keeps_its_parts(client):
+    client, collector = client
+    start = datetime(2026, 8, 5, 9).timestamp()
+    parts = [[start, start + 10], [start + 50, start + 60]]
+    session = [7, "keyboard", "2026-08-05T09:00:00", "2026-08-05T09:01:00", parts]
+    assert _post(client, collector, [session]).get_json()["inserted"] == 1
+    conn = db._get_conn(readonly=True)
+    try:
+        duration, stored = conn.shard("2026-08-05").execute(
+            "SELECT duration, parts FROM sessions WHERE host = 'laptop' AND source_id = 7"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert duration == 20.0
+    assert db._row_spans(None, None, stored) == tuple(map(tuple, parts))
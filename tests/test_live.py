@@ -0,0 +1,75 @@
+import threading
+import time
+from datetime import date
+
+import live
+
+
+class FakeTracker:
+    session_type = "mouse"
+    session_start = None
+    last_closed = None
+
+    def open_session(self):
+        return None
+
+
+def test_heartbeat_only_while_a_session_is_open(monkeypatch, tmp_path):
+    writes = []
+    written = threading.Event()
+
+    def write_state(trackers, path):
+        writes.append(time.monotonic())
+        written.set()
+
+    monkeypatch.setattr(live, "write_state", write_state)
+    tracker = FakeTracker()
+    publisher = live.LivePublisher([tracker], str(tmp_path / "live.json"), heartbeat=0.02)
+    publisher.start()
+    try:
+        assert written.wait(2)
+        time.sleep(0.2)
+        assert len(writes) == 1
+
+        tracker.session_start = 1.0
+        publisher.poke()
+        time.sleep(0.2)
+        assert len(writes) >= 4
+
+        tracker.session_start = None
+        publisher.poke()
+        time.sleep(0.1)
+        idle = len(writes)
+        time.sleep(0.2)
+        assert len(writes) == idle
+    finally:
+        publisher.stop()
+
+
+def test_missing_or_stale_state_is_nothing_live(tmp_path):
+    path = str(tmp_path / "live.json")
+    assert live.read_state(path) is None
+    live.write_state([FakeTracker()], path)
+    assert live.read_state(path)["types"]["mouse"]["open"] is None
+    assert live.read_state(path, max_age=-1) is None
+
+
+def test_stream_following_today_ends_at_midnight(monkeypatch):
+    import dashboard
+    import db
+
+    db.init_db()
+    today = [date(2026, 7, 1)]
+
+    class FakeDate(date):
+        @classmethod
+        def today(cls):
+            return today[0]
+
+    monkeypatch.setattr(dashboard, "date", FakeDate)
+    monkeypatch.setattr(dashboard, "STREAM_POLL_SECONDS", 0)
+    stream = dashboard._stream_events("2026-07-01", None)
+    assert "event: summary" in next(stream)
+    today[0] = date(2026, 7, 2)
+    assert next(stream) == 'event: day\ndata: {"date":"2026-07-02"}\n\n'
+    assert next(stream, None) is None
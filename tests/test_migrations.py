@@ -0,0 +1,102 @@
+"""A single-file database from before the schema versions migrates into shards.
+
+Runs init_db in a child process: the data directory is fixed at import time.
+"""
+from datetime import datetime, timedelta
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHECK = """
+import json
+import db
+
+db.init_db()
+db.init_db()
+conn = db._get_conn(readonly=True)
+shards = {}
+for month in db._shard_months():
+    shard = conn.shard(f"{month}-01")
+    shards[month] = {
+        "sessions": shard.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+        "ids_in_range": shard.execute(
+            "SELECT COUNT(*) FROM sessions WHERE session_id >> 32 = ?",
+            (int(month[:4]) * 12 + int(month[5:]) - 1,),
+        ).fetchone()[0],
+        "totals": {t: d for t, d in shard.execute(
+            "SELECT type, ROUND(SUM(total_duration), 2) FROM daily_rollups GROUP BY type"
+        )},
+    }
+tables = [r[0] for r in conn.main.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+version = conn.main.execute("PRAGMA user_version").fetchone()[0]
+conn.close()
+print(json.dumps({
+    "version": version,
+    "schema_version": db.SCHEMA_VERSION,
+    "shards": shards,
+    "old_tables": sorted(set(tables) & {"sessions", "rollups", "merged_intervals"}),
+    "range": db.get_summary_for_range("2025-01-01", "2025-03-31", "mouse"),
+    "range_sessions": len(db.get_sessions_for_range("2025-01-20", "2025-02-10")),
+}))
+"""
+
+
+def _legacy_db(path):
+    """data.db as the first release wrote it: one sessions table, no versions."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE sessions (
+            session_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+            type        TEXT NOT NULL DEFAULT 'mouse',
+            start_time  TEXT NOT NULL,
+            end_time    TEXT NOT NULL,
+            duration    REAL NOT NULL
+        )
+    """)
+    sessions = []
+    t = datetime(2025, 1, 20, 9)
+    while t < datetime(2025, 3, 5):
+        for session_type, length in (("mouse", 90), ("keyboard", 40)):
+            end = t + timedelta(seconds=length)
+            sessions.append((session_type, t.isoformat(), end.isoformat(), float(length)))
+        t += timedelta(hours=7)
+    conn.executemany(
+        "INSERT INTO sessions (type, start_time, end_time, duration) VALUES (?, ?, ?, ?)",
+        sessions,
+    )
+    conn.commit()
+    conn.close()
+    return sessions
+
+
+def test_legacy_database_is_split_into_months(tmp_path):
+    sessions = _legacy_db(tmp_path / "data.db")
+    env = dict(os.environ, NAT_DATA_DIR=str(tmp_path), PYTHONPATH=ROOT)
+    out = subprocess.run(
+        [sys.executable, "-c", _CHECK], env=env, cwd=ROOT,
+        capture_output=True, text=True, timeout=60, check=True,
+    )
+    result = json.loads(out.stdout)
+
+    assert result["version"] == result["schema_version"] == 3
+    assert result["old_tables"] == []
+    expected = {}
+    for session_type, start, _, duration in sessions:
+        month = expected.setdefault(start[:7], {"sessions": 0, "totals": {}})
+        month["sessions"] += 1
+        month["totals"][session_type] = month["totals"].get(session_type, 0) + duration
+    assert sorted(result["shards"]) == ["2025-01", "2025-02", "2025-03"]
+    for month, shard in result["shards"].items():
+        assert shard["sessions"] == shard["ids_in_range"] == expected[month]["sessions"]
+        assert shard["totals"]["mouse"] == expected[month]["totals"]["mouse"]
+        assert shard["totals"]["keyboard"] == expected[month]["totals"]["keyboard"]
+
+    mouse = [s for s in sessions if s[0] == "mouse"]
+    assert result["range"]["session_count"] == len(mouse)
+    assert result["range"]["total_duration"] == sum(s[3] for s in mouse)
+    across = [s for s in sessions if "2025-01-20" <= s[1][:10] <= "2025-02-10"]
+    assert result["range_sessions"] == len(across)
@@ -0,0 +1,85 @@
+"""The range queries must reach sessions through the (day, start_ts) and
+(type, day, start_ts) indexes, never with a full table scan."""
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+
+
+@pytest.fixture(scope="module", autouse=True)
+def history():
+    db.init_db()
+    start = datetime(2026, 1, 30, 9)
+    for i in range(40):
+        t = start + timedelta(hours=6 * i)
+        db.save_session(t, t + timedelta(seconds=30), ("mouse", "keyboard")[i % 2])
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """SQL (with its parameters inlined) of every statement run on sessions."""
+    statements = []
+    connect = db._connect
+
+    def tracing_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(db, "_connect", tracing_connect)
+    # Fresh pooled handle and no cached answers, so every call reaches SQLite
+    monkeypatch.setattr(db._local, "reader", None, raising=False)
+    db.clear_cache()
+    yield statements
+    db.clear_cache()
+
+
+def _plans(statements):
+    conn = db._get_conn()
+    try:
+        shard = conn.shard("2026-02-01")
+        # The expanded SQL spells infinite parameters as Inf, which SQLite cannot parse
+        return {
+            sql: [row[3] for row in shard.execute(
+                "EXPLAIN QUERY PLAN " + sql.replace("Inf", "1e999")
+            )]
+            for sql in statements
+            if "FROM sessions" in sql and sql.lstrip().upper().startswith("SELECT")
+        }
+    finally:
+        conn.close()
+
+
+def _assert_indexed(statements, index):
+    plans = _plans(statements)
+    assert plans, "no query on sessions was run"
+    for sql, plan in plans.items():
+        assert not any(step.startswith("SCAN sessions") for step in plan), (sql, plan)
+        if "day" in sql.split("WHERE", 1)[-1]:
+            assert any(f"USING INDEX {index}" in step for step in plan), (sql, plan)
+
+
+@pytest.mark.parametrize("call, index", [
+    (lambda: db.get_sessions_for_range("2026-01-31", "2026-02-05"),
+     "idx_sessions_day_start"),
+    (lambda: db.get_sessions_for_range("2026-01-31", "2026-02-05", "mouse"),
+     "idx_sessions_type_day_start"),
+    (lambda: db.get_sessions_for_date("2026-02-02"), "idx_sessions_day_start"),
+    (lambda: db.get_sessions_for_date("2026-02-02", "keyboard"),
+     "idx_sessions_type_day_start"),
+    (lambda: list(db.iter_sessions_for_range("2026-01-31", "2026-02-05")),
+     "idx_sessions_day_start"),
+    (lambda: db.get_sessions_page("2026-01-31", "2026-02-05", limit=5),
+     "idx_sessions_day_start"),
+])
+def test_range_queries_use_day_indexes(traced, call, index):
+    call()
+    _assert_indexed(traced, index)
+
+
+def test_keyset_resume_uses_day_index(traced):
+    page = db.get_sessions_page("2026-01-31", "2026-02-05", limit=3)
+    traced.clear()
+    db.get_sessions_page("2026-01-31", "2026-02-05", after=page["next_after"], limit=3)
+    _assert_indexed(traced, "idx_sessions_day_start")
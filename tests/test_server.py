@@ -0,0 +1,48 @@
+import http.client
+import threading
+import time
+
+import pytest
+
+import db
+import dashboard
+
+
+def _workers():
+    return [t for t in threading.enumerate() if t.name.startswith("dashboard-worker")]
+
+
+@pytest.fixture
+def server():
+    db.init_db()
+    server = dashboard.make_server("127.0.0.1", 0, threads=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
+
+
+def test_open_streams_are_bounded_and_end_on_close(server):
+    # Every connection stays referenced: a closed client frees its slot
+    streams = []
+    for _ in range(3):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+        conn.request("GET", "/api/stream")
+        response = conn.getresponse()
+        if response.status == 200:
+            response.fp.readline()
+        streams.append((conn, response))
+    assert [response.status for _, response in streams] == [200, 200, 503]
+
+    server.shutdown()
+    server.server_close()
+    deadline = time.monotonic() + 5
+    while _workers() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _workers(), "a stream kept its worker after server_close()"
+    for conn, _ in streams:
+        conn.close()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+
+
+@pytest.fixture(scope="module", autouse=True)
+def history():
+    db.init_db()
+    start = datetime(2026, 3, 1, 9)
+    for i in range(30):
+        t = start + timedelta(hours=5 * i)
+        db.save_session(t, t + timedelta(seconds=5), "mouse")
+
+
+def _delete(session_id):
+    conn = db._get_conn()
+    with conn:
+        conn.shard(db._id_day(session_id)).execute(
+            "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+        )
+        db._mark_changed(conn, history=True)
+    conn.close()
+
+
+def test_pages_cover_the_range_once():
+    ids, after = [], None
+    while True:
+        page = db.get_sessions_page("2026-03-01", "2026-03-31", after=after, limit=4)
+        ids += [s["session_id"] for s in page["sessions"]]
+        after = page["next_after"]
+        if after is None:
+            break
+    assert ids == [s["session_id"] for s in db.iter_sessions_for_range("2026-03-01", "2026-03-31")]
+    assert len(set(ids)) == len(ids)
+
+
+def test_cursor_survives_deleting_its_session():
+    first = db.get_sessions_page("2026-03-01", "2026-03-31", limit=5)
+    expected = db.get_sessions_page("2026-03-01", "2026-03-31", after=first["next_after"], limit=5)
+    _delete(first["sessions"][-1]["session_id"])
+    resumed = db.get_sessions_page("2026-03-01", "2026-03-31", after=first["next_after"], limit=5)
+    assert resumed == expected
+
+
+def test_unknown_session_id_is_refused():
+    page = db.get_sessions_page("2026-03-01", "2026-03-31", limit=3)
+    gone = page["sessions"][0]["session_id"]
+    _delete(gone)
+    with pytest.raises(LookupError):
+        db.get_sessions_page("2026-03-01", "2026-03-31", after=gone, limit=3)
+    with pytest.raises(ValueError):
+        db.get_sessions_page("2026-03-01", "2026-03-31", after="2026-03-01:x:1", limit=3)
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+import pytest
+
+import config
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(config, "_settings_listeners", [])
+    monkeypatch.setattr(config, "_notified_key", [None])
+    yield
+    if os.path.exists(config.SETTINGS_PATH):
+        os.remove(config.SETTINGS_PATH)
+
+
+def _write(settings):
+    """settings.json edited in place, as another process or a text editor would."""
+    with open(config.SETTINGS_PATH, "w") as f:
+        json.dump(settings, f)
+
+
+def test_changes_reach_loads_and_listeners():
+    heard = []
+    config.on_settings_change(heard.append)
+    config.save_settings({"idle_threshold": 7})
+    assert config.load_settings()["idle_threshold"] == 7
+    assert [s["idle_threshold"] for s in heard] == [7]
+
+    config.check_settings()
+    assert len(heard) == 1
+
+    _write({"idle_threshold": 12})
+    assert config.load_settings()["idle_threshold"] == 12
+    config.check_settings()
+    assert [s["idle_threshold"] for s in heard] == [7, 12]
+
+
+def test_same_size_edit_in_the_same_mtime_tick():
+    heard = []
+    config.on_settings_change(heard.append)
+    _write({"color_mouse": "#111111"})
+    config.check_settings()
+    assert config.load_settings()["color_mouse"] == "#111111"
+
+    st = os.stat(config.SETTINGS_PATH)
+    _write({"color_mouse": "#222222"})
+    os.utime(config.SETTINGS_PATH, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(config.SETTINGS_PATH).st_size == st.st_size
+
+    assert config.load_settings()["color_mouse"] == "#222222"
+    config.check_settings()
+    assert [s["color_mouse"] for s in heard] == ["#111111", "#222222"]
+
+
+def test_concurrent_saves_never_expose_a_partial_file():
+    versions = [{"idle_threshold": i, "color_mouse": "#%06d" % i} for i in range(1, 9)]
+    seen = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            with open(config.SETTINGS_PATH) as f:
+                seen.append(json.load(f))
+
+    def save(settings):
+        for _ in range(20):
+            config.save_settings(settings)
+
+    config.save_settings(versions[0])
+    reader = threading.Thread(target=read)
+    reader.start()
+    savers = [threading.Thread(target=save, args=(v,)) for v in versions]
+    for t in savers:
+        t.start()
+    for t in savers:
+        t.join()
+    stop.set()
+    reader.join()
+
+    assert seen and all(s in versions for s in seen)
+    assert config.load_settings()["idle_threshold"] in range(1, 9)
+    assert not [n for n in os.listdir(config.DATA_DIR) if n.endswith(".tmp")]
@@ -0,0 +1,86 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+
+DAY = "2026-09-02"
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    db.init_db()
+    monkeypatch.setattr(db.SessionWriter, "STOP_RETRY_SECONDS", 0.01)
+    writer = db.SessionWriter(flush_interval=0.05)
+    writer.start()
+    yield writer
+    if writer.is_alive():
+        writer.stop()
+
+
+def _fail(monkeypatch, error, times=None):
+    """Make _insert_sessions raise ``error`` (only the first ``times`` calls if given)."""
+    insert = db._insert_sessions
+    calls = []
+
+    def failing(conn, rows):
+        calls.append(len(rows))
+        if times is None or len(calls) <= times:
+            raise error
+        insert(conn, rows)
+
+    monkeypatch.setattr(db, "_insert_sessions", failing)
+    return calls
+
+
+def _row(minute, session_type="mouse"):
+    start = datetime.fromisoformat(f"{DAY}T08:00:00") + timedelta(minutes=minute)
+    return db._session_row(start, start + timedelta(seconds=30), session_type)
+
+
+def _stored(minute):
+    start = _row(minute)[1]
+    conn = db._get_conn(readonly=True)
+    try:
+        return conn.shard(DAY).execute(
+            "SELECT COUNT(*) FROM sessions WHERE start_time = ?", (start,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_flush_reports_a_failed_commit(writer, monkeypatch):
+    _fail(monkeypatch, sqlite3.OperationalError("database is locked"), times=1)
+    writer.submit(_row(1))
+    assert writer.flush() is False
+    assert _stored(1) == 0
+    assert writer.flush() is True
+    assert _stored(1) == 1
+
+
+def test_stop_retries_the_last_commit(writer, monkeypatch):
+    calls = _fail(monkeypatch, sqlite3.OperationalError("database is locked"), times=2)
+    writer.submit(_row(2, "keyboard"))
+    assert writer.stop() is True
+    assert len(calls) == 3
+    assert _stored(2) == 1
+
+
+def test_stop_logs_what_it_could_not_save(writer, monkeypatch, caplog):
+    _fail(monkeypatch, sqlite3.OperationalError("database is locked"))
+    writer.submit(_row(3, "keyboard"))
+    with caplog.at_level(logging.ERROR, logger="db"):
+        assert writer.stop() is False
+    assert writer.sessions_lost == 1
+    assert _row(3)[1] in caplog.text
+
+
+def test_unexpected_errors_do_not_end_the_thread(writer, monkeypatch):
+    _fail(monkeypatch, RuntimeError("boom"), times=1)
+    writer.submit(_row(4))
+    assert writer.flush() is False
+    assert writer.is_alive()
+    assert writer.flush() is True
+    assert _stored(4) == 1
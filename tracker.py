@@ -1,49 +1,20 @@
 import os
 import sys
-import time
 import msvcrt
+import functools
+import socket
 import threading
-import subprocess
-import webbrowser
-from datetime import datetime
+import time
 
 from pynput import mouse, keyboard
-import pystray
-from PIL import Image, ImageDraw
 
 import config
 import db
-
-
-class InputTracker:
-    def __init__(self, session_type):
-        self.session_type = session_type
-        self.last_event_time = None
-        self.session_start = None
-        self.lock = threading.Lock()
-
-    def on_event(self):
-        with self.lock:
-            now = datetime.now()
-            self.last_event_time = now
-            if self.session_start is None:
-                self.session_start = now
-
-    def check_idle(self):
-        with self.lock:
-            if self.session_start and self.last_event_time:
-                idle = (datetime.now() - self.last_event_time).total_seconds()
-                if idle >= config.IDLE_THRESHOLD_SECONDS:
-                    db.save_session(self.session_start, self.last_event_time, self.session_type)
-                    self.session_start = None
-                    self.last_event_time = None
-
-    def flush(self):
-        with self.lock:
-            if self.session_start and self.last_event_time:
-                db.save_session(self.session_start, self.last_event_time, self.session_type)
-                self.session_start = None
-                self.last_event_time = None
+import metrics
+from activity_log import ActivityLog
+from idle import IdleScheduler
+from input_tracker import InputTracker
+from live import LivePublisher
 
 
 # Module-level references for cross-function access
@@ -51,26 +22,106 @@ _mouse_tracker = None
 _keyboard_tracker = None
 _mouse_listener = None
 _keyboard_listener = None
-_stop_event = threading.Event()
+_idle_scheduler = None
+_compaction_job = None
+_metrics_exporter = None
+_live_publisher = None
+_session_pusher = None
+_activity_log = None
+_dashboard_server = None
 _dashboard_process = None
+_icon = None
+# Previous samples of each stats() reader, for their own events-per-second
+_stats_window = {}
+_metrics_window = {}
 
 
-def create_tray_icon_image():
-    settings = config.load_settings()
+def get_tracker_stats():
+    return {
+        "mouse": _mouse_tracker.stats(_stats_window) if _mouse_tracker else None,
+        "keyboard": _keyboard_tracker.stats(_stats_window) if _keyboard_tracker else None,
+        "writer": db.get_writer_stats(),
+    }
+
+
+def _on_session_open():
+    _idle_scheduler.notify()
+    _live_publisher.poke()
+
+
+def _on_session_close(start_time, end_time, session_type):
+    db.save_session(start_time, end_time, session_type)
+    _live_publisher.poke()
+
+
+def _apply_settings(settings):
+    """Settings saved from the dashboard take effect without a restart."""
+    config.set_idle_threshold(settings["idle_threshold"])
+    # Open sessions get their deadline recomputed with the new threshold
+    _idle_scheduler.notify()
+    if _icon is not None:
+        _icon.icon = create_tray_icon_image(settings["color_mouse"], settings["color_keyboard"])
+
+
+def _input_metrics():
+    for tracker in (_mouse_tracker, _keyboard_tracker):
+        stats = tracker.stats(_metrics_window)
+        labels = {"type": tracker.session_type}
+        yield "nat_input_events_total", "counter", labels, stats["events"]
+        yield "nat_input_moves_coalesced_total", "counter", labels, stats["coalesced_moves"]
+        yield "nat_input_events_per_second", "gauge", labels, stats["events_per_second"]
+        yield "nat_input_overhead_ns", "gauge", labels, stats["avg_overhead_ns"]
+
+
+@functools.lru_cache(maxsize=4)
+def create_tray_icon_image(color_mouse, color_keyboard):
+    from PIL import Image, ImageDraw
+
     size = 64
     img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
-    draw.ellipse([4, 12, 30, 52], fill=settings["color_mouse"])
-    draw.ellipse([34, 12, 60, 52], fill=settings["color_keyboard"])
+    draw.ellipse([4, 12, 30, 52], fill=color_mouse)
+    draw.ellipse([34, 12, 60, 52], fill=color_keyboard)
     return img
 
 
+def _wait_for_port(host, port, timeout=10.0):
+    """Poll until something accepts connections on host:port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
 def open_dashboard():
-    global _dashboard_process
+    # Not needed until the dashboard is first opened
+    import subprocess
+    import webbrowser
+
+    global _dashboard_server, _dashboard_process
+    url = f"http://{config.DASHBOARD_HOST}:{config.DASHBOARD_PORT}"
+
+    if config.DASHBOARD_IN_PROCESS:
+        if _dashboard_server is None:
+            # Flask is only imported the first time the dashboard is opened
+            from dashboard import DashboardServer
+
+            _dashboard_server = DashboardServer()
+            _dashboard_server.start()
+        if not _dashboard_server.wait_ready():
+            # Port taken (e.g. a standalone dashboard is running): use that one,
+            # and try to bind again next time
+            _dashboard_server = None
+        webbrowser.open(url)
+        return
 
     # If dashboard is already running, just open the browser
     if _dashboard_process is not None and _dashboard_process.poll() is None:
-        webbrowser.open(f"http://{config.DASHBOARD_HOST}:{config.DASHBOARD_PORT}")
+        webbrowser.open(url)
         return
 
     # Launch dashboard as a background subprocess
@@ -84,18 +135,29 @@ def open_dashboard():
         creationflags=subprocess.CREATE_NO_WINDOW,
     )
 
-    # Give Flask time to start, then open browser
-    time.sleep(1.5)
-    webbrowser.open(f"http://{config.DASHBOARD_HOST}:{config.DASHBOARD_PORT}")
+    # Open the browser as soon as Flask accepts connections
+    _wait_for_port(config.DASHBOARD_HOST, config.DASHBOARD_PORT)
+    webbrowser.open(url)
 
 
 def on_exit(icon, item):
     _mouse_tracker.flush()
     _keyboard_tracker.flush()
+    if _activity_log is not None:
+        _activity_log.close()
+    db.stop_writer()
     _mouse_listener.stop()
     _keyboard_listener.stop()
-    _stop_event.set()
-
+    _idle_scheduler.stop()
+    _compaction_job.stop()
+    _live_publisher.stop()
+    if _metrics_exporter is not None:
+        _metrics_exporter.stop()
+    if _session_pusher is not None:
+        _session_pusher.stop()
+
+    if _dashboard_server is not None:
+        _dashboard_server.stop()
     global _dashboard_process
     if _dashboard_process is not None and _dashboard_process.poll() is None:
         _dashboard_process.terminate()
@@ -103,15 +165,10 @@ def on_exit(icon, item):
     icon.stop()
 
 
-def idle_check_loop():
-    while not _stop_event.is_set():
-        time.sleep(0.5)
-        _mouse_tracker.check_idle()
-        _keyboard_tracker.check_idle()
-
-
 def main():
-    global _mouse_tracker, _keyboard_tracker, _mouse_listener, _keyboard_listener
+    global _mouse_tracker, _keyboard_tracker, _mouse_listener, _keyboard_listener, _idle_scheduler
+    global _compaction_job, _metrics_exporter, _live_publisher, _session_pusher, _icon
+    global _activity_log
 
     # Prevent multiple instances via file lock
     os.makedirs(config.DATA_DIR, exist_ok=True)
@@ -122,17 +179,28 @@ def main():
     except (OSError, IOError):
         sys.exit(0)
 
-    db.init_db()
-
-    # Load saved settings
+    # Input capture starts first. Sessions only close through the idle
+    # scheduler, which is started once the database is ready, so events
+    # arriving meanwhile simply extend the open sessions.
     settings = config.load_settings()
     config.set_idle_threshold(settings["idle_threshold"])
 
-    _mouse_tracker = InputTracker("mouse")
-    _keyboard_tracker = InputTracker("keyboard")
+    if config.ACTIVITY_LOG_ENABLED:
+        _activity_log = ActivityLog()
+    _mouse_tracker = InputTracker(
+        "mouse", on_session_open=_on_session_open, on_session_close=_on_session_close,
+        activity_log=_activity_log,
+    )
+    _keyboard_tracker = InputTracker(
+        "keyboard", on_session_open=_on_session_open, on_session_close=_on_session_close,
+        activity_log=_activity_log,
+    )
+    _idle_scheduler = IdleScheduler([_mouse_tracker, _keyboard_tracker])
+    # Publishes the sessions in progress for the dashboard's live view
+    _live_publisher = LivePublisher([_mouse_tracker, _keyboard_tracker])
 
     _mouse_listener = mouse.Listener(
-        on_move=lambda x, y: _mouse_tracker.on_event(),
+        on_move=lambda x, y: _mouse_tracker.on_move(),
         on_click=lambda x, y, button, pressed: _mouse_tracker.on_event(),
         on_scroll=lambda x, y, dx, dy: _mouse_tracker.on_event(),
     )
@@ -144,18 +212,48 @@ def main():
     _mouse_listener.start()
     _keyboard_listener.start()
 
-    # Idle check in a daemon thread
-    threading.Thread(target=idle_check_loop, daemon=True).start()
+    db.init_db()
+    db.start_writer()
+
+    # Closes sessions at their idle deadline, sleeps while nothing is open
+    threading.Thread(target=_idle_scheduler.run, daemon=True).start()
+    _live_publisher.start()
+
+    # Picks up settings saved by the dashboard; one running in another process
+    # is only noticed by polling settings.json
+    config.on_settings_change(_apply_settings)
+    if not config.DASHBOARD_IN_PROCESS:
+        config.watch_settings()
+
+    # Coalesces old sessions in the background, one day at a time
+    from compaction import CompactionJob
+
+    _compaction_job = CompactionJob()
+    _compaction_job.start()
+
+    # Sends closed sessions to the collector machine, if there is one
+    if config.COLLECTOR_URL:
+        from collector import SessionPusher
+
+        _session_pusher = SessionPusher()
+        _session_pusher.start()
+
+    if metrics.ENABLED:
+        metrics.register_collector(_input_metrics)
+        _metrics_exporter = metrics.SnapshotExporter()
+        _metrics_exporter.start()
 
     # System tray icon
-    icon_image = create_tray_icon_image()
+    import pystray
+
+    icon_image = create_tray_icon_image(settings["color_mouse"], settings["color_keyboard"])
     menu = pystray.Menu(
         pystray.MenuItem("Open Dashboard", lambda: open_dashboard()),
         pystray.Menu.SEPARATOR,
         pystray.MenuItem("Exit", on_exit),
     )
 
-    icon = pystray.Icon(
+    _icon = pystray.Icon(
         name="NerdActivityTracker",
         icon=icon_image,
         title="Nerd Activity Tracker",
@@ -163,7 +261,7 @@ def main():
     )
 
     # Blocks until icon.stop() is called
-    icon.run()
+    _icon.run()
 
 
 if __name__ == "__main__":